@@ -1,8 +1,11 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from accounts.models import OutgoingEmail
+
 user_model = get_user_model()
 
 
@@ -55,3 +58,30 @@ class UserAdmin(BaseUserAdmin):
     ]
     readonly_fields = ['password', 'last_login', 'date_joined']
     search_fields = ['email', 'username']
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = [
+        'id', 'subject', 'to_email', 'status', 'attempts', 'created_at'
+    ]
+    list_filter = ['status']
+    list_per_page = 20
+    readonly_fields = [
+        'subject', 'body', 'html_body', 'from_email', 'to_email',
+        'dedupe_key', 'status', 'attempts', 'next_attempt_at', 'last_error',
+        'created_at', 'sent_at'
+    ]
+    search_fields = ['to_email']
+    actions = ['retry']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description='Retry now')
+    def retry(self, request, queryset):
+        queryset.exclude(status=OutgoingEmail.STATUS_SENT).update(
+            status=OutgoingEmail.STATUS_PENDING,
+            attempts=0,
+            next_attempt_at=timezone.now()
+        )
@@ -8,8 +8,10 @@ from django.contrib.auth.forms import (
     PasswordResetForm as BasePasswordResetForm,
     SetPasswordForm as BaseSetPasswordForm
 )
+from django.template import loader
 from django.utils.translation import gettext_lazy as _
 
+from accounts import outbox
 from core.forms import BootstrapyForm
 
 user_model = get_user_model()
@@ -62,7 +64,35 @@ class PasswordChangeForm(BasePasswordChangeForm, BootstrapyForm):
 
 
 class PasswordResetForm(BasePasswordResetForm, BootstrapyForm):
-    pass
+    def send_mail(
+        self,
+        subject_template_name,
+        email_template_name,
+        context,
+        from_email,
+        to_email,
+        html_email_template_name=None
+    ):
+        '''
+        Queue the email (once per dedupe window and user).
+        '''
+        subject = loader.render_to_string(subject_template_name, context)
+        # Email subject *must not* contain newlines
+        subject = ''.join(subject.splitlines())
+        body = loader.render_to_string(email_template_name, context)
+        html_body = ''
+        if html_email_template_name is not None:
+            html_body = loader.render_to_string(
+                html_email_template_name, context
+            )
+        outbox.enqueue(
+            subject,
+            body,
+            to_email,
+            html_body=html_body,
+            from_email=from_email,
+            dedupe_key=f'password-reset:{context["user"].pk}'
+        )
 
 
 class SetPasswordForm(BaseSetPasswordForm, BootstrapyForm):
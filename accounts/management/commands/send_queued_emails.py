@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts import outbox
+
+
+class Command(BaseCommand):
+    help = (
+        'Send the queued emails which are due, in batches over one mail '
+        'connection each; with --loop, keep sending as they are queued.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=settings.EMAIL_QUEUE_BATCH_SIZE
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Run as a worker, polling the queue.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=2,
+            help='Seconds between polls of an empty queue.'
+        )
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        purged_at = 0
+        while True:
+            if time.monotonic() - purged_at > 60 * 60:
+                outbox.purge()
+                purged_at = time.monotonic()
+            sent, failed = outbox.send_due(options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f'{sent} email(s) sent, {failed} failed.')
+            if sent + failed < options['batch_size']:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        self.stdout.write(
+            f'{total_sent} email(s) sent, {total_failed} failed in total.'
+        )
@@ -12,7 +12,8 @@ from guardian.mixins import GuardianUserMixin
 
 
 def user_media_directory(instance, filename):
-    return f'accounts/users/{instance.id}/{filename}'
+    # Named after their content by the storage (see `core.storage`)
+    return f'accounts/users/{filename}'
 
 
 class UserManager(BaseUserManager):
@@ -127,6 +128,10 @@ class User(AbstractBaseUser, PermissionsMixin, GuardianUserMixin):
 
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
+    # Fields whose loaded values are kept to detect changes of the names
+    # shown with posts (search index, widgets, cached pages)
+    TRACKED_FIELDS = ['username', 'first_name', 'last_name']
+
     class Meta:
         verbose_name = _('user')
         verbose_name_plural = _('users')
@@ -134,8 +139,93 @@ class User(AbstractBaseUser, PermissionsMixin, GuardianUserMixin):
     def __str__(self):
         return self.email
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        user._loaded_state = {
+            field: value
+            for field, value in zip(field_names, values)
+            if field in cls.TRACKED_FIELDS
+        }
+        return user
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_state = self.get_tracked_state()
+
+    def get_tracked_state(self):
+        return {
+            field: getattr(self, field)
+            for field in self.TRACKED_FIELDS
+            if field not in self.get_deferred_fields()
+        }
+
+    def get_changed_fields(self):
+        '''
+        Tracked fields changed since loaded from (or last saved to) the
+        database.
+        '''
+        previous_state = getattr(self, '_loaded_state', {})
+        return {
+            field
+            for field, value in self.get_tracked_state().items()
+            if previous_state.get(field) != value
+        }
+
     def get_full_name(self):
         return f'{self.first_name} {self.last_name}'
 
     def get_short_name(self):
         return self.first_name
+
+
+class OutgoingEmail(models.Model):
+    '''
+    An email queued by a request and sent by the `send_queued_emails`
+    worker (see `accounts.outbox`).
+    '''
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed')
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254)
+    to_email = models.EmailField()
+    # Emails with the same key are queued once per dedupe window
+    dedupe_key = models.CharField(max_length=255, blank=True)
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS,
+        default=STATUS_PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Emails due, for the worker
+            models.Index(
+                fields=['next_attempt_at'],
+                name='accounts_email_pending_idx',
+                condition=models.Q(status='pending')
+            ),
+            # Latest email of a dedupe key
+            models.Index(
+                fields=['dedupe_key', '-created_at'],
+                name='accounts_email_dedupe_idx',
+                condition=~models.Q(dedupe_key='')
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.subject} to {self.to_email} ({self.status})'
@@ -0,0 +1,178 @@
+'''
+Outbox of emails.
+
+Requests only queue emails (`enqueue()` inserts an `OutgoingEmail`), so
+a slow or unreachable mail relay never holds a worker. The
+`send_queued_emails` command sends the due ones in batches over one
+connection (`send_due()`), and retries failures with an exponential
+backoff until `EMAIL_QUEUE_MAX_ATTEMPTS`.
+
+Emails are claimed with `SKIP LOCKED` and leased for
+`EMAIL_QUEUE_LEASE` seconds, so several workers can run: an email is
+sent once unless its worker dies mid-batch, when it is retried after
+the lease.
+'''
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from accounts.models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(
+    subject,
+    body,
+    to_email,
+    html_body='',
+    from_email=None,
+    dedupe_key=''
+):
+    '''
+    Queue an email. Returns it, or None when an email with the same
+    `dedupe_key` was queued less than `EMAIL_QUEUE_DEDUPE_WINDOW` seconds
+    ago (e.g. repeated password reset requests).
+    '''
+    with transaction.atomic():
+        if dedupe_key:
+            # Serializes concurrent requests of a key until commit
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT pg_advisory_xact_lock(hashtext(%s))',
+                    [dedupe_key]
+                )
+            recent = timezone.now() - timedelta(
+                seconds=settings.EMAIL_QUEUE_DEDUPE_WINDOW
+            )
+            if OutgoingEmail.objects.filter(
+                dedupe_key=dedupe_key, created_at__gt=recent
+            ).exists():
+                return None
+        return OutgoingEmail.objects.create(
+            subject=subject,
+            body=body,
+            html_body=html_body,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            to_email=to_email,
+            dedupe_key=dedupe_key
+        )
+
+
+def claim(batch_size):
+    '''
+    Lease a batch of due emails to this worker, counting the attempt.
+    '''
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutgoingEmail.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                status=OutgoingEmail.STATUS_PENDING,
+                next_attempt_at__lte=now
+            )
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        OutgoingEmail.objects \
+            .filter(pk__in=[email.pk for email in emails]) \
+            .update(
+                attempts=F('attempts') + 1,
+                next_attempt_at=now + timedelta(
+                    seconds=settings.EMAIL_QUEUE_LEASE
+                )
+            )
+    for email in emails:
+        email.attempts += 1
+    return emails
+
+
+def build_message(email, mail_connection):
+    message = EmailMultiAlternatives(
+        email.subject,
+        email.body,
+        email.from_email,
+        [email.to_email],
+        connection=mail_connection
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def get_retry_delay(attempts):
+    return timedelta(
+        seconds=settings.EMAIL_QUEUE_RETRY_DELAY * 2 ** (attempts - 1)
+    )
+
+
+def send_due(batch_size=None, mail_connection=None):
+    '''
+    Send a batch of due emails over one connection (by default, of
+    `EMAIL_BACKEND`). Returns the numbers of emails sent and failed.
+    '''
+    emails = claim(batch_size or settings.EMAIL_QUEUE_BATCH_SIZE)
+    if not emails:
+        return 0, 0
+
+    mail_connection = mail_connection or get_connection()
+    sent = []
+    failed = []
+    try:
+        mail_connection.open()
+    except Exception as error:
+        failed = [(email, error) for email in emails]
+    else:
+        try:
+            for email in emails:
+                try:
+                    mail_connection.send_messages(
+                        [build_message(email, mail_connection)]
+                    )
+                except Exception as error:
+                    failed.append((email, error))
+                else:
+                    sent.append(email)
+        finally:
+            mail_connection.close()
+
+    now = timezone.now()
+    OutgoingEmail.objects \
+        .filter(pk__in=[email.pk for email in sent]) \
+        .update(status=OutgoingEmail.STATUS_SENT, sent_at=now)
+    for email, error in failed:
+        logger.warning(
+            'Email %s to %s failed (attempt %s): %r',
+            email.pk, email.to_email, email.attempts, error
+        )
+        if email.attempts >= settings.EMAIL_QUEUE_MAX_ATTEMPTS:
+            changes = {'status': OutgoingEmail.STATUS_FAILED}
+        else:
+            changes = {
+                'next_attempt_at': now + get_retry_delay(email.attempts)
+            }
+        OutgoingEmail.objects \
+            .filter(pk=email.pk) \
+            .update(last_error=repr(error), **changes)
+    return len(sent), len(failed)
+
+
+def purge():
+    '''
+    Delete the emails sent or given up on more than
+    `EMAIL_QUEUE_RETENTION` days ago.
+    '''
+    deleted, _ = OutgoingEmail.objects \
+        .exclude(status=OutgoingEmail.STATUS_PENDING) \
+        .filter(
+            created_at__lt=timezone.now() - timedelta(
+                days=settings.EMAIL_QUEUE_RETENTION
+            )
+        ) \
+        .delete()
+    return deleted
@@ -0,0 +1,222 @@
+import socketserver
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core import mail
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from accounts import outbox
+from accounts.models import OutgoingEmail
+from blog.dataset import POST_MANAGERS_GROUP
+from core.testing import QueryBudgetTestCase, create_user
+
+
+class AccountViewQueryBudgetTests(QueryBudgetTestCase):
+    def get_token_args(self, user):
+        return [
+            urlsafe_base64_encode(force_bytes(user.pk)),
+            default_token_generator.make_token(user)
+        ]
+
+    def test_register_user(self):
+        response = self.assertQueryBudget(
+            reverse('accounts:register-user'), 0
+        )
+        self.assertFalse(response.context['form'].is_bound)
+
+    def test_verify_account(self):
+        user = create_user(is_active=False)
+        response = self.assertQueryBudget(
+            reverse('accounts:verify-account', args=self.get_token_args(user)),
+            5,
+            status=302
+        )
+        self.assertEqual(response.url, reverse('accounts:login'))
+        user.refresh_from_db()
+        self.assertTrue(user.is_active)
+        self.assertTrue(user.groups.filter(name=POST_MANAGERS_GROUP).exists())
+
+    def test_login(self):
+        response = self.assertQueryBudget(reverse('accounts:login'), 0)
+        self.assertFalse(response.context['form'].is_bound)
+
+    def test_logout(self):
+        self.assertQueryBudget(
+            reverse('accounts:logout'),
+            4,
+            user=self.reader,
+            method='post',
+            status=302
+        )
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_reset_password(self):
+        response = self.assertQueryBudget(
+            reverse('accounts:reset-password'), 0
+        )
+        self.assertFalse(response.context['form'].is_bound)
+
+    def test_reset_password_confirm(self):
+        response = self.assertQueryBudget(
+            reverse(
+                'accounts:reset-password-confirm',
+                args=self.get_token_args(self.reader)
+            ),
+            5,
+            status=302
+        )
+        # The token is swapped for a session one
+        self.assertTrue(response.url.endswith('/set-password/'))
+
+    def test_change_password(self):
+        response = self.assertQueryBudget(
+            reverse('accounts:change-password'), 4, user=self.reader
+        )
+        self.assertEqual(response.context['form'].user, self.reader)
+
+    def test_user_update(self):
+        response = self.assertQueryBudget(
+            reverse('accounts:user-update'), 4, user=self.reader
+        )
+        self.assertEqual(response.context['form'].instance, self.reader)
+
+    def test_dashboard(self):
+        response = self.assertQueryBudget(
+            reverse('accounts:dashboard'), 4, user=self.reader
+        )
+        self.assertEqual(response.context['user'], self.reader)
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    '''
+    Just enough SMTP for `smtplib`: recipients at `bounce.example.com`
+    are refused.
+    '''
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost')
+        data = None
+        for line in self.rfile:
+            if data is not None:
+                if line.rstrip(b'\r\n') == b'.':
+                    self.server.messages.append(b''.join(data))
+                    data = None
+                    self.reply('250 Queued')
+                else:
+                    data.append(line)
+                continue
+            command = line[:4].upper()
+            if command == b'RCPT' and b'@bounce.example.com' in line:
+                self.reply('550 No such user')
+            elif command == b'DATA':
+                data = []
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+            elif command == b'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class OutboxTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        server = socketserver.ThreadingTCPServer(
+            ('127.0.0.1', 0), SMTPHandler
+        )
+        server.daemon_threads = True
+        server.connections = 0
+        server.messages = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.server = server
+
+    def get_connection(self):
+        return mail.get_connection(
+            'django.core.mail.backends.smtp.EmailBackend',
+            host='127.0.0.1',
+            port=self.server.server_address[1],
+            username='',
+            password='',
+            use_tls=False
+        )
+
+    def test_views_enqueue(self):
+        for _ in range(2):
+            response = self.client.post(
+                reverse('accounts:reset-password'),
+                {'email': self.reader.email}
+            )
+            self.assertEqual(response.status_code, 302)
+        self.client.post(reverse('accounts:register-user'), {
+            'email': 'new@example.com',
+            'username': 'new',
+            'first_name': 'New',
+            'last_name': 'User',
+            'password1': 'a-Long-password-1',
+            'password2': 'a-Long-password-1'
+        })
+
+        self.assertEqual(mail.outbox, [])
+        self.assertQuerySetEqual(
+            OutgoingEmail.objects.order_by('pk').values_list(
+                'to_email', flat=True
+            ),
+            [self.reader.email, 'new@example.com']
+        )
+
+    def test_send_due(self):
+        for to_email in [
+            'a@example.com',
+            'b@bounce.example.com',
+            'c@example.com'
+        ]:
+            outbox.enqueue('Subject', 'Body', to_email)
+
+        with self.assertLogs('accounts.outbox', 'WARNING'):
+            self.assertEqual(
+                outbox.send_due(mail_connection=self.get_connection()),
+                (2, 1)
+            )
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.messages), 2)
+        self.assertEqual(
+            OutgoingEmail.objects.filter(status=OutgoingEmail.STATUS_SENT)
+            .count(),
+            2
+        )
+
+        bounced = OutgoingEmail.objects.get(
+            status=OutgoingEmail.STATUS_PENDING
+        )
+        self.assertEqual(bounced.attempts, 1)
+        self.assertIn('No such user', bounced.last_error)
+        self.assertGreater(
+            bounced.next_attempt_at,
+            timezone.now() + timedelta(seconds=30)
+        )
+        # Not due yet
+        self.assertEqual(
+            outbox.send_due(mail_connection=self.get_connection()), (0, 0)
+        )
+
+        OutgoingEmail.objects.filter(pk=bounced.pk).update(
+            attempts=settings.EMAIL_QUEUE_MAX_ATTEMPTS - 1,
+            next_attempt_at=timezone.now()
+        )
+        with self.assertLogs('accounts.outbox', 'WARNING'):
+            self.assertEqual(
+                outbox.send_due(mail_connection=self.get_connection()),
+                (0, 1)
+            )
+        bounced.refresh_from_db()
+        self.assertEqual(bounced.status, OutgoingEmail.STATUS_FAILED)
@@ -18,7 +18,7 @@ from django.views.generic.base import TemplateView, RedirectView
 from django.views.generic.edit import FormView, UpdateView
 
 from accounts import forms
-from accounts.utilities import send_verification_email
+from accounts.utilities import queue_verification_email
 
 
 class RegisterUserView(SuccessMessageMixin, FormView):
@@ -43,7 +43,7 @@ class RegisterUserView(SuccessMessageMixin, FormView):
 
         email_subject = 'Account Verification'
         email_template = 'accounts/registration/verification_email.html'
-        send_verification_email(
+        queue_verification_email(
             self.request,
             user,
             email_subject,
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from django.db.models import Count
+from django.db.models import Count, F
 from django.urls import reverse
 from django.utils.html import format_html
 from django.utils.http import urlencode
@@ -8,7 +8,9 @@ from django.utils.translation import gettext_lazy as _
 from guardian.admin import GuardedModelAdmin
 from mptt.admin import MPTTModelAdmin
 
+from blog.comments import bump_version
 from blog.models import Category, Comment, Post, Tag
+from core import page_cache
 
 
 def pluralize_objects(objects_count):
@@ -17,6 +19,29 @@ def pluralize_objects(objects_count):
     return 's were'
 
 
+def set_posts_status(queryset, status):
+    '''
+    Save posts one by one so lifecycle signals (widgets, ...) are sent.
+    '''
+    posts = queryset.exclude(status=status)
+    for post in posts:
+        post.status = status
+        post.save(update_fields=['status', 'updated_at'])
+    return len(posts)
+
+
+def set_comments_status(queryset, status):
+    '''
+    Bulk update comments status and invalidate affected comment trees
+    and cached post pages.
+    '''
+    post_ids = list(queryset.values_list('post_id', flat=True).distinct())
+    updated_counts = queryset.update(status=status)
+    bump_version(*post_ids)
+    page_cache.purge(*[f'post:{post_id}' for post_id in post_ids])
+    return updated_counts
+
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ['id', 'title', 'posts_count']
@@ -28,10 +53,9 @@ class CategoryAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         return super().get_queryset(request) \
-            .prefetch_related('posts') \
-            .annotate(posts_count=Count('posts'))
+            .annotate(posts_count=F('stat__posts_count'))
 
-    @admin.display(description='#posts', ordering='posts_count')
+    @admin.display(description='#published posts', ordering='posts_count')
     def posts_count(self, category):
         url = (
             reverse('admin:blog_post_changelist')
@@ -41,7 +65,7 @@ class CategoryAdmin(admin.ModelAdmin):
         return format_html(
             '<a href="{url}">{posts_count}</a>',
             url=url,
-            posts_count=category.posts_count
+            posts_count=category.posts_count or 0
         )
 
 
@@ -58,7 +82,9 @@ class CommentAdmin(MPTTModelAdmin):
 
     @admin.action(description='Set as pending')
     def set_as_pending(self, request, queryset):
-        updated_counts = queryset.update(status=Comment.COMMENT_STATUS_PENDING)
+        updated_counts = set_comments_status(
+            queryset, Comment.COMMENT_STATUS_PENDING
+        )
         pluralized_comments = pluralize_objects(updated_counts)
 
         self.message_user(
@@ -68,7 +94,9 @@ class CommentAdmin(MPTTModelAdmin):
 
     @admin.action(description='Set as approved')
     def set_as_approved(self, request, queryset):
-        updated_counts = queryset.update(status=Comment.COMMENT_STATUS_APPROVED)
+        updated_counts = set_comments_status(
+            queryset, Comment.COMMENT_STATUS_APPROVED
+        )
         pluralized_comments = pluralize_objects(updated_counts)
 
         self.message_user(
@@ -78,7 +106,9 @@ class CommentAdmin(MPTTModelAdmin):
 
     @admin.action(description='Set as not approved')
     def set_as_not_approved(self, request, queryset):
-        updated_counts = queryset.update(status=Comment.COMMENT_STATUS_NOT_APPROVED)
+        updated_counts = set_comments_status(
+            queryset, Comment.COMMENT_STATUS_NOT_APPROVED
+        )
         pluralized_comments = pluralize_objects(updated_counts)
 
         self.message_user(
@@ -123,7 +153,9 @@ class PostAdmin(GuardedModelAdmin):
     
     @admin.action(description='Set as published')
     def set_as_published(self, request, queryset):
-        updated_counts = queryset.update(status=Post.POST_STATUS_PUBLISHED)
+        updated_counts = set_posts_status(
+            queryset, Post.POST_STATUS_PUBLISHED
+        )
         pluralized_posts = pluralize_objects(updated_counts)
 
         self.message_user(
@@ -133,7 +165,9 @@ class PostAdmin(GuardedModelAdmin):
 
     @admin.action(description='Set as draft')
     def set_as_draft(self, request, queryset):
-        updated_counts = queryset.update(status=Post.POST_STATUS_DRAFT)
+        updated_counts = set_posts_status(
+            queryset, Post.POST_STATUS_DRAFT
+        )
         pluralized_posts = pluralize_objects(updated_counts)
 
         self.message_user(
@@ -144,9 +178,23 @@ class PostAdmin(GuardedModelAdmin):
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
-    list_display = ['id', 'name']
+    list_display = ['id', 'name', 'posts_count', 'weight']
     list_display_links = ['id', 'name']
     list_per_page = 20
     prepopulated_fields = {'slug': ['name']}
     readonly_fields = ['created_at', 'updated_at']
     search_fields = ['name__istartswith']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            posts_count=F('stat__posts_count'),
+            weight=F('stat__weight')
+        )
+
+    @admin.display(description='#published posts', ordering='posts_count')
+    def posts_count(self, tag):
+        return tag.posts_count or 0
+
+    @admin.display(description='Cloud weight', ordering='weight')
+    def weight(self, tag):
+        return tag.weight or 0
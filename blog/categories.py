@@ -0,0 +1,83 @@
+import time
+
+from django.core.cache import cache
+
+from blog.models import Category
+
+VERSION_KEY = 'blog:categories-version'
+# Seconds a process trusts its categories before reading the shared
+# version again
+VERSION_CHECK_INTERVAL = 5
+# Seconds a process keeps its categories even if the version is the same
+# (e.g. after changes which sent no signal)
+MAX_AGE = 5 * 60
+
+# (version, categories, time built, time version checked) of this process
+_categories = None
+
+
+def get_version():
+    '''
+    Current version of the category list, shared by all processes.
+    '''
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+    # Other processes notice within VERSION_CHECK_INTERVAL, this one now
+    reset()
+
+
+def reset():
+    '''
+    Drop the categories of this process, e.g. between tests whose
+    categories were rolled back.
+    '''
+    global _categories
+    _categories = None
+
+
+def build_categories():
+    return [
+        {
+            'title': category.title,
+            'slug': category.slug,
+            'url': category.get_absolute_url()
+        }
+        for category in Category.objects.only('title', 'slug')
+    ]
+
+
+def get_categories():
+    '''
+    Categories for the navigation, as plain dicts kept in process memory
+    until the shared version changes, or for `MAX_AGE` seconds. The
+    version is read at most every `VERSION_CHECK_INTERVAL` seconds.
+    '''
+    global _categories
+
+    now = time.monotonic()
+    if _categories is not None:
+        cached_version, categories, built_at, checked_at = _categories
+        if now - built_at >= MAX_AGE:
+            pass
+        elif now - checked_at < VERSION_CHECK_INTERVAL:
+            return categories
+        elif get_version() == cached_version:
+            _categories = (cached_version, categories, built_at, now)
+            return categories
+
+    # The version is read before the rows, so a concurrent bump can only
+    # make this process rebuild once more
+    version = get_version()
+    categories = build_categories()
+    _categories = (version, categories, now, now)
+    return categories
@@ -0,0 +1,70 @@
+import time
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from blog.models import Comment
+from blog.utilities import on_commit_batch
+
+COMMENT_TREE_TIMEOUT = 60 * 60 * 24
+
+
+def version_key(post_id):
+    return f'blog:comment-tree-version:{post_id}'
+
+
+def get_version(post_id):
+    '''
+    Current comment tree version of a post: the time (ns) comments last
+    changed, or were first read since the version key was (re)created,
+    so a version key that was evicted never restarts at a number an older
+    fragment is still cached under.
+    '''
+    key = version_key(post_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def set_versions(post_ids):
+    cache.set_many(
+        {version_key(post_id): time.time_ns() for post_id in post_ids},
+        timeout=None
+    )
+
+
+def bump_version(*post_ids):
+    '''
+    Bump the comment tree versions of posts once the current transaction
+    commits: a tree rendered before from the previous comments can only
+    be cached under the previous version.
+    '''
+    on_commit_batch(set_versions, post_ids)
+
+
+def get_comment_tree(post):
+    '''
+    Return the approved comment tree of a post rendered as HTML.
+
+    The fragment is shared by every viewer; per-viewer parts are applied
+    by the page (see `comment_tree.html`).
+    '''
+    key = f'blog:comment-tree:{post.pk}:{get_version(post.pk)}'
+    comment_tree = cache.get(key)
+    if comment_tree is None:
+        comments = list(
+            post.comments
+            .filter(status=Comment.COMMENT_STATUS_APPROVED)
+            .select_related('user')
+        )
+        comment_tree = {
+            'html': render_to_string(
+                'blog/includes/comment_tree.html',
+                {'comments': comments}
+            ),
+            'count': len(comments)
+        }
+        cache.set(key, comment_tree, timeout=COMMENT_TREE_TIMEOUT)
+    return comment_tree
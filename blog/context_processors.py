@@ -1,7 +1,11 @@
-from blog.models import Category
+from django.utils.functional import SimpleLazyObject
+
+from blog.categories import get_categories
+from core import page_cache
 
 
 def get_category_list(request):
-    categories = Category.objects.all()
-    context = {'categories': categories}
-    return context
+    # Cached pages all render the navigation
+    page_cache.add_tags(request, 'categories')
+    # Only evaluated by templates which render the navigation
+    return {'categories': SimpleLazyObject(get_categories)}
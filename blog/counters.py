@@ -0,0 +1,374 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Process running the flusher thread (forked workers start their own)
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+class BufferedCounter:
+    '''
+    Coalesce increments of a `Post` counter column in process memory.
+
+    Hits are summed per post and periodically spilled as aggregated rows
+    into `PostCounterDelta` (insert-only, so hot posts never contend on
+    their `blog_post` row). `apply()` then folds every spilled delta into
+    the counter column with a single `UPDATE ... SET col = col + n`
+    statement which leaves `updated_at` untouched. Counters never go
+    below zero: an unlike whose like was lost in a crash would otherwise
+    fail the column's check, and every later apply along with it.
+
+    With `author_field`, applied deltas are also added to that column of
+    the posts' authors `AuthorStat`, and with `hourly_buckets` to the
+    `PostViewBucket` of each post for the hour they were spilled in
+    (trending posts), in the same statement. Hits are counted in the hour
+    of their spill, at most about two flush intervals after them.
+
+    Hits spill once `BLOG_COUNTER_MAX_PENDING` are pending, or on the
+    first hit `BLOG_COUNTER_FLUSH_INTERVAL` seconds after the last spill;
+    the counts a quiet process holds longer are spilled by its flusher
+    thread (`start_flusher()`), which also applies the spilled deltas
+    every `BLOG_COUNTER_APPLY_INTERVAL` seconds, off the request path.
+    That bounds what a crashed worker can lose to about two intervals;
+    graceful shutdowns flush. Counts whose spill failed are kept for the
+    next one.
+
+    Displayed counts add the spilled deltas not applied yet
+    (`annotate_unapplied()`) and the hits pending in this process
+    (`get_count()`), so they don't drop between a spill and an apply.
+    '''
+    def __init__(self, field, author_field=None, hourly_buckets=False):
+        self.field = field
+        self.author_field = author_field
+        self.hourly_buckets = hourly_buckets
+        self._pending = Counter()
+        self._pending_hits = 0
+        self._lock = threading.Lock()
+        self._last_spill = time.monotonic()
+        self._last_apply = time.monotonic()
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'BLOG_COUNTER_FLUSH_INTERVAL', 10)
+
+    @property
+    def apply_interval(self):
+        return getattr(settings, 'BLOG_COUNTER_APPLY_INTERVAL', 60)
+
+    @property
+    def max_pending(self):
+        return getattr(settings, 'BLOG_COUNTER_MAX_PENDING', 1000)
+
+    def incr(self, post_pk, amount=1):
+        with self._lock:
+            self._pending[post_pk] += amount
+            self._pending_hits += 1
+            spill = (
+                time.monotonic() - self._last_spill >= self.flush_interval
+                or self._pending_hits >= self.max_pending
+            )
+        start_flusher()
+        if spill:
+            self.try_spill()
+
+    def pending(self, post_pk):
+        '''
+        Return the not yet spilled delta of a post in this process.
+        '''
+        with self._lock:
+            return self._pending.get(post_pk, 0)
+
+    @property
+    def unapplied_name(self):
+        return f'unapplied_{self.field}'
+
+    def annotate_unapplied(self, queryset):
+        '''
+        Annotate posts with their spilled deltas which are not applied
+        yet, in the query of the posts.
+        '''
+        from blog.models import PostCounterDelta
+
+        deltas = PostCounterDelta.objects \
+            .filter(post=OuterRef('pk'), field=self.field) \
+            .values('post') \
+            .annotate(total=Sum('delta')) \
+            .values('total')
+        return queryset.annotate(**{
+            self.unapplied_name: Coalesce(Subquery(deltas), 0)
+        })
+
+    def get_count(self, post):
+        '''
+        Counter of a post as displayed: applied, spilled (if annotated)
+        and pending in this process.
+        '''
+        return max(
+            getattr(post, self.field)
+            + getattr(post, self.unapplied_name, 0)
+            + self.pending(post.pk),
+            0
+        )
+
+    def is_idle(self):
+        '''
+        Whether counts were left pending for a whole flush interval.
+        '''
+        with self._lock:
+            return bool(self._pending) and (
+                time.monotonic() - self._last_spill >= self.flush_interval
+            )
+
+    def is_apply_due(self):
+        with self._lock:
+            return (
+                time.monotonic() - self._last_apply >= self.apply_interval
+            )
+
+    def reset(self):
+        '''
+        Drop the pending deltas of this process, e.g. between tests whose
+        posts were rolled back.
+        '''
+        with self._lock:
+            self._pending = Counter()
+            self._pending_hits = 0
+            self._last_spill = time.monotonic()
+
+    def flush(self, force_apply=False):
+        '''
+        Spill pending deltas to the database and, when the apply interval
+        has elapsed, fold the spilled deltas into the counter column.
+
+        Returns the `{post_pk: delta}` applied to the counter column.
+        '''
+        self.spill_pending()
+        with self._lock:
+            apply = force_apply or (
+                time.monotonic() - self._last_apply >= self.apply_interval
+            )
+            if apply:
+                self._last_apply = time.monotonic()
+        if apply:
+            return self.apply()
+        return {}
+
+    def spill_pending(self):
+        '''
+        Spill the pending deltas of this process, keeping them for the
+        next spill if it fails.
+        '''
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._pending_hits = 0
+            self._last_spill = time.monotonic()
+
+        if pending:
+            try:
+                self.spill(pending)
+            except Exception:
+                with self._lock:
+                    self._pending.update(pending)
+                raise
+
+    def try_spill(self):
+        '''
+        Spill, logging errors rather than raising them into the request
+        which happened to trigger it.
+        '''
+        try:
+            self.spill_pending()
+        except Exception:
+            logger.exception('Spilling %s counts failed.', self.field)
+
+    def try_flush(self):
+        '''
+        Flush, logging errors rather than raising them into the thread
+        which happened to trigger it.
+        '''
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Flushing %s counts failed.', self.field)
+
+    def spill(self, pending):
+        from blog.models import PostCounterDelta
+
+        spilled_at = timezone.now()
+        # A savepoint when nested: a failure doesn't break the caller's
+        # transaction
+        with transaction.atomic():
+            PostCounterDelta.objects.bulk_create([
+                PostCounterDelta(
+                    post_id=post_pk,
+                    field=self.field,
+                    delta=delta,
+                    spilled_at=spilled_at
+                )
+                for post_pk, delta in pending.items()
+                if delta
+            ])
+
+    def apply(self):
+        '''
+        Move every spilled delta of this counter into `blog_post`.
+
+        Returns the aggregated `{post_pk: delta}` that was applied.
+        '''
+        from blog.models import (
+            AuthorStat,
+            Post,
+            PostCounterDelta,
+            PostViewBucket
+        )
+
+        post_table = Post._meta.db_table
+        delta_table = PostCounterDelta._meta.db_table
+        column = connection.ops.quote_name(
+            Post._meta.get_field(self.field).column
+        )
+        authors_sql = ''
+        if self.author_field:
+            author_table = AuthorStat._meta.db_table
+            author_column = connection.ops.quote_name(
+                AuthorStat._meta.get_field(self.author_field).column
+            )
+            # New rows need every (not null) counter
+            values = {
+                connection.ops.quote_name(field.column): '0'
+                for field in AuthorStat._meta.concrete_fields
+                if not (field.primary_key or field.null)
+            }
+            values[author_column] = 'SUM(delta)'
+            columns = ', '.join(values)
+            selected = ', '.join(values.values())
+            authors_sql = f'''
+                , authors AS (
+                    INSERT INTO {author_table} (user_id, {columns})
+                    SELECT user_id, {selected}
+                    FROM updated
+                    GROUP BY user_id
+                    ORDER BY user_id
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET {author_column} =
+                        {author_table}.{author_column}
+                        + EXCLUDED.{author_column}
+                )
+            '''
+        buckets_sql = ''
+        if self.hourly_buckets:
+            bucket_table = PostViewBucket._meta.db_table
+            buckets_sql = f'''
+                , buckets AS (
+                    INSERT INTO {bucket_table} (post_id, hour, views)
+                    SELECT
+                        moved.post_id,
+                        date_trunc('hour', moved.spilled_at),
+                        SUM(moved.delta)
+                    FROM moved
+                    JOIN updated ON updated.id = moved.post_id
+                    GROUP BY 1, 2
+                    ORDER BY 1, 2
+                    ON CONFLICT (post_id, hour) DO UPDATE
+                    SET views = {bucket_table}.views + EXCLUDED.views
+                )
+            '''
+        sql = f'''
+            WITH moved AS (
+                DELETE FROM {delta_table}
+                WHERE field = %s
+                RETURNING post_id, delta, spilled_at
+            ), totals AS (
+                SELECT post_id, SUM(delta) AS delta
+                FROM moved
+                GROUP BY post_id
+            ), updated AS (
+                UPDATE {post_table} AS post
+                SET {column} = GREATEST(post.{column} + totals.delta, 0)
+                FROM totals
+                WHERE post.id = totals.post_id
+                RETURNING post.id, post.user_id, totals.delta
+            ){authors_sql}{buckets_sql}
+            SELECT id, delta FROM updated
+        '''
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, [self.field])
+            return dict(cursor.fetchall())
+
+
+post_views = BufferedCounter(
+    'views', author_field='views_count', hourly_buckets=True
+)
+
+post_likes = BufferedCounter('likes_count')
+
+COUNTERS = [post_views, post_likes]
+
+
+def flush_due():
+    '''
+    Spill the counts left pending for a flush interval (no hit came to
+    spill them) and apply the spilled deltas every apply interval.
+    '''
+    for counter in COUNTERS:
+        if counter.is_idle() or counter.is_apply_due():
+            counter.try_flush()
+
+
+def run_flusher():
+    from blog import search
+
+    while True:
+        time.sleep(getattr(settings, 'BLOG_COUNTER_FLUSH_INTERVAL', 10))
+        try:
+            flush_due()
+            # Merging search segments is left to this thread too, rather
+            # than to the requests saving posts
+            try:
+                search.compact()
+            except Exception:
+                logger.exception('Compacting the search index failed.')
+        finally:
+            connections.close_all()
+
+
+def start_flusher():
+    '''
+    Start the flusher thread of this process (idle counts, applies,
+    search index compaction), unless it runs or
+    `BLOG_COUNTER_FLUSH_THREAD` is off (`manage.py flush_post_counters`
+    and `compact_search_index` then have to run periodically).
+    '''
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    if not getattr(settings, 'BLOG_COUNTER_FLUSH_THREAD', True):
+        return
+    with _flusher_lock:
+        if _flusher_pid != os.getpid():
+            threading.Thread(
+                target=run_flusher, name='counter-flusher', daemon=True
+            ).start()
+            _flusher_pid = os.getpid()
+
+
+@atexit.register
+def flush_counters():
+    for counter in COUNTERS:
+        try:
+            counter.flush()
+        except Exception:
+            # Never block interpreter shutdown on an unreachable database.
+            pass
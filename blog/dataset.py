@@ -0,0 +1,504 @@
+'''
+Synthetic blog datasets for load and query plan testing.
+
+`DatasetGenerator` loads users (authors in the post managers group and
+readers), categories, tags, posts with their tags and object
+permissions, comment threads and bookmarks, skewed like real data:
+authors, categories, tags and commenters follow Zipf distributions and
+a few posts get most comments. Small tables are created with
+`bulk_create()`, large ones are streamed with Postgres `COPY`, comment
+trees included (their MPTT fields are computed here rather than by
+inserting comments one by one). The same seed and options generate the
+same rows.
+'''
+import itertools
+import random
+from array import array
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+
+from blog.models import (
+    Category,
+    Comment,
+    Post,
+    PostUserObjectPermission,
+    Tag
+)
+
+POST_MANAGERS_GROUP = 'Blog - Post Managers'
+POST_MANAGERS_PERMISSIONS = [
+    'add_post', 'change_post', 'delete_post', 'view_post'
+]
+
+WORDS = '''
+    python django postgres query index cache page template view model
+    field form test deploy server request response database migration
+    performance latency memory thread process async queue worker signal
+    search ranking token user author post comment tag category bookmark
+    release version upgrade bug fix feature design pattern review code
+    style guide tutorial tips tricks guide debugging profiling benchmark
+    scale load traffic network storage image static media security login
+    session cookie permission group admin api json html css javascript
+    simple fast slow better modern common practical complete quick deep
+'''.split()
+FIRST_NAMES = '''
+    Ada Alan Barbara Claude Dennis Edsger Frances Grace Guido Hedy Ken
+    Linus Margaret Niklaus Radia Rob Shafi Tim Yukihiro Donald
+'''.split()
+LAST_NAMES = '''
+    Lovelace Turing Liskov Shannon Ritchie Dijkstra Allen Hopper Rossum
+    Lamarr Thompson Torvalds Hamilton Wirth Perlman Pike Goldwasser
+    Berners-Lee Matsumoto Knuth
+'''.split()
+
+# Share of posts in each state, the rest are published and active
+DRAFT_RATIO = 0.10
+DELETED_RATIO = 0.03
+COMMENT_STATUS_WEIGHTS = [
+    (Comment.COMMENT_STATUS_APPROVED, 0.85),
+    (Comment.COMMENT_STATUS_PENDING, 0.10),
+    (Comment.COMMENT_STATUS_NOT_APPROVED, 0.05)
+]
+MAX_TAGS_PER_POST = 5
+MAX_COMMENTS_PER_POST = 500
+MAX_COMMENT_DEPTH = 8
+COMMENT_REPLY_RATIO = 0.45
+PARAGRAPHS_POOL_SIZE = 1000
+
+
+def get_zipf_weights(count, exponent):
+    '''
+    Cumulative weights of ranks 1..count, for `Random.choices()`.
+    '''
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)
+    ))
+
+
+def reserve_ids(model, count):
+    '''
+    Take `count` consecutive ids from the sequence of a table, so rows
+    can be copied with their primary keys. Returns the first one.
+    '''
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            '''
+            SELECT setval(
+                pg_get_serial_sequence(%s, 'id'),
+                nextval(pg_get_serial_sequence(%s, 'id')) + %s - 1
+            )
+            ''',
+            [table, table, count]
+        )
+        return cursor.fetchone()[0] - count + 1
+
+
+def copy_rows(model_or_table, columns, rows):
+    '''
+    Stream rows into a table with COPY. Returns the number of rows.
+    '''
+    table = getattr(model_or_table, '_meta', None)
+    table = table.db_table if table else model_or_table
+    count = 0
+    with connection.cursor() as cursor:
+        with cursor.copy(
+            f'COPY {table} ({", ".join(columns)}) FROM STDIN'
+        ) as copy:
+            for row in rows:
+                copy.write_row(row)
+                count += 1
+    return count
+
+
+class DatasetGenerator:
+    '''
+    Generate a dataset of `posts` posts. Sizes of the other tables
+    default to ratios of it.
+    '''
+    def __init__(
+        self,
+        posts,
+        until,
+        authors=None,
+        readers=None,
+        categories=12,
+        tags=None,
+        comments_per_post=3,
+        bookmarks_per_reader=5,
+        years=3,
+        prefix='gen',
+        seed=0,
+        password='password',
+        chunk_size=10000,
+        log=None
+    ):
+        self.posts_count = posts
+        self.authors_count = authors or max(5, posts // 500)
+        self.readers_count = readers or max(20, posts // 50)
+        self.categories_count = categories
+        self.tags_count = tags or min(2000, max(20, posts // 500))
+        self.comments_per_post = comments_per_post
+        self.bookmarks_per_reader = bookmarks_per_reader
+        self.until = until
+        self.started_at = until - timedelta(days=365 * years)
+        self.prefix = prefix
+        self.password = password
+        self.chunk_size = chunk_size
+        self.log = log or (lambda message: None)
+        self.random = random.Random(seed)
+        self.counts = {}
+
+        self.authors = []
+        self.readers = []
+        self.categories = []
+        self.tags = []
+        # Public posts, for bookmarks: ids and creation timestamps
+        self.public_post_ids = array('q')
+        self.public_post_times = array('d')
+
+    def exists(self):
+        return (
+            get_user_model().objects
+            .filter(username__startswith=f'{self.prefix}-').exists()
+            or Post.objects.filter(slug__startswith=f'{self.prefix}-').exists()
+        )
+
+    def generate(self):
+        '''
+        Load the dataset; call it in a transaction. Returns the number of
+        rows created per table.
+        '''
+        self.paragraphs = [
+            self.make_text(self.random.randint(40, 90)).capitalize() + '.'
+            for _ in range(PARAGRAPHS_POOL_SIZE)
+        ]
+        self.create_users()
+        self.create_categories()
+        self.create_tags()
+        self.copy_posts()
+        self.copy_bookmarks()
+        return self.counts
+
+    def make_text(self, words):
+        return ' '.join(self.random.choices(WORDS, k=words))
+
+    def random_time(self, start, end):
+        return start + (end - start) * self.random.random()
+
+    def create_users(self):
+        User = get_user_model()
+        password = make_password(self.password)
+        group, created = Group.objects.get_or_create(name=POST_MANAGERS_GROUP)
+        if created:
+            group.permissions.set(Permission.objects.filter(
+                content_type=ContentType.objects.get_for_model(Post),
+                codename__in=POST_MANAGERS_PERMISSIONS
+            ))
+
+        for role, count in [
+            ('author', self.authors_count),
+            ('reader', self.readers_count)
+        ]:
+            users = []
+            for number in range(count):
+                username = f'{self.prefix}-{role}-{number}'
+                users.append(User(
+                    email=f'{username}@example.com',
+                    username=username,
+                    first_name=self.random.choice(FIRST_NAMES),
+                    last_name=self.random.choice(LAST_NAMES),
+                    password=password,
+                    date_joined=self.random_time(
+                        self.started_at - timedelta(days=30),
+                        self.started_at
+                    )
+                ))
+            setattr(
+                self, f'{role}s',
+                User.objects.bulk_create(users, batch_size=self.chunk_size)
+            )
+            self.counts[f'{role}s'] = count
+
+        User.groups.through.objects.bulk_create(
+            [
+                User.groups.through(user_id=author.pk, group_id=group.pk)
+                for author in self.authors
+            ],
+            batch_size=self.chunk_size
+        )
+        self.log(
+            f'{self.authors_count} authors, {self.readers_count} readers'
+        )
+
+    def create_categories(self):
+        self.categories = Category.objects.bulk_create([
+            Category(
+                title=f'{self.prefix.title()} {word.title()}',
+                slug=f'{self.prefix}-{word}-{number}',
+                description=self.make_text(12).capitalize()
+            )
+            for number, word in enumerate(
+                self.random.sample(WORDS, self.categories_count)
+            )
+        ])
+        self.counts['categories'] = len(self.categories)
+
+    def create_tags(self):
+        self.tags = Tag.objects.bulk_create(
+            [
+                Tag(
+                    name=f'{self.prefix} {word} {number}',
+                    slug=f'{self.prefix}-{word}-{number}'
+                )
+                for number, word in enumerate(
+                    self.random.choices(WORDS, k=self.tags_count)
+                )
+            ],
+            batch_size=self.chunk_size
+        )
+        self.counts['tags'] = len(self.tags)
+        self.log(f'{len(self.categories)} categories, {len(self.tags)} tags')
+
+    def copy_posts(self):
+        '''
+        Copy posts chunk by chunk along with their tags, the change
+        permission of their author and their comments.
+        '''
+        author_weights = get_zipf_weights(len(self.authors), 1.0)
+        category_weights = get_zipf_weights(len(self.categories), 0.8)
+        tag_weights = get_zipf_weights(len(self.tags), 1.1)
+        permission_id = Permission.objects.get(
+            content_type=ContentType.objects.get_for_model(Post),
+            codename='olp_blog_change_post'
+        ).pk
+        span = (self.until - self.started_at) / self.posts_count
+        for name in ['posts', 'post_tags', 'post_permissions', 'comments']:
+            self.counts[name] = 0
+
+        for start in range(0, self.posts_count, self.chunk_size):
+            size = min(self.chunk_size, self.posts_count - start)
+            first_id = reserve_ids(Post, size)
+            authors = self.random.choices(
+                self.authors, cum_weights=author_weights, k=size
+            )
+            categories = self.random.choices(
+                self.categories, cum_weights=category_weights, k=size
+            )
+            posts = []
+            post_tags = []
+            for offset in range(size):
+                number = start + offset
+                post_id = first_id + offset
+                # Newer posts have higher ids
+                created_at = self.started_at + span * (
+                    number + self.random.random()
+                )
+                state = self.random.random()
+                status = Post.POST_STATUS_PUBLISHED
+                is_active = state >= DRAFT_RATIO + DELETED_RATIO
+                if state < DRAFT_RATIO:
+                    status = Post.POST_STATUS_DRAFT
+                    is_active = True
+                public = status == Post.POST_STATUS_PUBLISHED and is_active
+                views = int(
+                    (self.random.paretovariate(1.2) - 1) * 50
+                ) if public else 0
+                posts.append((
+                    post_id,
+                    self.make_text(self.random.randint(3, 8)).capitalize(),
+                    f'{self.prefix}-post-{number}',
+                    '\n\n'.join(self.random.choices(
+                        self.paragraphs, k=self.random.randint(2, 6)
+                    )),
+                    'blog/posts/default.png',
+                    min(views, 2 ** 31 - 1),
+                    status,
+                    is_active,
+                    created_at,
+                    min(
+                        self.until,
+                        created_at + timedelta(
+                            days=self.random.expovariate(1 / 10)
+                        )
+                    ),
+                    authors[offset].pk,
+                    categories[offset].pk
+                ))
+                tags = set(self.random.choices(
+                    self.tags,
+                    cum_weights=tag_weights,
+                    k=self.random.randint(0, MAX_TAGS_PER_POST)
+                ))
+                post_tags += [(post_id, tag.pk) for tag in tags]
+                if public:
+                    self.public_post_ids.append(post_id)
+                    self.public_post_times.append(created_at.timestamp())
+
+            self.counts['posts'] += copy_rows(Post, [
+                'id', 'title', 'slug', 'content', 'image', 'views', 'status',
+                'is_active', 'created_at', 'updated_at', 'user_id',
+                'category_id'
+            ], posts)
+            self.counts['post_tags'] += copy_rows(
+                Post.tags.through, ['post_id', 'tag_id'], post_tags
+            )
+            self.counts['post_permissions'] += copy_rows(
+                PostUserObjectPermission,
+                ['permission_id', 'user_id', 'content_object_id'],
+                ((permission_id, row[10], row[0]) for row in posts)
+            )
+            self.copy_comments(
+                (row[0], row[8]) for row in posts if row[6:8] == (
+                    Post.POST_STATUS_PUBLISHED, True
+                )
+            )
+            self.log(f'{start + size}/{self.posts_count} posts')
+
+    def make_thread(self, post_created_at):
+        '''
+        Comments of a post as `[created_at, parent_index, depth]`, oldest
+        first: a few posts get most comments and replies nest a few
+        levels deep.
+        '''
+        count = min(
+            MAX_COMMENTS_PER_POST,
+            int(
+                (self.random.paretovariate(1.6) - 1)
+                * self.comments_per_post * 0.6
+            )
+        )
+        comments = []
+        created_at = post_created_at
+        for _ in range(count):
+            created_at += timedelta(hours=self.random.expovariate(1 / 12))
+            if created_at > self.until:
+                break
+            parent = None
+            depth = 0
+            if comments and self.random.random() < COMMENT_REPLY_RATIO:
+                # Recent comments get most replies
+                parent = len(comments) - 1 - min(
+                    len(comments) - 1, int(self.random.expovariate(1 / 3))
+                )
+                while comments[parent][2] >= MAX_COMMENT_DEPTH:
+                    parent = comments[parent][1]
+                depth = comments[parent][2] + 1
+            comments.append([created_at, parent, depth])
+        return comments
+
+    def copy_comments(self, posts):
+        '''
+        Copy the comment threads of `(post_id, created_at)` posts, with
+        their MPTT fields: every root comment is a tree, the roots of a
+        post and the replies of a comment are ordered newest first
+        (`order_insertion_by = ['-created_at']`).
+        '''
+        threads = [
+            (post_id, self.make_thread(created_at))
+            for post_id, created_at in posts
+        ]
+        total = sum(len(comments) for _, comments in threads)
+        if not total:
+            return
+        user_weights = get_zipf_weights(len(self.readers), 1.0)
+        users = iter(self.random.choices(
+            self.readers, cum_weights=user_weights, k=total
+        ))
+        statuses, status_weights = zip(*COMMENT_STATUS_WEIGHTS)
+        statuses = iter(self.random.choices(
+            statuses, weights=status_weights, k=total
+        ))
+        first_id = reserve_ids(Comment, total)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COALESCE(MAX(tree_id), 0) '
+                f'FROM {Comment._meta.db_table}'
+            )
+            tree_id = cursor.fetchone()[0]
+
+        rows = []
+        next_id = first_id
+        for post_id, comments in threads:
+            ids = range(next_id, next_id + len(comments))
+            next_id += len(comments)
+            children = {None: []}
+            for index, (_, parent, _) in enumerate(comments):
+                children.setdefault(parent, []).append(index)
+                children[index] = []
+            for roots_index in reversed(children[None]):
+                tree_id += 1
+                # Iterative depth-first walk numbering lft/rght
+                position = 1
+                lefts = {}
+                stack = [(roots_index, False)]
+                while stack:
+                    index, visited = stack.pop()
+                    if visited:
+                        created_at, parent, depth = comments[index]
+                        rows.append((
+                            ids[index],
+                            self.make_text(self.random.randint(5, 40)),
+                            next(statuses),
+                            created_at,
+                            created_at,
+                            post_id,
+                            next(users).pk,
+                            None if parent is None else ids[parent],
+                            lefts[index],
+                            position,
+                            tree_id,
+                            depth
+                        ))
+                        position += 1
+                        continue
+                    lefts[index] = position
+                    position += 1
+                    stack.append((index, True))
+                    # Newest reply first: pushed last
+                    stack += [(child, False) for child in children[index]]
+
+        self.counts['comments'] += copy_rows(Comment, [
+            'id', 'content', 'status', 'created_at', 'updated_at', 'post_id',
+            'user_id', 'parent_id', 'lft', 'rght', 'tree_id', 'level'
+        ], rows)
+
+    def copy_bookmarks(self):
+        '''
+        Bookmarks of public posts by readers, a few readers bookmarking
+        most. Posts are distinct per reader, so no pair is duplicated.
+        '''
+        count = len(self.public_post_ids)
+        until = self.until.timestamp()
+        self.counts['bookmarks'] = 0
+        if not count:
+            return
+
+        def iter_bookmarks():
+            for reader in self.readers:
+                size = min(count, int(
+                    (self.random.paretovariate(1.6) - 1)
+                    * self.bookmarks_per_reader * 0.6
+                ))
+                for index in self.random.sample(range(count), size):
+                    created_at = self.public_post_times[index]
+                    yield (
+                        reader.pk,
+                        self.public_post_ids[index],
+                        self.until - timedelta(
+                            seconds=(until - created_at)
+                            * self.random.random()
+                        )
+                    )
+
+        self.counts['bookmarks'] = copy_rows(
+            Post.bookmarks.through,
+            ['user_id', 'post_id', 'created_at'],
+            iter_bookmarks()
+        )
+        self.log(f'{self.counts["bookmarks"]} bookmarks')
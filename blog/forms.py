@@ -1,4 +1,5 @@
 from django import forms
+from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 
 from mptt.forms import TreeNodeChoiceField
@@ -26,3 +27,18 @@ class PostForm(forms.ModelForm, BootstrapyForm):
     class Meta:
         model = Post
         fields = ['category', 'title', 'content', 'image', 'status', 'tags']
+
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        # Set on new uploads by ImageField, which read the image header
+        uploaded = getattr(image, 'image', None)
+        if (
+            uploaded is not None
+            and uploaded.width * uploaded.height
+            > settings.BLOG_IMAGE_MAX_PIXELS
+        ):
+            raise forms.ValidationError(
+                _('Images must be under %(pixels)s megapixels.'),
+                params={'pixels': settings.BLOG_IMAGE_MAX_PIXELS // 10 ** 6}
+            )
+        return image
@@ -0,0 +1,254 @@
+'''
+Variants of post images: card and detail widths, twice as wide for
+high density screens, in WebP (AVIF when Pillow supports it) and the
+source's format, plus a tiny blurred placeholder.
+
+Variants are rendered by `blog.imaging` in a process pool once a post
+with a new image is committed (see `blog.signals`), off the request
+thread. Their paths and sizes are stored in `Post.image_variants`,
+which the `post_image` template tag turns into `<picture>` sources.
+Posts sharing an image (e.g. the default one) share its variants.
+'''
+import base64
+import functools
+import logging
+import posixpath
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+
+from blog import imaging
+from blog.models import Post
+from core import page_cache
+
+logger = logging.getLogger(__name__)
+
+# Widths of the images rendered for each use: 1x and 2x
+VARIANT_WIDTHS = {
+    'card': [480, 960],
+    'detail': [900, 1800]
+}
+# Rendered width of each use, for the browser to pick a width
+SIZES = {
+    'card': '(min-width: 1400px) 416px, (min-width: 768px) 50vw, 100vw',
+    'detail': '(min-width: 1400px) 966px, (min-width: 768px) 75vw, 100vw'
+}
+VARIANTS_DIRECTORY = 'blog/posts/variants'
+MIME_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png'
+}
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.BLOG_IMAGE_WORKERS
+        )
+    return _executor
+
+
+def get_widths():
+    return sorted({
+        width for widths in VARIANT_WIDTHS.values() for width in widths
+    })
+
+
+def get_variant_name(source_name, width, extension):
+    # Stored under the hash of their content (see `core.storage`)
+    stem = posixpath.splitext(posixpath.basename(source_name))[0]
+    return posixpath.join(
+        VARIANTS_DIRECTORY, f'{stem}-{width}w.{extension}'
+    )
+
+
+def save_variants(source_name, rendered):
+    '''
+    Store rendered variants next to their source and return the
+    `Post.image_variants` data describing them.
+    '''
+    width, height, placeholder, files = rendered
+    # A list keeps formats in order of preference (jsonb sorts keys)
+    stored = []
+    for extension, images in files.items():
+        names = []
+        for variant_width, content in sorted(images.items()):
+            name = default_storage.save(
+                get_variant_name(source_name, variant_width, extension),
+                ContentFile(content)
+            )
+            names.append([variant_width, name])
+        stored.append([extension, names])
+    return {
+        'source': source_name,
+        'width': width,
+        'height': height,
+        'placeholder': 'data:image/webp;base64,'
+        + base64.b64encode(placeholder).decode(),
+        'files': stored
+    }
+
+
+def set_variants(source_name, variants, post_pks=None):
+    '''
+    Attach variants to the posts (by default, all of them) whose image
+    is still `source_name`, and purge their cached pages.
+    '''
+    posts = Post.objects.filter(image=source_name)
+    if post_pks is not None:
+        posts = posts.filter(pk__in=post_pks)
+    post_pks = list(posts.values_list('pk', flat=True))
+    # Bump updated_at so conditional GETs get the new markup
+    Post.objects.filter(pk__in=post_pks, image=source_name).update(
+        image_variants=variants,
+        updated_at=timezone.now()
+    )
+    page_cache.purge(*[f'post:{pk}' for pk in post_pks])
+
+
+def get_existing_variants(source_name):
+    return Post.objects \
+        .filter(image=source_name, image_variants__source=source_name) \
+        .values_list('image_variants', flat=True) \
+        .first()
+
+
+def move_image(source_name, name, move):
+    '''
+    Point the posts of an image moved from `source_name` to `name`, their
+    variants moved with `move(name, new_name)` (which returns the name
+    they were stored under).
+    '''
+    variants = get_existing_variants(name)
+    if variants is None:
+        variants = get_existing_variants(source_name)
+    if variants is not None and variants['source'] == source_name:
+        moved = []
+        for extension, files in variants['files']:
+            moved.append([extension, [
+                [width, move(file, posixpath.join(
+                    VARIANTS_DIRECTORY, posixpath.basename(file)
+                ))]
+                for width, file in files
+            ]])
+        variants = {**variants, 'source': name, 'files': moved}
+    Post.objects.filter(image=source_name).update(image=name)
+    set_variants(name, variants or {})
+
+
+def render_variants(source_name):
+    '''
+    Render an image in the pool (in the current thread without workers,
+    e.g. in tests); returns a future of the `blog.imaging.render()`
+    result.
+    '''
+    with default_storage.open(source_name, 'rb') as source:
+        args = (source.read(), get_widths(), settings.BLOG_IMAGE_MAX_PIXELS)
+    if settings.BLOG_IMAGE_WORKERS:
+        return get_executor().submit(imaging.render, *args)
+    future = Future()
+    try:
+        future.set_result(imaging.render(*args))
+    except Exception as error:
+        future.set_exception(error)
+    return future
+
+
+def build_variants(source_name):
+    '''
+    Render and store the variants of an image, waiting for them.
+    '''
+    rendered = render_variants(source_name).result()
+    return save_variants(source_name, rendered)
+
+
+def store_variants(source_name, post_pk, future):
+    try:
+        variants = save_variants(source_name, future.result())
+        set_variants(source_name, variants, post_pks=[post_pk])
+    except Exception:
+        logger.exception('Variants of %s failed.', source_name)
+
+
+def variants_rendered(source_name, post_pk, future):
+    # Runs in a thread of the pool, with its own database connection
+    try:
+        store_variants(source_name, post_pk, future)
+    finally:
+        connections.close_all()
+
+
+def update_variants(post_pk, source_name):
+    '''
+    Attach the variants of a post image, rendering them in the pool
+    unless another post already has them.
+    '''
+    variants = get_existing_variants(source_name)
+    if variants is not None:
+        set_variants(source_name, variants, post_pks=[post_pk])
+        return
+    try:
+        future = render_variants(source_name)
+    except Exception:
+        logger.exception('Variants of %s failed.', source_name)
+        return
+    if settings.BLOG_IMAGE_WORKERS:
+        future.add_done_callback(
+            functools.partial(variants_rendered, source_name, post_pk)
+        )
+    else:
+        store_variants(source_name, post_pk, future)
+
+
+def schedule_variants(post):
+    '''
+    Update the variants of a post image once the current transaction
+    commits.
+    '''
+    transaction.on_commit(
+        functools.partial(update_variants, post.pk, post.image.name)
+    )
+
+
+def get_picture(variants, use):
+    '''
+    `<picture>` data of an image's variants for a use (`card`,
+    `detail`), None if they weren't rendered.
+    '''
+    if not variants or not variants.get('files'):
+        return None
+    widths = {
+        min(width, variants['width']) for width in VARIANT_WIDTHS[use]
+    }
+    sources = []
+    for extension, files in variants['files']:
+        urls = [
+            (width, default_storage.url(name))
+            for width, name in files
+            if width in widths
+        ]
+        sources.append((
+            MIME_TYPES[extension],
+            ', '.join(f'{url} {width}w' for width, url in urls),
+            urls[0][1]
+        ))
+    # The last format is the fallback of the <img> itself
+    *sources, (_, srcset, src) = sources
+    return {
+        'sources': [source[:2] for source in sources],
+        'sizes': SIZES[use],
+        'srcset': srcset,
+        'src': src,
+        'width': variants['width'],
+        'height': variants['height'],
+        'placeholder': variants['placeholder']
+    }
@@ -0,0 +1,90 @@
+'''
+Rendering of post image variants with Pillow.
+
+This module doesn't use Django, so `render()` can run in worker
+processes of any start method (see `blog.images`).
+'''
+import io
+
+from PIL import Image, ImageFilter, ImageOps, features
+
+# Pillow format and save options per file extension
+ENCODERS = {
+    'avif': ('AVIF', {'quality': 55}),
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', {'optimize': True})
+}
+PLACEHOLDER_WIDTH = 16
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def get_extensions(image):
+    '''
+    Extensions of the variants, most efficient first; the last one is
+    the fallback every browser supports, lossless for lossless sources.
+    '''
+    lossless = has_alpha(image) or image.format in ('PNG', 'GIF')
+    extensions = ['webp', 'png' if lossless else 'jpeg']
+    if features.check('avif'):
+        extensions.insert(0, 'avif')
+    return extensions
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+
+
+def encode(image, extension):
+    output = io.BytesIO()
+    image_format, options = ENCODERS[extension]
+    image.save(output, image_format, **options)
+    return output.getvalue()
+
+
+def render(source, widths, max_pixels):
+    '''
+    Resize image bytes to `widths` (never upscaled) in every variant
+    format. Returns `(width, height, placeholder, files)`, `files` being
+    `{extension: {width: bytes}}` and `placeholder` a tiny blurred WebP.
+
+    Images over `max_pixels` are refused from their header, before
+    anything is decoded.
+    '''
+    image = Image.open(io.BytesIO(source))
+    if image.width * image.height > max_pixels:
+        raise ImageTooLarge(
+            f'{image.width}x{image.height} image is over {max_pixels} pixels.'
+        )
+    extensions = get_extensions(image)
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('RGBA' if has_alpha(image) else 'RGB')
+    width, height = image.size
+
+    files = {extension: {} for extension in extensions}
+    # Largest first, each resized from the previous one
+    resized = image
+    targets = sorted({min(width, target) for target in widths}, reverse=True)
+    for target in targets:
+        resized = resized.resize(
+            (target, max(1, round(height * target / width))),
+            Image.LANCZOS
+        )
+        for extension in extensions:
+            files[extension][target] = encode(resized, extension)
+
+    placeholder = resized.resize(
+        (
+            PLACEHOLDER_WIDTH,
+            max(1, round(height * PLACEHOLDER_WIDTH / width))
+        ),
+        Image.BILINEAR
+    ).filter(ImageFilter.GaussianBlur(1))
+    placeholder_bytes = io.BytesIO()
+    placeholder.save(placeholder_bytes, 'WEBP', quality=30)
+    return width, height, placeholder_bytes.getvalue(), files
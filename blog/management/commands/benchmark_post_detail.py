@@ -0,0 +1,72 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import F
+from django.test import Client
+
+from blog.counters import post_views
+from blog.models import Post
+
+
+def legacy_incr(post_pk, amount=1):
+    '''
+    The former per-hit `F('views') + 1` save and re-read of the post row.
+    '''
+    post = Post.objects.get(pk=post_pk)
+    post.views = F('views') + amount
+    post.save()
+    post.refresh_from_db()
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure post detail page throughput on one hot slug with the '
+        'legacy per-hit view update and with the buffered view counter.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('slug')
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=8)
+
+    def handle(self, *args, **options):
+        post = Post.published.filter(slug=options['slug']).first()
+        if post is None:
+            raise CommandError('No published post with that slug.')
+
+        url = post.get_absolute_url()
+        for label, incr in [
+            ('legacy', legacy_incr),
+            ('buffered', post_views.incr)
+        ]:
+            with mock.patch.object(post_views, 'incr', incr):
+                elapsed = self.run(
+                    url, options['requests'], options['concurrency']
+                )
+            post_views.flush(force_apply=True)
+            self.stdout.write(
+                f'{label:>8}: {options["requests"]} requests in '
+                f'{elapsed:.2f}s ({options["requests"] / elapsed:.1f} req/s)'
+            )
+
+    def run(self, url, requests, concurrency):
+        def worker(count):
+            # Bypass debug toolbar (INTERNAL_IPS) and ALLOWED_HOSTS checks.
+            client = Client(SERVER_NAME='localhost', REMOTE_ADDR='10.0.0.1')
+            try:
+                for _ in range(count):
+                    response = client.get(url)
+                    assert response.status_code == 200
+            finally:
+                connections.close_all()
+
+        share, rest = divmod(requests, concurrency)
+        counts = [share + (i < rest) for i in range(concurrency)]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(worker, counts))
+        return time.perf_counter() - started
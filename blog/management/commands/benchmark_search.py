@@ -0,0 +1,56 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from blog.models import Post
+from blog.search import search
+
+PAGE_SIZE = 9
+
+
+def legacy_search(query):
+    '''
+    The former `icontains` search over posts and their relations.
+    '''
+    return Post.published.filter(
+        Q(category__title__icontains=query) |
+        Q(title__icontains=query) |
+        Q(user__first_name__icontains=query) |
+        Q(user__last_name__icontains=query) |
+        Q(tags__name__icontains=query),
+        is_active=True,
+        status=Post.POST_STATUS_PUBLISHED
+    ).distinct()
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the first search results page (count + 9 posts) with the '
+        'legacy icontains query and with the search index.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', default=[
+            'python', 'post number', 'django tips', 'numb'
+        ])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        for query in options['queries']:
+            for label, run in [
+                ('legacy', legacy_search),
+                ('indexed', search)
+            ]:
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    results = run(query)
+                    count = results.count()
+                    list(results[:PAGE_SIZE])
+                    timings.append(time.perf_counter() - started)
+                self.stdout.write(
+                    f'{query!r:>16} {label:>8}: {count:>7} result(s), '
+                    f'median {statistics.median(timings) * 1000:.1f}ms'
+                )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from blog import search
+
+
+class Command(BaseCommand):
+    help = 'Merge the segments of the search index written by updates.'
+
+    def handle(self, *args, **options):
+        merges = search.compact()
+        if merges is None:
+            self.stdout.write('Another process is compacting the index.')
+        else:
+            self.stdout.write(f'{merges} merge(s).')
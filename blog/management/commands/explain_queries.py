@@ -0,0 +1,219 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from blog.models import Category, Post, Tag
+
+SEED_SLUG_PREFIX = 'explain-post-'
+
+
+def seed_posts(count):
+    '''
+    Insert `count` posts skewed like real data: a few categories, authors
+    and tags hold most posts, 10% are drafts and 3% are deleted.
+    '''
+    post_table = Post._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            INSERT INTO {post_table} (
+                title, slug, content, image, views, status, is_active,
+                created_at, updated_at, user_id, category_id
+            )
+            SELECT
+                'Explain post ' || n,
+                %s || n,
+                repeat('Lorem ipsum dolor sit amet. ', 40),
+                'blog/posts/default.png',
+                floor(random() * 1000),
+                CASE WHEN random() < 0.9 THEN %s ELSE %s END,
+                random() < 0.97,
+                now() - random() * interval '3 years',
+                now(),
+                users[
+                    1 + floor(power(random(), 2) * cardinality(users))::int
+                ],
+                categories[
+                    1 + floor(
+                        power(random(), 2) * cardinality(categories)
+                    )::int
+                ]
+            FROM generate_series(1, %s) AS n,
+                (
+                    SELECT array_agg(id)
+                    FROM {get_user_model()._meta.db_table}
+                    WHERE username <> ''
+                ) AS user_ids(users),
+                (SELECT array_agg(id) FROM {Category._meta.db_table})
+                    AS category_ids(categories)
+        ''', [
+            SEED_SLUG_PREFIX,
+            Post.POST_STATUS_PUBLISHED,
+            Post.POST_STATUS_DRAFT,
+            count
+        ])
+        cursor.execute(f'''
+            INSERT INTO {Post.tags.through._meta.db_table} (post_id, tag_id)
+            SELECT DISTINCT
+                post.id,
+                tags[1 + floor(power(random(), 3) * cardinality(tags))::int]
+            FROM {post_table} AS post,
+                generate_series(1, 3),
+                (SELECT array_agg(id) FROM {Tag._meta.db_table})
+                    AS tag_ids(tags)
+            WHERE post.slug LIKE %s
+        ''', [f'{SEED_SLUG_PREFIX}%'])
+        cursor.execute(f'ANALYZE {post_table}')
+        cursor.execute(f'ANALYZE {Post.tags.through._meta.db_table}')
+
+
+def get_cases():
+    '''
+    Anonymous pages of the public views, on their most selective
+    category, tag and author (the ones most likely to scan).
+    '''
+    public = Q(posts__status=Post.POST_STATUS_PUBLISHED, posts__is_active=True)
+    category = Category.objects \
+        .annotate(count=Count('posts', filter=public)) \
+        .filter(count__gt=0).order_by('count').first()
+    tag = Tag.objects \
+        .annotate(count=Count('posts', filter=public)) \
+        .filter(count__gt=0).order_by('count').first()
+    author = get_user_model().objects \
+        .exclude(username='') \
+        .annotate(count=Count('posts', filter=public)) \
+        .filter(count__gt=0).order_by('count').first()
+    post = Post.published.order_by('-created_at').first()
+    return [
+        ('index', '/'),
+        ('post detail', post.get_absolute_url()),
+        ('category posts', category.get_absolute_url()),
+        ('tag posts', reverse('blog:tag-post-list', args=[tag.slug])),
+        (
+            'author posts',
+            reverse('blog:user-post-list', args=[author.username])
+        ),
+        (
+            'filtered posts',
+            reverse('blog:search-post-list') + f'?category={category.slug}'
+        )
+    ]
+
+
+def capture_queries(url):
+    '''
+    SELECT statements and params run while rendering `url`.
+    '''
+    queries = []
+
+    def capture(execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith('SELECT'):
+            queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+    # Bypass debug toolbar (INTERNAL_IPS) and the anonymous page cache
+    client = Client(SERVER_NAME='localhost', REMOTE_ADDR='10.0.0.1')
+    with override_settings(PAGE_CACHE_VIEWS=[]):
+        with connection.execute_wrapper(capture):
+            response = client.get(url)
+    if response.status_code != 200:
+        raise CommandError(f'{url} returned {response.status_code}.')
+    return queries
+
+
+def iter_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from iter_nodes(child)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run EXPLAIN ANALYZE on the queries of the public views and fail '
+        'when a plan scans a large table sequentially or exceeds a cost '
+        'budget. Seeded posts are rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts', type=int, default=100000,
+            help='Seed posts up to this count before explaining.'
+        )
+        parser.add_argument(
+            '--max-cost', type=float, default=5000,
+            help='Highest total cost allowed for a query plan.'
+        )
+        parser.add_argument(
+            '--min-seq-scan-rows', type=int, default=10000,
+            help='Tables from this many rows must not be scanned.'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            missing = options['posts'] - Post.objects.count()
+            if missing > 0:
+                if not (
+                    get_user_model().objects.exclude(username='').exists()
+                    and Category.objects.exists()
+                    and Tag.objects.exists()
+                ):
+                    raise CommandError(
+                        'Seeding needs at least a user, a category and a tag.'
+                    )
+                self.stdout.write(f'Seeding {missing} posts...')
+                seed_posts(missing)
+
+            failures = []
+            for name, url in get_cases():
+                for sql, params in capture_queries(url):
+                    failures += self.explain(name, sql, params, options)
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(
+                f'{len(failures)} plan regression(s):\n' + '\n'.join(failures)
+            )
+        self.stdout.write('All plans within budget.')
+
+    def explain(self, name, sql, params, options):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (ANALYZE, FORMAT JSON) {sql}', params)
+            explained = cursor.fetchone()[0]
+        if isinstance(explained, str):
+            explained = json.loads(explained)
+        plan = explained[0]['Plan']
+
+        failures = []
+        for node in iter_nodes(plan):
+            if node['Node Type'] != 'Seq Scan':
+                continue
+            rows = self.get_table_rows(node['Relation Name'])
+            if rows >= options['min_seq_scan_rows']:
+                failures.append(
+                    f'{name}: sequential scan of {node["Relation Name"]} '
+                    f'({rows} rows) in {sql[:120]}'
+                )
+        if plan['Total Cost'] > options['max_cost']:
+            failures.append(
+                f'{name}: cost {plan["Total Cost"]:.0f} over '
+                f'{options["max_cost"]:.0f} in {sql[:120]}'
+            )
+
+        self.stdout.write(
+            f'{name:>15}  cost {plan["Total Cost"]:>9.1f}  '
+            f'{plan["Actual Total Time"]:>8.3f}ms  {sql[:70]}'
+        )
+        return failures
+
+    def get_table_rows(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [table]
+            )
+            return cursor.fetchone()[0]
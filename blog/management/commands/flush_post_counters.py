@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from blog.counters import COUNTERS
+
+
+class Command(BaseCommand):
+    help = 'Apply buffered post counter deltas (views, ...) to posts.'
+
+    def handle(self, *args, **options):
+        for counter in COUNTERS:
+            applied = counter.flush(force_apply=True)
+            self.stdout.write(
+                f'{counter.field}: {sum(applied.values())} hit(s) '
+                f'applied to {len(applied)} post(s).'
+            )
@@ -0,0 +1,116 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from blog import sampling, search, stats, widgets
+from blog.dataset import WORDS, DatasetGenerator
+from blog.models import Comment, Post
+from core import page_cache
+
+
+def parse_until(value):
+    try:
+        date = datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise CommandError(f'Invalid --until date {value!r} (YYYY-MM-DD).')
+    return date.replace(tzinfo=dt_timezone.utc)
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a synthetic dataset of users, categories, tags, posts, '
+        'comment threads and bookmarks, reproducible from a seed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts', type=int, default=1000,
+            help='Number of posts (1k to 10M).'
+        )
+        parser.add_argument(
+            '--authors', type=int,
+            help='Number of post managers (default: posts / 500).'
+        )
+        parser.add_argument(
+            '--readers', type=int,
+            help='Number of commenting users (default: posts / 50).'
+        )
+        parser.add_argument('--categories', type=int, default=12)
+        parser.add_argument(
+            '--tags', type=int,
+            help='Number of tags (default: posts / 500, up to 2000).'
+        )
+        parser.add_argument('--comments-per-post', type=float, default=3)
+        parser.add_argument('--bookmarks-per-reader', type=float, default=5)
+        parser.add_argument(
+            '--years', type=int, default=3,
+            help='Posts are spread over this many years.'
+        )
+        parser.add_argument(
+            '--until',
+            default=timezone.now().strftime('%Y-%m-%d'),
+            help='Date of the newest rows (default: today). Set it to '
+            'generate the same rows on another day.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix', default='gen',
+            help='Prefix of generated usernames and slugs; use another '
+            'one to add a second dataset.'
+        )
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument(
+            '--skip-search-index', action='store_true',
+            help='Do not rebuild the search index afterwards.'
+        )
+
+    def handle(self, *args, **options):
+        if options['categories'] > len(WORDS):
+            raise CommandError(
+                f'At most {len(WORDS)} categories can be generated.'
+            )
+        generator = DatasetGenerator(
+            posts=options['posts'],
+            until=parse_until(options['until']),
+            authors=options['authors'],
+            readers=options['readers'],
+            categories=options['categories'],
+            tags=options['tags'],
+            comments_per_post=options['comments_per_post'],
+            bookmarks_per_reader=options['bookmarks_per_reader'],
+            years=options['years'],
+            prefix=options['prefix'],
+            seed=options['seed'],
+            chunk_size=options['chunk_size'],
+            log=self.stdout.write
+        )
+        if generator.exists():
+            raise CommandError(
+                f'A dataset with prefix {options["prefix"]!r} exists, '
+                'choose another --prefix.'
+            )
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            counts = generator.generate()
+            # Rows were copied without signals: recount what they maintain
+            stats.repair()
+            stats.repair_authors()
+            sampling.tags.invalidate()
+            page_cache.purge('posts', 'categories')
+        widgets.refresh_many([widgets.TOP_AUTHORS, widgets.TOP_TAGS])
+        with connection.cursor() as cursor:
+            for model in [Post, Post.tags.through, Comment]:
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+        loaded = time.perf_counter() - started
+        self.stdout.write(', '.join(
+            f'{count} {name}' for name, count in counts.items()
+        ) + f' loaded in {loaded:.1f}s.')
+
+        if not options['skip_search_index']:
+            self.stdout.write('Rebuilding the search index...')
+            indexed = search.rebuild()
+            self.stdout.write(f'{indexed} post(s) indexed.')
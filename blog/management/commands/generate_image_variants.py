@@ -0,0 +1,52 @@
+from concurrent.futures import as_completed
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from blog import images
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Render the variants of post images which have none (or stale '
+        'ones), each image once however many posts share it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Render the variants of every image again.'
+        )
+
+    def handle(self, *args, **options):
+        names = Post.objects \
+            .exclude(image='') \
+            .order_by() \
+            .values_list('image', flat=True) \
+            .distinct()
+        if not options['force']:
+            names = [
+                name for name in names
+                if Post.objects.filter(image=name).filter(
+                    Q(image_variants__source__isnull=True)
+                    | ~Q(image_variants__source=name)
+                ).exists()
+            ]
+
+        futures = {}
+        for name in names:
+            try:
+                futures[images.render_variants(name)] = name
+            except OSError as error:
+                self.stderr.write(f'{name}: {error}')
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                variants = images.save_variants(name, future.result())
+            except Exception as error:
+                self.stderr.write(f'{name}: {error}')
+                continue
+            images.set_variants(name, variants)
+            self.stdout.write(f'{name}: variants rendered.')
+        self.stdout.write(f'{len(futures)} image(s) processed.')
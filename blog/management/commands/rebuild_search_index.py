@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from blog import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of public posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        count = search.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(f'{count} post(s) indexed.')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog import trending
+
+
+class Command(BaseCommand):
+    help = 'Recompute the trending posts ranking from hourly view buckets.'
+
+    def handle(self, *args, **options):
+        data = trending.refresh()
+        self.stdout.write(f'{len(data)} trending post(s).')
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from blog import stats, widgets
+
+
+class Command(BaseCommand):
+    help = 'Recompute posts, views and last published date of authors.'
+
+    def handle(self, *args, **options):
+        stats.repair_authors()
+        widgets.refresh_many([widgets.TOP_AUTHORS])
+        self.stdout.write('Author stats recomputed.')
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from blog import stats, widgets
+
+
+class Command(BaseCommand):
+    help = 'Recompute published posts counts of tags and categories.'
+
+    def handle(self, *args, **options):
+        stats.repair()
+        widgets.refresh_many([widgets.TOP_TAGS])
+        self.stdout.write('Tag and category stats recomputed.')
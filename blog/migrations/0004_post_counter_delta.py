@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 01:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_alter_tag_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostCounterDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=50)),
+                ('delta', models.IntegerField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_deltas', to='blog.post')),
+            ],
+        ),
+    ]
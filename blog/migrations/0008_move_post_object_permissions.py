@@ -0,0 +1,82 @@
+from django.db import migrations
+
+
+def get_post_content_type(apps):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    return ContentType.objects.filter(app_label='blog', model='post').first()
+
+
+def move_to_direct_permissions(apps, schema_editor):
+    '''
+    Move generic guardian rows of posts into the direct FK tables.
+    '''
+    content_type = get_post_content_type(apps)
+    if content_type is None:
+        return
+
+    post_table = apps.get_model('blog', 'Post')._meta.db_table
+    for generic_name, direct_name, owner_column in [
+        ('UserObjectPermission', 'PostUserObjectPermission', 'user_id'),
+        ('GroupObjectPermission', 'PostGroupObjectPermission', 'group_id'),
+    ]:
+        generic_table = apps.get_model('guardian', generic_name)._meta.db_table
+        direct_table = apps.get_model('blog', direct_name)._meta.db_table
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                INSERT INTO {direct_table}
+                    ({owner_column}, permission_id, content_object_id)
+                SELECT perm.{owner_column}, perm.permission_id, post.id
+                FROM {generic_table} AS perm
+                JOIN {post_table} AS post
+                    ON post.id::text = perm.object_pk
+                WHERE perm.content_type_id = %s
+                ON CONFLICT DO NOTHING
+                ''',
+                [content_type.id]
+            )
+            cursor.execute(
+                f'DELETE FROM {generic_table} WHERE content_type_id = %s',
+                [content_type.id]
+            )
+
+
+def move_to_generic_permissions(apps, schema_editor):
+    content_type = get_post_content_type(apps)
+    if content_type is None:
+        return
+
+    for generic_name, direct_name, owner_column in [
+        ('UserObjectPermission', 'PostUserObjectPermission', 'user_id'),
+        ('GroupObjectPermission', 'PostGroupObjectPermission', 'group_id'),
+    ]:
+        generic_table = apps.get_model('guardian', generic_name)._meta.db_table
+        direct_table = apps.get_model('blog', direct_name)._meta.db_table
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                INSERT INTO {generic_table}
+                    ({owner_column}, permission_id, content_type_id, object_pk)
+                SELECT {owner_column}, permission_id, %s, content_object_id
+                FROM {direct_table}
+                ON CONFLICT DO NOTHING
+                ''',
+                [content_type.id]
+            )
+            cursor.execute(f'DELETE FROM {direct_table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('guardian', '0002_generic_permissions_index'),
+        ('blog', '0007_post_object_permissions'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            move_to_direct_permissions,
+            move_to_generic_permissions
+        ),
+    ]
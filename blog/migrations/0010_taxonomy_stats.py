@@ -0,0 +1,70 @@
+# Generated by Django 4.2.30 on 2026-10-18 01:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_taxonomy_stats(apps, schema_editor):
+    '''
+    Count published posts of existing tags and categories.
+    '''
+    Post = apps.get_model('blog', 'Post')
+    post_table = Post._meta.db_table
+    post_tag_table = Post.tags.through._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            INSERT INTO blog_tagstat (tag_id, posts_count, weight)
+            SELECT tag.id, COUNT(post.id),
+                LEAST(10, FLOOR(LOG(2, COUNT(post.id) + 1)))::smallint
+            FROM blog_tag AS tag
+            LEFT JOIN {post_tag_table} AS post_tag
+                ON post_tag.tag_id = tag.id
+            LEFT JOIN {post_table} AS post
+                ON post.id = post_tag.post_id
+                AND post.status = 'published' AND post.is_active
+            GROUP BY tag.id
+            '''
+        )
+        cursor.execute(
+            f'''
+            INSERT INTO blog_categorystat (category_id, posts_count)
+            SELECT category.id, COUNT(post.id)
+            FROM blog_category AS category
+            LEFT JOIN {post_table} AS post
+                ON post.category_id = category.id
+                AND post.status = 'published' AND post.is_active
+            GROUP BY category.id
+            '''
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_post_created_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStat',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stat', serialize=False, to='blog.category')),
+                ('posts_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TagStat',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stat', serialize=False, to='blog.tag')),
+                ('posts_count', models.IntegerField(default=0)),
+                ('weight', models.PositiveSmallIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-posts_count'], name='blog_tagstat_posts_count_idx')],
+            },
+        ),
+        migrations.RunPython(
+            fill_taxonomy_stats, migrations.RunPython.noop
+        ),
+    ]
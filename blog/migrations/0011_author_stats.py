@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-18 01:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_author_stats(apps, schema_editor):
+    '''
+    Count posts and views of existing authors.
+    '''
+    post_table = apps.get_model('blog', 'Post')._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            INSERT INTO blog_authorstat
+                (user_id, posts_count, views_count, last_published_at)
+            SELECT
+                user_id,
+                COUNT(*) FILTER (WHERE status = 'published' AND is_active),
+                SUM(views),
+                MAX(created_at)
+                    FILTER (WHERE status = 'published' AND is_active)
+            FROM {post_table}
+            GROUP BY user_id
+            '''
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_bio_user_image'),
+        ('blog', '0010_taxonomy_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStat',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='author_stat', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.IntegerField(default=0)),
+                ('views_count', models.BigIntegerField(default=0)),
+                ('last_published_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-posts_count', 'user'], name='blog_authorstat_leaders_idx')],
+            },
+        ),
+        migrations.RunPython(
+            fill_author_stats, migrations.RunPython.noop
+        ),
+    ]
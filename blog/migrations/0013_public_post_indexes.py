@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_post_view_buckets'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True), ('status', 'published')), fields=['created_at', 'id'], name='blog_post_public_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True), ('status', 'published')), fields=['category', 'created_at', 'id'], name='blog_post_public_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('is_active', True), ('status', 'published')), fields=['user', 'created_at', 'id'], name='blog_post_public_user_idx'),
+        ),
+    ]
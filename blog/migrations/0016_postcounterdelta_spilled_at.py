@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:38
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0015_like'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postcounterdelta',
+            name='spilled_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
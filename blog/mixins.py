@@ -0,0 +1,195 @@
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.http import Http404
+from django.shortcuts import redirect
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils.translation import gettext as _
+
+from blog.models import Bookmark
+from blog.pagination import (
+    InvalidCursor,
+    KeysetPaginator,
+    NumberedPaginator,
+    get_base_params
+)
+from core import page_cache
+
+
+class BookmarkedPostsMixin:
+    '''
+    Add ids of the listed posts which current user has bookmarked.
+    '''
+    def get_bookmarked_post_ids(self, posts):
+        # Looked up once per request (validators, then context)
+        if not hasattr(self, '_bookmarked_post_ids'):
+            self._bookmarked_post_ids = Bookmark.objects.get_post_ids(
+                self.request.user, posts
+            )
+        return self._bookmarked_post_ids
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['bookmarked_post_ids'] = self.get_bookmarked_post_ids(
+            context['object_list']
+        )
+        return context
+
+
+class PostChangePermissionMixin:
+    '''
+    Allow only users with object-level permission (change) on an active
+    post. The post is resolved once per request.
+    '''
+    def dispatch(self, request, *args, **kwargs):
+        post = self.get_object()
+        if not self.request.user.has_perm(
+            perm='olp_blog_change_post', obj=post
+        ):
+            return redirect('accounts:dashboard')
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_object(self, queryset=None):
+        if not hasattr(self, '_post'):
+            post = super().get_object(queryset)
+            if not post.is_active:
+                raise Http404()
+            self._post = post
+        return self._post
+
+
+class KeysetPaginationMixin:
+    '''
+    Paginate a `ListView` with `KeysetPaginator` on `keyset_ordering`
+    (`?after=` / `?before=` cursors) instead of `OFFSET`.
+    '''
+    keyset_ordering = ['-created_at', '-id']
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(
+            queryset,
+            page_size,
+            self.keyset_ordering,
+            params=get_base_params(self.request)
+        )
+        number = self.request.GET.get('page', '')
+        try:
+            page = paginator.page(
+                after=self.request.GET.get('after'),
+                before=self.request.GET.get('before'),
+                number=int(number) if number.isdigit() else 1
+            )
+        except InvalidCursor:
+            raise Http404(_('Invalid page.'))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+class NumberedPaginationMixin:
+    '''
+    Paginate a `ListView` by page number, for lists which are not
+    querysets (e.g. ranked search results).
+    '''
+    paginator_class = NumberedPaginator
+
+    def get_paginator(self, *args, **kwargs):
+        return super().get_paginator(
+            *args, params=get_base_params(self.request), **kwargs
+        )
+
+
+class ConditionalGetMixin:
+    '''
+    Answer `If-None-Match` / `If-Modified-Since` requests with 304 from
+    validators computed before rendering, skipping the rest of the view.
+
+    `get_validators()` returns the parts of the (weak) ETag and the
+    last modification time of the page, if a timestamp covers all of it.
+    The ETag also covers the viewer and Last-Modified is only sent to
+    anonymous viewers, since pages of logged-in users have parts no
+    timestamp tracks.
+    '''
+    def get_validators(self):
+        return [], None
+
+    def get_etag(self, parts):
+        parts = [*parts, self.request.user.pk or 0]
+        digest = hashlib.md5(repr(parts).encode()).hexdigest()
+        return f'W/"{digest}"'
+
+    def get(self, request, *args, **kwargs):
+        # Messages are shown once, a 304 would drop them
+        if len(get_messages(request)):
+            return self.render_page(request, *args, **kwargs)
+
+        parts, last_modified = self.get_validators()
+        etag = self.get_etag(parts)
+        if request.user.is_authenticated or last_modified is None:
+            timestamp = None
+        else:
+            timestamp = int(last_modified.timestamp())
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = self.render_page(request, *args, **kwargs)
+        response.headers.setdefault('ETag', etag)
+        if timestamp is not None:
+            response.headers.setdefault('Last-Modified', http_date(timestamp))
+        return response
+
+    def render_page(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+class PostListConditionalGetMixin(ConditionalGetMixin):
+    '''
+    Validators of a paginated post list from the posts of the requested
+    page, which is fetched once for validators and rendering. Used along
+    with `BookmarkedPostsMixin`.
+
+    Counters (views, likes) are applied without touching `updated_at`,
+    and the navigation and sidebar widgets change with no post, so the
+    ETag covers them too and no Last-Modified is sent (it would also move
+    back when the newest post leaves the page).
+    '''
+    # Page cache tags whose versions the ETag covers (see `core.page_cache`)
+    validator_tags = ['categories']
+
+    def get_page_posts(self):
+        if not hasattr(self, '_paginated'):
+            self.object_list = self.get_queryset()
+            self._paginated = self.paginate_queryset(
+                self.object_list, self.get_paginate_by(self.object_list)
+            )
+        return self._paginated[2]
+
+    def paginate_queryset(self, queryset, page_size):
+        if hasattr(self, '_paginated'):
+            return self._paginated
+        return super().paginate_queryset(queryset, page_size)
+
+    def get_validators(self):
+        posts = self.get_page_posts()
+        parts = [
+            [
+                (
+                    post.pk,
+                    post.updated_at.timestamp(),
+                    post.views,
+                    post.likes_count,
+                    post.user.get_full_name(),
+                    [(tag.pk, tag.name) for tag in post.tags.all()]
+                )
+                for post in posts
+            ],
+            sorted(self.get_bookmarked_post_ids(posts)),
+            sorted(page_cache.get_tag_versions(self.validator_tags).items())
+        ]
+        return parts, None
+
+    def render_page(self, request, *args, **kwargs):
+        self.get_page_posts()
+        context = self.get_context_data()
+        return self.render_to_response(context)
@@ -1,14 +1,23 @@
 from django.conf import settings
-from django.db import models
-from django.db.models import Count, Q
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, models, transaction
+from django.db.models import F, Subquery
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
 
+from guardian.managers import UserObjectPermissionManager
+from guardian.models import (
+    GroupObjectPermissionBase,
+    UserObjectPermissionBase
+)
 from mptt.models import MPTTModel, TreeForeignKey
 
 
 def post_media_directory(instance, filename):
-    return f'blog/posts/{instance.id}/{filename}'
+    # Named after their content by the storage (see `core.storage`)
+    return f'blog/posts/{filename}'
 
 
 class Category(models.Model):
@@ -25,6 +34,9 @@ class Category(models.Model):
     def __str__(self):
         return self.title
 
+    def get_absolute_url(self):
+        return reverse('blog:category-post-list', kwargs={'slug': self.slug})
+
 
 class Tag(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -43,17 +55,28 @@ class Tag(models.Model):
             self.slug = slugify(self.name)
         return super(Tag, self).save(*args, **kwargs)
     
-    def get_top_tags(self):
+    @classmethod
+    def get_top_tags(cls):
         '''
         Get top tags based on published related posts
         '''
-        published_posts_count = Count(
-            'posts',
-            filter=Q(posts__status=Post.POST_STATUS_PUBLISHED)
+        return cls.with_stats() \
+            .filter(stat__posts_count__gt=0) \
+            .order_by('-stat__posts_count')[:8]
+
+    @classmethod
+    def with_stats(cls):
+        '''
+        Tags annotated with their published posts count and cloud weight.
+        '''
+        return cls.objects.annotate(
+            posts_count=F('stat__posts_count'),
+            weight=F('stat__weight')
         )
-        return Tag.objects.annotate(posts_count=published_posts_count) \
-            .filter(posts_count__gt=0) \
-            .order_by('-posts_count')[:8]
+
+
+# Rows of `Post.published`, which partial indexes of posts cover
+PUBLIC_POST_CONDITION = models.Q(status='published', is_active=True)
 
 
 class PublishedPostManager(models.Manager):
@@ -61,7 +84,7 @@ class PublishedPostManager(models.Manager):
         return super().get_queryset() \
             .select_related('user') \
             .prefetch_related('tags') \
-            .filter(status=Post.POST_STATUS_PUBLISHED, is_active=True)
+            .filter(PUBLIC_POST_CONDITION)
 
 
 class Post(models.Model):
@@ -81,7 +104,15 @@ class Post(models.Model):
         blank=True,
         default='blog/posts/default.png'
     )
+    # Resized copies of `image` (see `blog.images`)
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False
+    )
     views = models.PositiveIntegerField(default=0)
+    # Maintained in batches by `blog.counters.post_likes`
+    likes_count = models.PositiveIntegerField(default=0)
     status = models.CharField(
         max_length=50,
         choices=POST_STATUS,
@@ -103,11 +134,13 @@ class Post(models.Model):
     tags = models.ManyToManyField(Tag, blank=True, related_name='posts')
     bookmarks = models.ManyToManyField(
         settings.AUTH_USER_MODEL,
+        through='Bookmark',
         blank=True,
         related_name='bookmarks'
     )
     likes = models.ManyToManyField(
         settings.AUTH_USER_MODEL,
+        through='Like',
         blank=True,
         related_name='likes'
     )
@@ -115,17 +148,94 @@ class Post(models.Model):
     objects = models.Manager()
     published = PublishedPostManager()
 
+    # Fields whose loaded values are kept to detect lifecycle changes
+    TRACKED_FIELDS = [
+        'status', 'is_active', 'user_id', 'category_id', 'title', 'slug'
+    ]
+
     class Meta:
         ordering = ['-created_at']
         permissions = [('olp_blog_change_post', 'OLP - Can change post')]
+        indexes = [
+            # Keyset pagination of post lists
+            models.Index(
+                fields=['created_at', 'id'],
+                name='blog_post_created_id_idx'
+            ),
+            # Public post lists (`Post.published`), newest first
+            models.Index(
+                fields=['created_at', 'id'],
+                name='blog_post_public_created_idx',
+                condition=PUBLIC_POST_CONDITION
+            ),
+            models.Index(
+                fields=['category', 'created_at', 'id'],
+                name='blog_post_public_category_idx',
+                condition=PUBLIC_POST_CONDITION
+            ),
+            models.Index(
+                fields=['user', 'created_at', 'id'],
+                name='blog_post_public_user_idx',
+                condition=PUBLIC_POST_CONDITION
+            )
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        post = super().from_db(db, field_names, values)
+        post._loaded_state = {
+            field: value
+            for field, value in zip(field_names, values)
+            if field in cls.TRACKED_FIELDS
+        }
+        return post
+
     def save(self, *args, **kwargs):
         if not self.id:
             self.slug = slugify(self.title)
-        return super(Post, self).save(*args, **kwargs)
+        # Keep post_save receivers (taxonomy stats, ...) in the transaction
+        with transaction.atomic(using=kwargs.get('using')):
+            super(Post, self).save(*args, **kwargs)
+        self._loaded_state = self.get_tracked_state()
+
+    def get_tracked_state(self):
+        return {
+            field: getattr(self, field)
+            for field in self.TRACKED_FIELDS
+            if field not in self.get_deferred_fields()
+        }
+
+    def get_previous_state(self):
+        '''
+        Tracked field values as loaded from (or last saved to) the database.
+        '''
+        return getattr(self, '_loaded_state', {})
+
+    def get_changed_fields(self):
+        previous_state = self.get_previous_state()
+        return {
+            field
+            for field, value in self.get_tracked_state().items()
+            if previous_state.get(field) != value
+        }
+
+    @property
+    def is_public(self):
+        return (
+            self.status == Post.POST_STATUS_PUBLISHED
+            and self.is_active
+        )
+
+    @property
+    def was_public(self):
+        previous_state = self.get_previous_state()
+        return (
+            previous_state.get('status') == Post.POST_STATUS_PUBLISHED
+            and previous_state.get('is_active', False)
+        )
 
     def delete(self):
         self.is_active = False
@@ -135,6 +245,339 @@ class Post(models.Model):
         return reverse('blog:post-detail', kwargs={'slug': self.slug})
 
 
+class PostUserObjectPermissionManager(UserObjectPermissionManager):
+    def assign(self, user, post, codename):
+        '''
+        Assign a post permission to user with a single INSERT, resolving
+        the permission in a subquery.
+        '''
+        permission_id = Subquery(
+            Permission.objects
+            .filter(
+                content_type=ContentType.objects.get_for_model(Post),
+                codename=codename
+            )
+            .order_by()
+            .values('id')
+        )
+        self.bulk_create(
+            [
+                self.model(
+                    user=user,
+                    content_object=post,
+                    permission_id=permission_id
+                )
+            ],
+            ignore_conflicts=True
+        )
+
+
+class PostUserObjectPermission(UserObjectPermissionBase):
+    '''
+    Direct foreign key user object permissions of posts (guardian).
+    '''
+    content_object = models.ForeignKey(Post, on_delete=models.CASCADE)
+
+    objects = PostUserObjectPermissionManager()
+
+
+class PostGroupObjectPermission(GroupObjectPermissionBase):
+    '''
+    Direct foreign key group object permissions of posts (guardian).
+    '''
+    content_object = models.ForeignKey(Post, on_delete=models.CASCADE)
+
+
+class PostRelationManager(models.Manager):
+    '''
+    Manager of timestamped user-post relations (bookmarks, likes).
+    '''
+    def get_post_ids(self, user, posts):
+        '''
+        Return the ids of the given posts which are related to user.
+        '''
+        if not user.is_authenticated:
+            return set()
+        post_ids = [getattr(post, 'pk', post) for post in posts]
+        return set(
+            self.filter(user=user, post_id__in=post_ids)
+            .values_list('post_id', flat=True)
+        )
+
+    def has_post(self, user, post):
+        return bool(self.get_post_ids(user, [post]))
+
+    def toggle(self, user, post_pk):
+        '''
+        Remove the relation if it exists, otherwise add it for a public
+        post, in one statement.
+
+        Return True when added, False when removed and None when nothing
+        changed (post is not public).
+        '''
+        table = self.model._meta.db_table
+        post_table = Post._meta.db_table
+        sql = f'''
+            WITH removed AS (
+                DELETE FROM {table}
+                WHERE user_id = %s AND post_id = %s
+                RETURNING post_id
+            ), added AS (
+                INSERT INTO {table} (user_id, post_id, created_at)
+                SELECT %s, post.id, NOW()
+                FROM {post_table} AS post
+                WHERE post.id = %s
+                    AND post.status = %s
+                    AND post.is_active
+                    AND NOT EXISTS (SELECT 1 FROM removed)
+                ON CONFLICT DO NOTHING
+                RETURNING post_id
+            )
+            SELECT
+                EXISTS (SELECT 1 FROM removed),
+                EXISTS (SELECT 1 FROM added)
+        '''
+        params = [
+            user.pk, post_pk,
+            user.pk, post_pk, Post.POST_STATUS_PUBLISHED
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            removed, added = cursor.fetchone()
+
+        if added:
+            return True
+        if removed:
+            return False
+        return None
+
+    def set(self, user, post_pk, related):
+        '''
+        Add (for a public post) or remove the relation, in one statement;
+        repeating it changes nothing.
+
+        Return True when it changed, False when it was already in that
+        state and None when a relation to a non public post was asked.
+        '''
+        table = self.model._meta.db_table
+        post_table = Post._meta.db_table
+        if related:
+            sql = f'''
+                WITH post AS (
+                    SELECT id FROM {post_table}
+                    WHERE id = %s AND status = %s AND is_active
+                ), added AS (
+                    INSERT INTO {table} (user_id, post_id, created_at)
+                    SELECT %s, id, NOW() FROM post
+                    ON CONFLICT DO NOTHING
+                    RETURNING post_id
+                )
+                SELECT
+                    EXISTS (SELECT 1 FROM post),
+                    EXISTS (SELECT 1 FROM added)
+            '''
+            params = [post_pk, Post.POST_STATUS_PUBLISHED, user.pk]
+        else:
+            sql = f'''
+                WITH removed AS (
+                    DELETE FROM {table}
+                    WHERE user_id = %s AND post_id = %s
+                    RETURNING post_id
+                )
+                SELECT TRUE, EXISTS (SELECT 1 FROM removed)
+            '''
+            params = [user.pk, post_pk]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            found, changed = cursor.fetchone()
+        return changed if found else None
+
+
+class Bookmark(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = PostRelationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='blog_bookmark_user_post_uniq'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-created_at'],
+                name='blog_bookmark_user_created_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'Bookmark id={self.id}'
+
+
+class Like(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = PostRelationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='blog_like_user_post_uniq'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-created_at'],
+                name='blog_like_user_created_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'Like id={self.id}'
+
+
+class PostCounterDelta(models.Model):
+    '''
+    Aggregated counter increments waiting to be applied to `Post`.
+    '''
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='counter_deltas'
+    )
+    field = models.CharField(max_length=50)
+    delta = models.IntegerField()
+    # Hourly view buckets count the increments at this time
+    spilled_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.field} +{self.delta} (post id={self.post_id})'
+
+
+class PostViewBucket(models.Model):
+    '''
+    Views of a post during one hour, for trending posts.
+    '''
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='view_buckets'
+    )
+    hour = models.DateTimeField()
+    views = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['post', 'hour'],
+                name='blog_postviewbucket_post_hour_uniq'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['hour'], name='blog_postviewbucket_hour_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} @ {self.hour}: {self.views} view(s)'
+
+
+class SidebarWidget(models.Model):
+    '''
+    Materialized sidebar list (top authors, top tags, ...) stored by key.
+    '''
+    key = models.CharField(max_length=100, unique=True)
+    data = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.key
+
+
+class TagStat(models.Model):
+    '''
+    Published posts count of a tag, maintained by `blog.stats`.
+    '''
+    tag = models.OneToOneField(
+        Tag,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stat'
+    )
+    posts_count = models.IntegerField(default=0)
+    # Tag cloud size, from 0 (no posts) to `stats.TAG_WEIGHT_LEVELS`
+    weight = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-posts_count'],
+                name='blog_tagstat_posts_count_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.tag_id}: {self.posts_count} post(s)'
+
+
+class CategoryStat(models.Model):
+    '''
+    Published posts count of a category, maintained by `blog.stats`.
+    '''
+    category = models.OneToOneField(
+        Category,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stat'
+    )
+    posts_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.category_id}: {self.posts_count} post(s)'
+
+
+class AuthorStat(models.Model):
+    '''
+    Post counters of an author, maintained by `blog.stats` and the post
+    views counter.
+    '''
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='author_stat'
+    )
+    # Published posts only
+    posts_count = models.IntegerField(default=0)
+    # Views of all posts
+    views_count = models.BigIntegerField(default=0)
+    last_published_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Leaderboard
+            models.Index(
+                fields=['-posts_count', 'user'],
+                name='blog_authorstat_leaders_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.posts_count} post(s)'
+
+
 class Comment(MPTTModel):
     COMMENT_STATUS_PENDING = 'pending'
     COMMENT_STATUS_APPROVED = 'approved'
@@ -0,0 +1,263 @@
+import base64
+import binascii
+import datetime
+import json
+from collections import namedtuple
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Page, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import QueryDict
+
+# Query string params owned by paginators
+PAGE_PARAMS = ['page', 'after', 'before']
+
+# `number` is None for an ellipsis
+PageLink = namedtuple('PageLink', ['number', 'params'])
+ELLIPSIS = PageLink(None, None)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # Keep microseconds, which DjangoJSONEncoder rounds to milliseconds
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def get_base_params(request):
+    '''
+    Query string of a request without pagination params.
+    '''
+    params = request.GET.copy()
+    for param in PAGE_PARAMS:
+        params.pop(param, None)
+    return params
+
+
+def with_params(base_params, **params):
+    query = base_params.copy()
+    query.update(params)
+    return query.urlencode()
+
+
+def encode_cursor(values):
+    data = json.dumps(values, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values
+
+
+class NumberedPage(Page):
+    '''
+    A page of `NumberedPaginator` with links to an elided page range.
+    '''
+    def get_page_params(self, number):
+        return with_params(self.paginator.params, page=number)
+
+    def previous_page_params(self):
+        return self.get_page_params(self.previous_page_number())
+
+    def next_page_params(self):
+        return self.get_page_params(self.next_page_number())
+
+    def page_links(self):
+        return [
+            PageLink(number, self.get_page_params(number))
+            if number != Paginator.ELLIPSIS else ELLIPSIS
+            for number in self.paginator.get_elided_page_range(self.number)
+        ]
+
+
+class NumberedPaginator(Paginator):
+    '''
+    `Paginator` keeping other query string params in page links, and
+    taking the objects `count` when it is known beforehand.
+    '''
+    def __init__(self, *args, params=None, count=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.params = QueryDict() if params is None else params
+        if count is not None:
+            # Preset the cached property, skipping the COUNT query
+            self.__dict__['count'] = count
+
+    def _get_page(self, *args, **kwargs):
+        return NumberedPage(*args, **kwargs)
+
+
+class KeysetPage:
+    '''
+    A page of `KeysetPaginator`, exposing the same link helpers as
+    `NumberedPage`.
+    '''
+    def __init__(self, object_list, number, paginator, has_previous, has_next):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __repr__(self):
+        return f'<Keyset page {self.number}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    def previous_page_params(self):
+        if self.number <= 2:
+            return with_params(self.paginator.params)
+        return with_params(
+            self.paginator.params,
+            before=self.paginator.get_cursor(self.object_list[0]),
+            page=self.number - 1
+        )
+
+    def next_page_params(self):
+        return with_params(
+            self.paginator.params,
+            after=self.paginator.get_cursor(self.object_list[-1]),
+            page=self.number + 1
+        )
+
+    def page_links(self):
+        '''
+        First, previous, current and next pages: the only ones a keyset
+        page can link to without counting or skipping rows.
+        '''
+        links = []
+        if self._has_previous:
+            links.append(PageLink(1, with_params(self.paginator.params)))
+            if self.number > 3:
+                links.append(ELLIPSIS)
+            if self.number > 2:
+                links.append(
+                    PageLink(self.number - 1, self.previous_page_params())
+                )
+        links.append(PageLink(self.number, None))
+        if self._has_next:
+            links.append(PageLink(self.number + 1, self.next_page_params()))
+        return links
+
+
+class KeysetPaginator:
+    '''
+    Paginate a queryset by seeking past the last row of the previous page
+    on `ordering` (whose last field must be unique), e.g.
+    `WHERE (created_at, id) < (...) ORDER BY created_at DESC, id DESC`.
+
+    Unlike `OFFSET`, every page costs the same index range scan and pages
+    don't shift when rows are added meanwhile. Pages are addressed by an
+    `after` or `before` cursor; their number is carried along for display
+    only.
+    '''
+    def __init__(self, queryset, per_page, ordering, params=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = list(ordering)
+        self.params = QueryDict() if params is None else params
+        self.fields = [
+            (name.lstrip('-'), name.startswith('-')) for name in self.ordering
+        ]
+
+    def get_cursor(self, obj):
+        return encode_cursor([getattr(obj, name) for name, _ in self.fields])
+
+    def get_model_field(self, name):
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        model = self.queryset.model
+        *relations, name = name.split('__')
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        return model._meta.get_field(name)
+
+    def parse_cursor(self, cursor):
+        values = decode_cursor(cursor)
+        if len(values) != len(self.fields):
+            raise InvalidCursor(cursor)
+        try:
+            return [
+                self.get_model_field(name).to_python(value)
+                for (name, _), value in zip(self.fields, values)
+            ]
+        except (FieldDoesNotExist, ValidationError):
+            raise InvalidCursor(cursor)
+
+    def seek(self, queryset, values, forward=True):
+        '''
+        Filter rows after (or before) `values` in the paginator ordering.
+        '''
+        # (a, b) < (x, y) is a < x OR (a = x AND b < y); the redundant
+        # a <= x bound lets the database range scan an index on a.
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.fields, values):
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        name, descending = self.fields[0]
+        bound = 'lte' if descending == forward else 'gte'
+        return queryset.filter(
+            Q(**{f'{name}__{bound}': values[0]}) & condition
+        )
+
+    def page(self, after=None, before=None, number=1):
+        if before:
+            reverse_ordering = [
+                name[1:] if name.startswith('-') else f'-{name}'
+                for name in self.ordering
+            ]
+            queryset = self.seek(
+                self.queryset, self.parse_cursor(before), forward=False
+            ).order_by(*reverse_ordering)
+            rows = list(queryset[:self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            if not has_previous and len(rows) < self.per_page:
+                # Back at the start, show a full first page
+                return self.page()
+            return KeysetPage(
+                rows[:self.per_page][::-1],
+                max(number, 2) if has_previous else 1,
+                self,
+                has_previous=has_previous,
+                has_next=True
+            )
+
+        queryset = self.queryset.order_by(*self.ordering)
+        if after:
+            queryset = self.seek(queryset, self.parse_cursor(after))
+        rows = list(queryset[:self.per_page + 1])
+        return KeysetPage(
+            rows[:self.per_page],
+            max(number, 2) if after else 1,
+            self,
+            has_previous=bool(after),
+            has_next=len(rows) > self.per_page
+        )
@@ -0,0 +1,141 @@
+import random
+import time
+from array import array
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Min
+
+from blog.models import Post, Tag
+
+
+def get_request_seed(request):
+    '''
+    Random seed drawn once per request, so samples taken while handling
+    it are stable (e.g. across template fragments).
+    '''
+    if not hasattr(request, '_sampling_seed'):
+        request._sampling_seed = random.getrandbits(64)
+    return request._sampling_seed
+
+
+class IdSampler:
+    '''
+    Sample random rows of a small queryset in O(k).
+
+    The ids of the queryset are kept in a process-local array, reloaded
+    when the shared version of the sampler is bumped (see
+    `blog.signals`). Sampling picks k positions of that array and fetches
+    the rows by primary key, instead of `ORDER BY random()` over the
+    whole table. Every process holds and reloads all the ids, so it suits
+    tables which are small and rarely change (tags).
+    '''
+    def __init__(self, name, get_queryset):
+        self.name = name
+        self.get_queryset = get_queryset
+        # (version, ids) of this process
+        self._ids = (None, array('q'))
+
+    @property
+    def version_key(self):
+        return f'blog:sampling-version:{self.name}'
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, time.time_ns(), timeout=None)
+            version = cache.get(self.version_key)
+        return version
+
+    def bump_version(self):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, time.time_ns(), timeout=None)
+
+    def invalidate(self):
+        '''
+        Reload ids in every process once the current transaction commits.
+        '''
+        transaction.on_commit(self.bump_version)
+
+    def get_ids(self):
+        version = self.get_version()
+        cached_version, ids = self._ids
+        if cached_version != version:
+            ids = array('q', self.get_queryset().order_by().values_list(
+                'id', flat=True
+            ))
+            self._ids = (version, ids)
+        return ids
+
+    def sample_ids(self, k, exclude=(), seed=None):
+        ids = self.get_ids()
+        count = min(len(ids), k + len(exclude))
+        positions = random.Random(seed).sample(range(len(ids)), count)
+        return [
+            ids[position] for position in positions
+            if ids[position] not in exclude
+        ][:k]
+
+    def sample(self, k, exclude=(), seed=None):
+        '''
+        Return up to k random rows, other than the `exclude` ids.
+        '''
+        ids = self.sample_ids(k, exclude, seed)
+        rows = self.get_queryset().in_bulk(ids)
+        # Rows deleted since the ids were loaded are skipped
+        return [rows[pk] for pk in ids if pk in rows]
+
+
+class RangeSampler:
+    '''
+    Sample random rows of a large queryset without holding its ids.
+
+    Draws ids between the smallest and the largest id of the queryset and
+    takes the first id at or after each of them, all in one query of
+    primary key index probes, drawing again for duplicates (up to
+    `attempts` rounds), then fetches the rows by primary key. Rows which
+    follow a gap of ids are more likely to be picked, which is fine for
+    "more posts" kind of lists.
+    '''
+    def __init__(self, get_queryset, attempts=3):
+        self.get_queryset = get_queryset
+        self.attempts = attempts
+
+    def sample_ids(self, k, exclude=(), seed=None):
+        queryset = self.get_queryset().exclude(pk__in=exclude).order_by()
+        bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None or k <= 0:
+            return []
+
+        rng = random.Random(seed)
+        ids = set()
+        for _ in range(self.attempts):
+            probes = [
+                queryset
+                .filter(pk__gte=rng.randint(bounds['low'], bounds['high']))
+                .order_by('pk')
+                .values_list('pk', flat=True)[:1]
+                for _ in range(k - len(ids))
+            ]
+            ids.update(probes[0].union(*probes[1:]))
+            if len(ids) >= k:
+                break
+        # In the order drawn by the seed, whatever order ids came in
+        ids = sorted(ids)
+        rng.shuffle(ids)
+        return ids[:k]
+
+    def sample(self, k, exclude=(), seed=None):
+        '''
+        Return up to k random rows, other than the `exclude` ids.
+        '''
+        ids = self.sample_ids(k, exclude, seed)
+        rows = self.get_queryset().in_bulk(ids)
+        # Rows deleted since the ids were drawn are skipped
+        return [rows[pk] for pk in ids if pk in rows]
+
+
+tags = IdSampler('tags', lambda: Tag.objects.all())
+public_posts = RangeSampler(lambda: Post.published.all())
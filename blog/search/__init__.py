@@ -0,0 +1,155 @@
+'''
+In-process full-text search over public posts.
+
+Posts are indexed (title, content, tags, author and category) into
+memory-mapped segment files under `BLOG_SEARCH_INDEX_DIR` and ranked
+with BM25. The index is kept up to date from post lifecycle signals
+(see `blog.signals`) and its segments are merged off the request path
+(`compact()`, run by the counter flusher thread and `manage.py
+compact_search_index`); `manage.py rebuild_search_index` builds it from
+scratch.
+'''
+import time
+from collections import Counter
+from collections.abc import Sequence
+
+from django.conf import settings
+
+from blog.models import Post
+from blog.search.analysis import analyze, get_post_fields, tokenize
+from blog.search.index import SearchIndex
+from blog.utilities import on_commit_batch
+
+_index = None
+
+
+def get_index():
+    global _index
+    if _index is None:
+        _index = SearchIndex(
+            settings.BLOG_SEARCH_INDEX_DIR,
+            merge_factor=getattr(settings, 'BLOG_SEARCH_MERGE_FACTOR', 8)
+        )
+    return _index
+
+
+def get_indexable_posts():
+    return Post.published \
+        .select_related('category') \
+        .only(
+            'id', 'title', 'content',
+            'user__first_name', 'user__last_name', 'category__title'
+        ) \
+        .order_by('pk')
+
+
+def get_documents(posts):
+    for post in posts:
+        frequencies, length = analyze(get_post_fields(post))
+        tag_ids = [tag.pk for tag in post.tags.all()]
+        yield post.pk, frequencies, length, post.category_id, tag_ids
+
+
+def update_posts(post_ids):
+    '''
+    Reindex posts, dropping the ones which are not public anymore.
+    '''
+    post_ids = set(post_ids)
+    if not post_ids:
+        return
+    index = get_index()
+    posts = get_indexable_posts().filter(pk__in=post_ids)
+    index.write(get_documents(posts), superseded=post_ids)
+    # Read by this process at once, by others within their refresh interval
+    index.refresh(force=True)
+
+
+def schedule_update(post_ids):
+    '''
+    Reindex posts once the current transaction commits.
+    '''
+    on_commit_batch(update_posts, post_ids)
+
+
+def compact():
+    '''
+    Merge the segments written by updates, unless another process is
+    at it. Returns the number of merges, None when skipped.
+    '''
+    return get_index().compact()
+
+
+def rebuild(chunk_size=50000):
+    '''
+    Index every public post into base segments of `chunk_size` posts and
+    drop the previous segments. Returns the number of indexed posts.
+    '''
+    index = get_index()
+    # A compaction finishing after the old segments are dropped would
+    # bring their documents back
+    with index.lock():
+        started_at = time.time_ns()
+        count = 0
+        last_pk = 0
+        while True:
+            posts = list(
+                get_indexable_posts().filter(pk__gt=last_pk)[:chunk_size]
+            )
+            if not posts:
+                break
+            index.write(
+                get_documents(posts), timestamp=started_at, base=True
+            )
+            count += len(posts)
+            last_pk = posts[-1].pk
+        index.remove_older_than(started_at)
+    return count
+
+
+def is_searchable(query):
+    '''
+    Whether a query has a word to look up (not only stop words).
+    '''
+    return bool(tokenize(query))
+
+
+def search(query, category_id=None, tag_id=None):
+    '''
+    Return posts matching query, best match first, optionally narrowed to
+    a category and a tag.
+    '''
+    hits, categories, tags = get_index().search(query, category_id, tag_id)
+    return SearchResults(
+        [post_id for post_id, score in hits],
+        category_counts=categories,
+        tag_counts=tags
+    )
+
+
+class SearchResults(Sequence):
+    '''
+    Ranked post ids which hydrate posts only for the requested slice
+    (e.g. the current page), along with `Counter({id: count})` category
+    and tag facets of the query.
+    '''
+    def __init__(
+        self, post_ids, category_counts=None, tag_counts=None, queryset=None
+    ):
+        self.post_ids = post_ids
+        self.category_counts = Counter(category_counts)
+        self.tag_counts = Counter(tag_counts)
+        self.queryset = Post.published.all() if queryset is None else queryset
+
+    def __len__(self):
+        return len(self.post_ids)
+
+    def count(self):
+        return len(self)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+
+        post_ids = self.post_ids[index]
+        posts = self.queryset.in_bulk(post_ids)
+        return [posts[post_id] for post_id in post_ids if post_id in posts]
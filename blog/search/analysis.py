@@ -0,0 +1,53 @@
+import re
+
+TOKEN_RE = re.compile(r'\w+')
+
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if',
+    'in', 'into', 'is', 'it', 'no', 'not', 'of', 'on', 'or', 'such', 'that',
+    'the', 'their', 'then', 'there', 'these', 'they', 'this', 'to', 'was',
+    'will', 'with'
+])
+
+# Term frequency weight of each indexed field
+FIELD_WEIGHTS = {
+    'title': 3,
+    'tags': 2,
+    'author': 2,
+    'category': 2,
+    'content': 1,
+}
+
+
+def tokenize(text):
+    return [
+        token
+        for token in TOKEN_RE.findall(text.casefold())
+        if token not in STOP_WORDS
+    ]
+
+
+def get_post_fields(post):
+    '''
+    Indexed text of a post. Expects `user`, `category` and `tags` to be
+    already loaded.
+    '''
+    return {
+        'title': post.title,
+        'tags': ' '.join(tag.name for tag in post.tags.all()),
+        'author': f'{post.user.first_name} {post.user.last_name}',
+        'category': post.category.title,
+        'content': post.content,
+    }
+
+
+def analyze(fields):
+    '''
+    Return weighted term frequencies and the weighted length of a document.
+    '''
+    frequencies = {}
+    for field, text in fields.items():
+        weight = FIELD_WEIGHTS[field]
+        for token in tokenize(text):
+            frequencies[token] = frequencies.get(token, 0) + weight
+    return frequencies, sum(frequencies.values())
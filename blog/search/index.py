@@ -0,0 +1,375 @@
+import bisect
+import contextlib
+import fcntl
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from collections import Counter, namedtuple
+
+from blog.search.analysis import tokenize
+from blog.search.segment import Segment, write_segment
+
+SEGMENT_SUFFIX = '.seg'
+BASE_SUFFIX = '-b'
+LOCK_NAME = 'compact.lock'
+
+# `-m<level>` of merged segments (`-m` before levels were numbered)
+MERGED_PATTERN = re.compile(r'-m(\d*)\.seg$')
+
+# Okapi BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Number of terms a trailing partial word may expand to
+MAX_PREFIX_TERMS = 32
+
+
+IndexState = namedtuple(
+    'IndexState',
+    ['segments', 'deleted', 'live_docs', 'live_length']
+)
+
+SearchResult = namedtuple('SearchResult', ['hits', 'categories', 'tags'])
+
+
+def contains(sorted_ids, post_id):
+    index = bisect.bisect_left(sorted_ids, post_id)
+    return index < len(sorted_ids) and sorted_ids[index] == post_id
+
+
+def find_superseded(segment, superseding):
+    '''
+    Return doc indexes of `segment` superseded by a newer segment.
+    '''
+    superseded = superseding.superseded
+    if not (segment.doc_count and len(superseded)) or (
+        superseded[-1] < segment.post_ids[0]
+        or superseded[0] > segment.post_ids[-1]
+    ):
+        return []
+
+    # Probe the smaller side into the larger one
+    if len(superseded) <= segment.doc_count:
+        doc_indexes = (segment.find_doc(post_id) for post_id in superseded)
+        return [doc_index for doc_index in doc_indexes if doc_index != -1]
+    return [
+        doc_index
+        for doc_index, post_id in enumerate(segment.post_ids)
+        if contains(superseded, post_id)
+    ]
+
+
+def get_level(name):
+    '''
+    Merge level of a segment: 0 for the segment of an update, one more
+    than its inputs for a merged one and None for base segments.
+    '''
+    if name.endswith(BASE_SUFFIX + SEGMENT_SUFFIX):
+        return None
+    match = MERGED_PATTERN.search(name)
+    if match is None:
+        return 0
+    return int(match.group(1) or 1)
+
+
+def new_segment_name(timestamp=None, suffix=''):
+    timestamp = time.time_ns() if timestamp is None else timestamp
+    return (
+        f'{timestamp:020d}-{os.getpid()}-{uuid.uuid4().hex[:8]}{suffix}'
+        f'{SEGMENT_SUFFIX}'
+    )
+
+
+class SearchIndex:
+    '''
+    A directory of immutable segments, newest segment wins.
+
+    Every process keeps its segments memory-mapped and re-lists the
+    directory (at most every `refresh_interval` seconds) to pick up
+    segments written by other processes.
+    '''
+    def __init__(self, path, refresh_interval=1, merge_factor=8):
+        self.path = str(path)
+        self.refresh_interval = refresh_interval
+        self.merge_factor = merge_factor
+        self._state = IndexState([], {}, 0, 0)
+        self._directory_mtime = None
+        self._last_refresh = 0
+        self._lock = threading.Lock()
+
+    # Reading
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.refresh_interval:
+            return
+        self._last_refresh = now
+
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if not force and mtime == self._directory_mtime:
+            return
+
+        with self._lock:
+            self._directory_mtime = mtime
+            opened = {
+                segment.name: segment for segment in self._state.segments
+            }
+            segments = []
+            for name in self.list_segment_names():
+                segment = opened.get(name)
+                if segment is None:
+                    try:
+                        segment = Segment(os.path.join(self.path, name))
+                    except FileNotFoundError:
+                        # Merged away meanwhile
+                        continue
+                    except ValueError:
+                        # Older format, replaced by the next rebuild
+                        continue
+                segments.append(segment)
+            self._load(segments)
+
+    def list_segment_names(self):
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if name.endswith(SEGMENT_SUFFIX))
+
+    def _load(self, segments):
+        '''
+        Compute, for every segment, the docs superseded by newer segments.
+        '''
+        deleted = {}
+        live_docs = 0
+        live_length = 0
+        newer = []
+        for segment in reversed(segments):
+            dead = set()
+            for superseding in newer:
+                dead.update(find_superseded(segment, superseding))
+            deleted[segment.name] = dead
+            live_docs += segment.doc_count - len(dead)
+            live_length += segment.total_length - sum(
+                segment.lengths[doc_index] for doc_index in dead
+            )
+            newer.append(segment)
+
+        self._state = IndexState(segments, deleted, live_docs, live_length)
+
+    def expand(self, query):
+        '''
+        Tokenize a query, expanding its trailing word to indexed terms
+        it prefixes (search as you type).
+        '''
+        terms = tokenize(query)
+        if not terms or query[-1:].isspace():
+            return terms
+
+        last = terms[-1]
+        expansions = {last}
+        for segment in self._state.segments:
+            expansions.update(segment.find_prefix(last))
+        return terms[:-1] + sorted(expansions, key=len)[:MAX_PREFIX_TERMS]
+
+    def search(self, query, category_id=None, tag_id=None):
+        '''
+        Rank posts matching query by BM25 and count them per category and
+        tag in the same pass.
+
+        Category counts ignore the category filter and tag counts the tag
+        filter, so every facet value shows how many results picking it
+        would give.
+        '''
+        self.refresh()
+        segments, deleted, live_docs, live_length = self._state
+        if not live_docs:
+            return SearchResult([], Counter(), Counter())
+
+        average_length = live_length / live_docs
+        scores = {}
+        for term in dict.fromkeys(self.expand(query)):
+            matches = []
+            for segment in segments:
+                term_index = segment.find_term(term)
+                if term_index != -1:
+                    matches.append((segment, segment.get_postings(term_index)))
+            match_count = sum(len(postings) // 2 for _, postings in matches)
+            if not match_count:
+                continue
+
+            idf = math.log(
+                1 + (live_docs - match_count + 0.5) / (match_count + 0.5)
+            )
+            for segment, postings in matches:
+                dead = deleted[segment.name]
+                lengths = segment.lengths
+                for doc_index, frequency in zip(postings[::2], postings[1::2]):
+                    if dead and doc_index in dead:
+                        continue
+                    norm = K1 * (
+                        1 - B + B * lengths[doc_index] / average_length
+                    )
+                    doc = (segment, doc_index)
+                    scores[doc] = scores.get(doc, 0) + idf * (
+                        frequency * (K1 + 1) / (frequency + norm)
+                    )
+
+        hits = []
+        category_ids = []
+        tag_ids = []
+        for (segment, doc_index), score in scores.items():
+            doc_category_id = segment.category_ids[doc_index]
+            doc_tag_ids = segment.get_tag_ids(doc_index)
+            in_category = category_id is None or doc_category_id == category_id
+            in_tag = tag_id is None or tag_id in doc_tag_ids
+            if in_tag:
+                category_ids.append(doc_category_id)
+            if in_category:
+                tag_ids.extend(doc_tag_ids)
+            if in_category and in_tag:
+                hits.append((segment.post_ids[doc_index], score))
+
+        hits.sort(key=lambda hit: (-hit[1], -hit[0]))
+        return SearchResult(hits, Counter(category_ids), Counter(tag_ids))
+
+    # Writing
+
+    def write(self, docs, superseded=(), timestamp=None, base=False):
+        '''
+        Add a segment holding `docs`, replacing older documents of the
+        same posts and of `superseded` ones.
+        '''
+        os.makedirs(self.path, exist_ok=True)
+        name = new_segment_name(timestamp, BASE_SUFFIX if base else '')
+        write_segment(os.path.join(self.path, name), docs, superseded)
+        return name
+
+    @contextlib.contextmanager
+    def lock(self, blocking=True):
+        '''
+        Hold the lock of the index directory, which compactions and
+        rebuilds of every process take. Yields whether it was acquired.
+        '''
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, LOCK_NAME), 'a') as file:
+            try:
+                fcntl.flock(
+                    file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB)
+                )
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def find_merge(self):
+        '''
+        Return the oldest run of `merge_factor` adjacent segments of the
+        same level, or None.
+        '''
+        run = []
+        for segment in self._state.segments:
+            level = get_level(segment.name)
+            if level is None or (run and get_level(run[0].name) != level):
+                run = []
+            if level is not None:
+                run.append(segment)
+            if len(run) == self.merge_factor:
+                return run
+        return None
+
+    def compact(self):
+        '''
+        Merge runs of `merge_factor` adjacent segments of a level into a
+        segment of the next level, until none is left. Returns the number
+        of merges, or None when another process is compacting.
+
+        A document is rewritten once per level, so merges cost
+        O(log(documents)) writes per document. Base segments (written by
+        a rebuild) are left alone. A merged segment sorts right after the
+        newest of its inputs, so segments written meanwhile still
+        supersede it.
+        '''
+        with self.lock(blocking=False) as locked:
+            if not locked:
+                return None
+            merges = 0
+            while True:
+                self.refresh(force=True)
+                inputs = self.find_merge()
+                if inputs is None:
+                    return merges
+                self.merge(inputs)
+                merges += 1
+
+    def merge(self, inputs):
+        deleted = self._state.deleted
+        docs = []
+        for segment in inputs:
+            dead = deleted[segment.name]
+            docs += [
+                (segment, doc_index)
+                for doc_index in range(segment.doc_count)
+                if doc_index not in dead
+            ]
+
+        frequencies = {(id(segment), i): {} for segment, i in docs}
+        for segment in inputs:
+            for term_index in range(segment.term_count):
+                term = segment.get_term(term_index).decode()
+                postings = segment.get_postings(term_index)
+                for i in range(0, len(postings), 2):
+                    doc = frequencies.get((id(segment), postings[i]))
+                    if doc is not None:
+                        doc[term] = postings[i + 1]
+
+        superseded = set()
+        for segment in inputs:
+            superseded.update(segment.superseded)
+
+        newest = inputs[-1].name
+        stem = MERGED_PATTERN.sub('', newest)
+        if stem == newest:
+            stem = newest[:-len(SEGMENT_SUFFIX)]
+        level = get_level(newest) + 1
+        name = f'{stem}-m{level}{SEGMENT_SUFFIX}'
+        write_segment(
+            os.path.join(self.path, name),
+            [
+                (
+                    segment.post_ids[i],
+                    frequencies[(id(segment), i)],
+                    segment.lengths[i],
+                    segment.category_ids[i],
+                    segment.get_tag_ids(i)
+                )
+                for segment, i in docs
+            ],
+            superseded
+        )
+        for segment in inputs:
+            try:
+                os.remove(segment.path)
+            except FileNotFoundError:
+                pass
+
+    def remove_older_than(self, timestamp):
+        '''
+        Remove segments written before `timestamp` (after a rebuild).
+        '''
+        for old_name in self.list_segment_names():
+            if old_name < f'{timestamp:020d}':
+                try:
+                    os.remove(os.path.join(self.path, old_name))
+                except FileNotFoundError:
+                    pass
+        self.refresh(force=True)
@@ -0,0 +1,206 @@
+'''
+Immutable on-disk index segments.
+
+A segment file holds, for a batch of posts, the inverted index of their
+terms, their category and tag ids (for facets) plus the ids of every post
+the segment supersedes in older segments (updated or removed posts).
+All sections are little endian arrays aligned to 8 bytes, so a segment is
+read by memory-mapping the file and casting slices of it, without parsing:
+
+    header
+    post_ids          u64[doc_count]         sorted
+    lengths           u32[doc_count]         weighted document lengths
+    category_ids      u64[doc_count]
+    tag_offsets       u32[doc_count + 1]     into tag_ids
+    tag_ids           u64[tag_count]
+    superseded        u64[superseded_count]  sorted
+    term_offsets      u32[term_count + 1]    into terms
+    postings_offsets  u64[term_count + 1]    into postings, in pairs
+    terms             utf-8 bytes            sorted
+    postings          u32[2 * pairs]         (doc index, frequency) pairs
+'''
+import mmap
+import os
+import struct
+from array import array
+
+MAGIC = b'BSI2'
+HEADER = struct.Struct('<4sIIIIQQ')
+
+
+def pad(size):
+    return -size % 8
+
+
+def write_segment(path, docs, superseded=()):
+    '''
+    Write a segment file atomically.
+
+    `docs` is an iterable of `(post_id, frequencies, length, category_id,
+    tag_ids)` and `superseded` the ids of posts whose older documents are
+    replaced.
+    '''
+    docs = sorted(docs, key=lambda doc: doc[0])
+    post_ids = array('Q', [doc[0] for doc in docs])
+    lengths = array('I', [doc[2] for doc in docs])
+    category_ids = array('Q', [doc[3] for doc in docs])
+    tag_offsets = array('I', [0])
+    tag_ids = array('Q')
+    for doc in docs:
+        tag_ids.extend(sorted(doc[4]))
+        tag_offsets.append(len(tag_ids))
+    superseded = array('Q', sorted(set(superseded) | set(post_ids)))
+
+    postings = {}
+    for doc_index, (post_id, frequencies, *_) in enumerate(docs):
+        for term, frequency in frequencies.items():
+            term_postings = postings.get(term)
+            if term_postings is None:
+                term_postings = postings[term] = array('I')
+            term_postings.append(doc_index)
+            term_postings.append(frequency)
+
+    encoded_terms = sorted(term.encode() for term in postings)
+    term_offsets = array('I', [0])
+    postings_offsets = array('Q', [0])
+    for term in encoded_terms:
+        term_offsets.append(term_offsets[-1] + len(term))
+        postings_offsets.append(
+            postings_offsets[-1] + len(postings[term.decode()]) // 2
+        )
+
+    header = HEADER.pack(
+        MAGIC,
+        len(post_ids),
+        len(superseded),
+        len(encoded_terms),
+        len(tag_ids),
+        sum(lengths),
+        postings_offsets[-1]
+    )
+    terms_blob = b''.join(encoded_terms)
+
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as file:
+        for section in [
+            header, post_ids, lengths, category_ids, tag_offsets, tag_ids,
+            superseded, term_offsets, postings_offsets, terms_blob
+        ]:
+            data = (
+                section.tobytes() if isinstance(section, array) else section
+            )
+            file.write(data)
+            file.write(b'\0' * pad(len(data)))
+        for term in encoded_terms:
+            postings[term.decode()].tofile(file)
+    os.replace(temp_path, path)
+
+
+class Segment:
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+
+        (
+            magic,
+            self.doc_count,
+            superseded_count,
+            self.term_count,
+            tag_count,
+            self.total_length,
+            pairs_count
+        ) = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a current search index segment.')
+
+        offset = HEADER.size + pad(HEADER.size)
+
+        def section(size, item_format=None):
+            nonlocal offset
+            view = buffer[offset:offset + size]
+            offset += size + pad(size)
+            return view.cast(item_format) if item_format else view
+
+        self.post_ids = section(8 * self.doc_count, 'Q')
+        self.lengths = section(4 * self.doc_count, 'I')
+        self.category_ids = section(8 * self.doc_count, 'Q')
+        self.tag_offsets = section(4 * (self.doc_count + 1), 'I')
+        self.tag_ids = section(8 * tag_count, 'Q')
+        self.superseded = section(8 * superseded_count, 'Q')
+        self.term_offsets = section(4 * (self.term_count + 1), 'I')
+        self.postings_offsets = section(8 * (self.term_count + 1), 'Q')
+        self.terms = section(self.term_offsets[-1])
+        self.postings = section(8 * pairs_count, 'I')
+
+    def __repr__(self):
+        return f'<Segment {self.name} docs={self.doc_count}>'
+
+    def get_term(self, index):
+        start, end = self.term_offsets[index], self.term_offsets[index + 1]
+        return bytes(self.terms[start:end])
+
+    def _bisect_term(self, term):
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_term(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find_term(self, term):
+        '''
+        Return the index of a term or -1 when the segment lacks it.
+        '''
+        term = term.encode()
+        index = self._bisect_term(term)
+        if index < self.term_count and self.get_term(index) == term:
+            return index
+        return -1
+
+    def find_prefix(self, prefix):
+        '''
+        Return terms of the segment starting with prefix.
+        '''
+        prefix = prefix.encode()
+        index = self._bisect_term(prefix)
+        terms = []
+        while index < self.term_count:
+            term = self.get_term(index)
+            if not term.startswith(prefix):
+                break
+            terms.append(term.decode())
+            index += 1
+        return terms
+
+    def get_tag_ids(self, doc_index):
+        start = self.tag_offsets[doc_index]
+        return self.tag_ids[start:self.tag_offsets[doc_index + 1]]
+
+    def get_postings(self, term_index):
+        '''
+        Return the flat `(doc index, frequency, ...)` postings of a term.
+        '''
+        start = self.postings_offsets[term_index]
+        end = self.postings_offsets[term_index + 1]
+        return self.postings[2 * start:2 * end]
+
+    def find_doc(self, post_id):
+        '''
+        Return the doc index of a post or -1 when the segment lacks it.
+        '''
+        low, high = 0, self.doc_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.post_ids[middle] < post_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.doc_count and self.post_ids[low] == post_id:
+            return low
+        return -1
@@ -0,0 +1,315 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from blog import images, sampling, search, stats, widgets
+from blog.categories import bump_version as bump_categories_version
+from blog.comments import bump_version
+from blog.models import Category, Comment, Post, Tag
+from blog.utilities import on_commit_batch
+from core import page_cache
+
+
+def refresh_widgets(*keys):
+    '''
+    Refresh materialized widgets once the current transaction commits,
+    each key once however many changes asked for it.
+    '''
+    on_commit_batch(widgets.refresh_many, keys)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if not (instance.is_public or instance.was_public):
+        return
+
+    keys = []
+    changed_fields = instance.get_changed_fields()
+
+    if instance.is_public != instance.was_public:
+        keys += [widgets.TOP_AUTHORS, widgets.TOP_TAGS]
+
+    if changed_fields & {'status', 'is_active', 'user_id', 'title', 'slug'}:
+        keys.append(widgets.author_posts_key(instance.user_id))
+
+    previous_user_id = instance.get_previous_state().get('user_id')
+    if previous_user_id and previous_user_id != instance.user_id:
+        keys += [
+            widgets.TOP_AUTHORS,
+            widgets.author_posts_key(previous_user_id)
+        ]
+
+    refresh_widgets(*keys)
+    search.schedule_update([instance.pk])
+
+
+@receiver(post_save, sender=Post)
+def post_image_saved(sender, instance, **kwargs):
+    '''
+    Render the variants of a new post image.
+    '''
+    if (
+        instance.image
+        and instance.image_variants.get('source') != instance.image.name
+    ):
+        images.schedule_variants(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_counted(sender, instance, created, **kwargs):
+    '''
+    Move category, tag and author stats when a post enters or leaves the
+    public posts, or changes category or author while public.
+    '''
+    was_public, is_public = instance.was_public, instance.is_public
+    if not (was_public or is_public):
+        return
+    previous_state = instance.get_previous_state()
+
+    category_deltas = Counter()
+    if was_public:
+        previous_category_id = previous_state.get(
+            'category_id', instance.category_id
+        )
+        category_deltas[previous_category_id] -= 1
+    if is_public:
+        category_deltas[instance.category_id] += 1
+    stats.update_category_counts(category_deltas)
+
+    previous_user_id = previous_state.get('user_id', instance.user_id)
+    moved = previous_user_id != instance.user_id
+    if was_public and (moved or not is_public):
+        stats.update_author_counts(
+            previous_user_id,
+            posts_count=-1,
+            views_count=-instance.views if moved else 0
+        )
+        stats.refresh_last_published_at(previous_user_id)
+    if is_public and (moved or not was_public):
+        stats.update_author_counts(
+            instance.user_id,
+            posts_count=1,
+            views_count=instance.views if moved else 0,
+            published_at=instance.created_at
+        )
+
+    # New posts get their tags afterwards (m2m_changed)
+    if was_public != is_public and not created:
+        delta = 1 if is_public else -1
+        stats.update_tag_counts({
+            tag_id: delta
+            for tag_id in instance.tags.values_list('id', flat=True)
+        })
+
+
+@receiver(pre_delete, sender=Post)
+def post_delete_counted(sender, instance, **kwargs):
+    '''
+    Take a public post being deleted (`QuerySet.delete()`, e.g. the
+    admin's bulk action; `Post.delete()` only deactivates) out of the
+    category and tag stats, while its tags are still linked.
+    '''
+    if not instance.was_public:
+        return
+    previous_state = instance.get_previous_state()
+    tag_ids = list(instance.tags.values_list('id', flat=True))
+    instance._deleted_tag_ids = tag_ids
+
+    stats.update_category_counts({
+        previous_state.get('category_id', instance.category_id): -1
+    })
+    stats.update_tag_counts({tag_id: -1 for tag_id in tag_ids})
+
+
+@receiver(pre_delete, sender=Post)
+def post_delete_author_counted(sender, instance, **kwargs):
+    '''
+    Take a post being deleted out of its author's stats (views count
+    every post of the author, public or not).
+    '''
+    posts_count = -1 if instance.was_public else 0
+    if posts_count or instance.views:
+        stats.update_author_counts(
+            instance.get_previous_state().get('user_id', instance.user_id),
+            posts_count=posts_count,
+            views_count=-instance.views
+        )
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    if not instance.was_public:
+        return
+    previous_user_id = instance.get_previous_state().get(
+        'user_id', instance.user_id
+    )
+    # Once the post is gone
+    stats.refresh_last_published_at(previous_user_id)
+    tag_ids = getattr(instance, '_deleted_tag_ids', [])
+    refresh_widgets(
+        widgets.TOP_AUTHORS,
+        widgets.TOP_TAGS,
+        widgets.author_posts_key(previous_user_id)
+    )
+    search.schedule_update([instance.pk])
+    # Tag pages show the count of their posts
+    page_cache.purge(*[f'tag-posts:{tag_id}' for tag_id in tag_ids])
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_pages_purged(sender, instance, created=False, **kwargs):
+    '''
+    Purge cached pages rendering a public post, and the post lists it
+    enters. Lists it leaves render it, so they are purged with it.
+    '''
+    was_public, is_public = instance.was_public, instance.is_public
+    if not (was_public or is_public):
+        return
+    tags = [f'post:{instance.pk}']
+
+    previous_category_id = instance.get_previous_state().get(
+        'category_id', instance.category_id
+    )
+    if is_public and (
+        not was_public or previous_category_id != instance.category_id
+    ):
+        tags += ['posts', f'category-posts:{instance.category_id}']
+
+    # Tag pages show the count of their posts. New posts get their tags
+    # afterwards (m2m_changed).
+    if was_public != is_public and not created:
+        tags += [
+            f'tag-posts:{tag_id}'
+            for tag_id in instance.tags.values_list('id', flat=True)
+        ]
+    page_cache.purge(*tags)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tags_counted(sender, instance, action, reverse, pk_set, **kwargs):
+    '''
+    Move tag stats by the public posts being (un)tagged. Removals are
+    counted before rows go, to only count the links that existed.
+    '''
+    if action not in ['post_add', 'pre_remove', 'pre_clear']:
+        return
+    delta = 1 if action == 'post_add' else -1
+
+    if reverse:
+        if action == 'post_add':
+            posts = Post.objects.filter(pk__in=pk_set)
+        elif action == 'pre_remove':
+            posts = instance.posts.filter(pk__in=pk_set)
+        else:
+            posts = instance.posts.all()
+        posts_count = stats.count_public(posts)
+        stats.update_tag_counts({instance.pk: delta * posts_count})
+    elif instance.is_public:
+        if action == 'post_add':
+            tag_ids = pk_set
+        elif action == 'pre_remove':
+            tag_ids = instance.tags.filter(pk__in=pk_set).values_list(
+                'id', flat=True
+            )
+        else:
+            tag_ids = instance.tags.values_list('id', flat=True)
+        stats.update_tag_counts({tag_id: delta for tag_id in tag_ids})
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # The cleared posts are unknown afterwards
+        search.schedule_update(instance.posts.values_list('id', flat=True))
+    if action not in ['post_add', 'post_remove', 'post_clear']:
+        return
+    if reverse:
+        refresh_widgets(widgets.TOP_TAGS)
+        if pk_set:
+            search.schedule_update(pk_set)
+    elif instance.is_public:
+        refresh_widgets(widgets.TOP_TAGS)
+        search.schedule_update([instance.pk])
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tags_pages_purged(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    '''
+    Purge cached pages of the (un)tagged posts and of their tags.
+    '''
+    if action not in ['post_add', 'pre_remove', 'pre_clear']:
+        return
+    if reverse:
+        if action == 'pre_clear':
+            pk_set = instance.posts.values_list('id', flat=True)
+        page_cache.purge(
+            f'tag-posts:{instance.pk}',
+            *[f'post:{post_id}' for post_id in pk_set]
+        )
+    elif instance.is_public:
+        if action == 'pre_clear':
+            pk_set = instance.tags.values_list('id', flat=True)
+        page_cache.purge(
+            f'post:{instance.pk}',
+            *[f'tag-posts:{tag_id}' for tag_id in pk_set]
+        )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, instance, created=True, **kwargs):
+    refresh_widgets(widgets.TOP_TAGS)
+    page_cache.purge(f'tag:{instance.pk}')
+    if created:
+        sampling.tags.invalidate()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def tag_search_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        search.schedule_update(instance.posts.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    transaction.on_commit(bump_categories_version)
+    page_cache.purge('categories', f'category:{instance.pk}')
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    if not created:
+        search.schedule_update(instance.posts.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # New users have no posts yet
+    if created:
+        return
+    # Posts only show names (last_login updates, password changes, ...)
+    changed_fields = instance.get_changed_fields()
+    if update_fields:
+        changed_fields &= set(update_fields)
+    if not changed_fields:
+        return
+    refresh_widgets(widgets.TOP_AUTHORS)
+    search.schedule_update(instance.posts.values_list('id', flat=True))
+    page_cache.purge(f'author:{instance.pk}')
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    bump_version(instance.post_id)
+    page_cache.purge(f'post:{instance.post_id}')
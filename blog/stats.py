@@ -0,0 +1,193 @@
+'''
+Published posts counts of tags, categories and authors.
+
+Counts are moved by deltas from post and post tags changes in the
+transaction of the change (see `blog.signals`), so reading them is an
+indexed lookup instead of a `Count()` over the tag/post relation.
+`repair()` (`manage.py repair_taxonomy_stats`) and `repair_authors()`
+(`manage.py repair_author_stats`) recompute them in bulk.
+'''
+from django.db import connection, transaction
+
+from blog.models import (
+    AuthorStat,
+    Category,
+    CategoryStat,
+    Post,
+    Tag,
+    TagStat
+)
+
+TAG_WEIGHT_LEVELS = 10
+
+
+def tag_weight_sql(posts_count):
+    '''
+    SQL of the tag cloud weight of `posts_count` posts: one level per
+    doubling, so a few very popular tags don't flatten the cloud.
+    '''
+    return (
+        f'LEAST({TAG_WEIGHT_LEVELS}, '
+        f'FLOOR(LOG(2, GREATEST({posts_count}, 0) + 1)))::smallint'
+    )
+
+
+def update_tag_counts(deltas):
+    '''
+    Add `{tag_id: delta}` to tag counts.
+    '''
+    table = TagStat._meta.db_table
+    posts_count = f'{table}.posts_count + EXCLUDED.posts_count'
+    execute_deltas(f'''
+        INSERT INTO {table} (tag_id, posts_count, weight)
+        SELECT delta.id, delta.count, {tag_weight_sql('delta.count')}
+        FROM unnest(%s::bigint[], %s::integer[]) AS delta(id, count)
+        ORDER BY delta.id
+        ON CONFLICT (tag_id) DO UPDATE
+        SET posts_count = {posts_count},
+            weight = {tag_weight_sql(posts_count)}
+    ''', deltas)
+
+
+def update_category_counts(deltas):
+    '''
+    Add `{category_id: delta}` to category counts.
+    '''
+    table = CategoryStat._meta.db_table
+    execute_deltas(f'''
+        INSERT INTO {table} (category_id, posts_count)
+        SELECT delta.id, delta.count
+        FROM unnest(%s::bigint[], %s::integer[]) AS delta(id, count)
+        ORDER BY delta.id
+        ON CONFLICT (category_id) DO UPDATE
+        SET posts_count = {table}.posts_count + EXCLUDED.posts_count
+    ''', deltas)
+
+
+def execute_deltas(sql, deltas):
+    # Sorted ids lock rows in the same order in concurrent transactions
+    ids = sorted(pk for pk, delta in deltas.items() if delta)
+    if ids:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [ids, [deltas[pk] for pk in ids]])
+
+
+def update_author_counts(
+    user_id, posts_count=0, views_count=0, published_at=None
+):
+    '''
+    Add to the counters of an author, moving `last_published_at` forward
+    to `published_at`.
+    '''
+    table = AuthorStat._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            INSERT INTO {table}
+                (user_id, posts_count, views_count, last_published_at)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (user_id) DO UPDATE
+            SET posts_count = {table}.posts_count + EXCLUDED.posts_count,
+                views_count = {table}.views_count + EXCLUDED.views_count,
+                last_published_at = GREATEST(
+                    {table}.last_published_at, EXCLUDED.last_published_at
+                )
+        ''', [user_id, posts_count, views_count, published_at])
+
+
+def refresh_last_published_at(user_id):
+    '''
+    Recompute `last_published_at` of an author after a post left the
+    public posts (an index range over the author's posts).
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            UPDATE {AuthorStat._meta.db_table}
+            SET last_published_at = (
+                SELECT MAX(created_at)
+                FROM {Post._meta.db_table}
+                WHERE user_id = %s AND status = %s AND is_active
+            )
+            WHERE user_id = %s
+        ''', [user_id, Post.POST_STATUS_PUBLISHED, user_id])
+
+
+def count_public(posts):
+    return posts.filter(
+        status=Post.POST_STATUS_PUBLISHED,
+        is_active=True
+    ).count()
+
+
+def repair():
+    '''
+    Recompute every tag and category count from posts.
+
+    Stat tables are locked first, so transactions moving counts
+    meanwhile either commit before the recount or apply their deltas on
+    top of it.
+    '''
+    tag_table = TagStat._meta.db_table
+    category_table = CategoryStat._meta.db_table
+    public = [Post.POST_STATUS_PUBLISHED]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'LOCK TABLE {tag_table}, {category_table} IN EXCLUSIVE MODE'
+        )
+        cursor.execute(f'''
+            INSERT INTO {tag_table} (tag_id, posts_count, weight)
+            SELECT tag.id, COUNT(post.id), {tag_weight_sql('COUNT(post.id)')}
+            FROM {Tag._meta.db_table} AS tag
+            LEFT JOIN {Post.tags.through._meta.db_table} AS post_tag
+                ON post_tag.tag_id = tag.id
+            LEFT JOIN {Post._meta.db_table} AS post
+                ON post.id = post_tag.post_id
+                AND post.status = %s AND post.is_active
+            GROUP BY tag.id
+            ON CONFLICT (tag_id) DO UPDATE
+            SET posts_count = EXCLUDED.posts_count,
+                weight = EXCLUDED.weight
+        ''', public)
+        cursor.execute(f'''
+            INSERT INTO {category_table} (category_id, posts_count)
+            SELECT category.id, COUNT(post.id)
+            FROM {Category._meta.db_table} AS category
+            LEFT JOIN {Post._meta.db_table} AS post
+                ON post.category_id = category.id
+                AND post.status = %s AND post.is_active
+            GROUP BY category.id
+            ON CONFLICT (category_id) DO UPDATE
+            SET posts_count = EXCLUDED.posts_count
+        ''', public)
+
+
+def repair_authors():
+    '''
+    Recompute the counters of every author from posts.
+    '''
+    table = AuthorStat._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {table} IN EXCLUSIVE MODE')
+        cursor.execute(f'''
+            INSERT INTO {table}
+                (user_id, posts_count, views_count, last_published_at)
+            SELECT
+                user_id,
+                COUNT(*) FILTER (WHERE status = %s AND is_active),
+                SUM(views),
+                MAX(created_at) FILTER (WHERE status = %s AND is_active)
+            FROM {Post._meta.db_table}
+            GROUP BY user_id
+            ON CONFLICT (user_id) DO UPDATE
+            SET posts_count = EXCLUDED.posts_count,
+                views_count = EXCLUDED.views_count,
+                last_published_at = EXCLUDED.last_published_at
+        ''', [Post.POST_STATUS_PUBLISHED] * 2)
+        # Authors whose posts are all gone
+        cursor.execute(f'''
+            UPDATE {table} AS stat
+            SET posts_count = 0, views_count = 0, last_published_at = NULL
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {Post._meta.db_table} AS post
+                WHERE post.user_id = stat.user_id
+            )
+        ''')
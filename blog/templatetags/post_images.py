@@ -0,0 +1,19 @@
+from django import template
+
+from blog.images import get_picture
+
+register = template.Library()
+
+
+@register.inclusion_tag('blog/includes/post_image.html')
+def post_image(post, use, css_class='', lazy=True):
+    '''
+    Responsive `<picture>` of a post image for a use (`card`, `detail`),
+    the original image until its variants are rendered.
+    '''
+    return {
+        'post': post,
+        'picture': get_picture(post.image_variants, use),
+        'css_class': css_class,
+        'lazy': lazy
+    }
@@ -0,0 +1,895 @@
+import datetime
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from blog import (
+    categories,
+    comments,
+    counters,
+    imaging,
+    images,
+    sampling,
+    search,
+    stats,
+    trending,
+    widgets
+)
+from blog.models import (
+    AuthorStat,
+    Bookmark,
+    Category,
+    CategoryStat,
+    Comment,
+    Like,
+    Post,
+    PostCounterDelta,
+    PostViewBucket,
+    Tag,
+    TagStat
+)
+from blog.pagination import InvalidCursor, KeysetPaginator, encode_cursor
+from blog.search.analysis import analyze, tokenize
+from blog.search import index
+from blog.search.index import SearchIndex
+from blog.search.segment import Segment, write_segment
+from core.testing import (
+    QueryBudgetTestCase,
+    create_comment,
+    create_post,
+    create_tag
+)
+
+
+class PublicViewQueryBudgetTests(QueryBudgetTestCase):
+    def test_post_detail(self):
+        response = self.assertQueryBudget(self.post.get_absolute_url(), 4)
+        self.assertEqual(response.context['post'], self.post)
+        self.assertContains(response, self.post.title)
+        response = self.assertQueryBudget(
+            self.post.get_absolute_url(), 9, user=self.reader
+        )
+        self.assertTrue(response.context['is_bookmarked'])
+        self.assertTrue(response.context['is_liked'])
+
+    def test_category_post_list(self):
+        response = self.assertQueryBudget(self.category.get_absolute_url(), 3)
+        posts = response.context['posts']
+        self.assertEqual(len(posts), 9)
+        self.assertTrue(
+            all(post.category_id == self.category.pk for post in posts)
+        )
+        self.assertQueryBudget(
+            self.category.get_absolute_url(), 8, user=self.reader
+        )
+
+    def test_tag_post_list(self):
+        url = reverse('blog:tag-post-list', args=[self.tag.slug])
+        response = self.assertQueryBudget(url, 5)
+        posts = response.context['tag_posts']
+        self.assertEqual(len(posts), 6)
+        self.assertTrue(all(self.tag in post.tags.all() for post in posts))
+        self.assertQueryBudget(url, 10, user=self.reader)
+
+    def test_user_post_list(self):
+        url = reverse('blog:user-post-list', args=[self.author.username])
+        response = self.assertQueryBudget(url, 4)
+        posts = response.context['user_posts']
+        self.assertEqual(len(posts), 6)
+        self.assertTrue(all(post.user_id == self.author.pk for post in posts))
+        self.assertQueryBudget(url, 9, user=self.reader)
+
+    def test_search_post_list(self):
+        url = reverse('blog:search-post-list')
+        response = self.assertQueryBudget(url, 4, data={'q': 'post'})
+        self.assertEqual(len(response.context['posts']), 9)
+        self.assertQueryBudget(
+            url, 5, data={'q': 'post', 'category': self.category.slug}
+        )
+        response = self.assertQueryBudget(
+            url, 3, data={'tag': self.tag.slug}
+        )
+        self.assertTrue(all(
+            self.tag in post.tags.all() for post in response.context['posts']
+        ))
+
+
+class ConditionalGetTests(QueryBudgetTestCase):
+    def get(self, url, **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(url, **extra)
+
+    def assertNotModified(self, url):
+        etag = self.get(url)['ETag']
+        response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def test_post_list(self):
+        url = self.category.get_absolute_url()
+        response = self.get(url)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+        etag = self.assertNotModified(url)
+
+        # Counters are applied without touching updated_at
+        counters.post_views.incr(self.post.pk)
+        counters.post_views.flush(force_apply=True)
+        self.assertNotEqual(self.assertNotModified(url), etag)
+
+    def test_post_list_navigation(self):
+        url = reverse('blog:tag-post-list', args=[self.tag.slug])
+        etag = self.assertNotModified(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(title='Sports', slug='sports')
+        self.assertNotEqual(self.assertNotModified(url), etag)
+
+    def test_post_detail(self):
+        url = self.post.get_absolute_url()
+        response = self.get(url)
+        self.assertFalse(response.has_header('Last-Modified'))
+        etag = self.assertNotModified(url)
+
+        counters.post_likes.incr(self.post.pk)
+        counters.post_likes.flush(force_apply=True)
+        etag, previous = self.assertNotModified(url), etag
+        self.assertNotEqual(etag, previous)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            widgets.refresh_many([widgets.TOP_TAGS])
+        self.assertNotEqual(self.assertNotModified(url), etag)
+
+
+class UserViewQueryBudgetTests(QueryBudgetTestCase):
+    def test_bookmarks(self):
+        response = self.assertQueryBudget(
+            reverse('blog:bookmarks'), 7, user=self.reader
+        )
+        self.assertEqual(response.context['posts_count'], 13)
+        self.assertEqual(len(response.context['posts']), 9)
+
+    def test_liked_posts(self):
+        response = self.assertQueryBudget(
+            reverse('blog:liked-posts'), 7, user=self.reader
+        )
+        self.assertEqual(response.context['posts_count'], 13)
+        self.assertEqual(len(response.context['posts']), 9)
+
+    def test_my_post_list(self):
+        response = self.assertQueryBudget(
+            reverse('blog:my-post-list'), 7, user=self.author
+        )
+        self.assertEqual(response.context['posts_count'], 14)
+
+    def test_post_create(self):
+        response = self.assertQueryBudget(
+            reverse('blog:post-create'), 6, user=self.author
+        )
+        self.assertFalse(response.context['form'].is_bound)
+
+    def test_post_update(self):
+        response = self.assertQueryBudget(
+            reverse('blog:post-update', args=[self.post.slug]),
+            10,
+            user=self.author
+        )
+        self.assertEqual(response.context['form'].instance, self.post)
+
+    def test_post_delete(self):
+        response = self.assertQueryBudget(
+            reverse('blog:post-delete', args=[self.post.slug]),
+            7,
+            user=self.author
+        )
+        self.assertEqual(response.context['object'], self.post)
+
+    def test_bookmark_post(self):
+        # Sent four times: removed, added, removed and added again
+        response = self.assertQueryBudget(
+            reverse('blog:bookmark-post'),
+            3,
+            user=self.reader,
+            method='post',
+            data={'postPk': self.post.pk},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.json()['message'], 'bookmarked')
+        self.assertTrue(
+            Bookmark.objects.filter(user=self.reader, post=self.post).exists()
+        )
+
+    def test_like_post(self):
+        response = self.assertQueryBudget(
+            reverse('blog:like-post'),
+            3,
+            user=self.reader,
+            method='post',
+            data={'postPk': self.post.pk, 'liked': 'true'},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        # Already liked by the seed
+        self.assertFalse(response.json()['changed'])
+        self.assertEqual(counters.post_likes.pending(self.post.pk), 0)
+
+    def test_comment_create(self):
+        url = reverse('blog:comment-create', args=[self.post.slug])
+        response = self.assertQueryBudget(
+            url,
+            7,
+            user=self.reader,
+            method='post',
+            data={'content': 'Nice post'},
+            status=302
+        )
+        self.assertEqual(response.url, self.post.get_absolute_url())
+        self.assertEqual(
+            Comment.objects.filter(
+                post=self.post, user=self.reader, content='Nice post'
+            ).count(),
+            4
+        )
+
+
+class PostImageTests(QueryBudgetTestCase):
+    def test_variants(self):
+        self.post.refresh_from_db()
+        variants = self.post.image_variants
+        self.assertEqual(variants['source'], self.post.image.name)
+        self.assertTrue(variants['placeholder'].startswith('data:image/'))
+
+        response = self.client.get(self.post.get_absolute_url())
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, 'type="image/webp"')
+
+    def test_too_large(self):
+        with self.assertRaises(imaging.ImageTooLarge):
+            imaging.render(
+                self.post.image.read(), images.get_widths(), max_pixels=100
+            )
+
+
+class LikeTests(QueryBudgetTestCase):
+    def like(self, liked):
+        self.client.force_login(self.author)
+        return self.client.post(
+            reverse('blog:like-post'),
+            {'postPk': self.post.pk, 'liked': 'true' if liked else 'false'},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        ).json()
+
+    def test_repeated_requests(self):
+        self.assertTrue(self.like(True)['changed'])
+        self.assertFalse(self.like(True)['changed'])
+        self.assertEqual(counters.post_likes.pending(self.post.pk), 1)
+
+        self.assertTrue(self.like(False)['changed'])
+        self.assertFalse(self.like(False)['changed'])
+        self.assertEqual(counters.post_likes.pending(self.post.pk), 0)
+        self.assertFalse(
+            Like.objects.filter(user=self.author, post=self.post).exists()
+        )
+
+    def test_liked_posts(self):
+        self.like(True)
+        response = self.client.get(reverse('blog:liked-posts'))
+        self.assertEqual(list(response.context['posts']), [self.post])
+        self.assertEqual(response.context['posts_count'], 1)
+        self.assertContains(response, '1 Post')
+
+    def test_draft(self):
+        draft = create_post(
+            self.author, self.category, status=Post.POST_STATUS_DRAFT
+        )
+        self.assertIsNone(Like.objects.set(self.reader, draft.pk, True))
+
+
+class BufferedCounterTests(QueryBudgetTestCase):
+    def test_apply(self):
+        self.post.refresh_from_db()
+        updated_at = self.post.updated_at
+        counters.post_views.incr(self.post.pk, 3)
+        counters.post_views.incr(self.post.pk, 2)
+        self.assertEqual(counters.post_views.pending(self.post.pk), 5)
+
+        applied = counters.post_views.flush(force_apply=True)
+        self.assertEqual(applied, {self.post.pk: 5})
+        self.assertEqual(counters.post_views.pending(self.post.pk), 0)
+        self.assertFalse(PostCounterDelta.objects.exists())
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views, 5)
+        self.assertEqual(self.post.updated_at, updated_at)
+        self.assertEqual(
+            AuthorStat.objects.get(user=self.author).views_count, 5
+        )
+        self.assertEqual(
+            PostViewBucket.objects.get(post=self.post).views, 5
+        )
+
+    def test_spill_then_apply(self):
+        counters.post_likes.incr(self.post.pk)
+        counters.post_likes.flush()
+        counters.post_likes.incr(self.post.pk)
+        counters.post_likes.flush()
+        self.assertEqual(PostCounterDelta.objects.count(), 2)
+
+        applied = counters.post_likes.apply()
+        self.assertEqual(applied, {self.post.pk: 2})
+        self.assertEqual(
+            Post.objects.get(pk=self.post.pk).likes_count, 2
+        )
+
+    def test_apply_below_zero(self):
+        # An unlike whose like was lost
+        post = create_post(self.author, self.category)
+        counters.post_likes.incr(post.pk, -1)
+        counters.post_likes.flush(force_apply=True)
+        self.assertEqual(Post.objects.get(pk=post.pk).likes_count, 0)
+        self.assertFalse(PostCounterDelta.objects.exists())
+
+        counters.post_likes.incr(post.pk)
+        self.assertEqual(
+            counters.post_likes.flush(force_apply=True), {post.pk: 1}
+        )
+        self.assertEqual(Post.objects.get(pk=post.pk).likes_count, 1)
+
+    @override_settings(BLOG_COUNTER_MAX_PENDING=1)
+    def test_failed_spill(self):
+        with mock.patch.object(
+            counters.post_views, 'spill', side_effect=DatabaseError
+        ), self.assertLogs('blog.counters', 'ERROR'):
+            counters.post_views.incr(self.post.pk)
+        # Kept for the next spill
+        self.assertEqual(counters.post_views.pending(self.post.pk), 1)
+
+        counters.post_views.incr(self.post.pk)
+        self.assertEqual(counters.post_views.pending(self.post.pk), 0)
+        self.assertEqual(
+            PostCounterDelta.objects.get(post=self.post).delta, 2
+        )
+
+    def test_flush_due(self):
+        counters.post_views.incr(self.post.pk)
+        counters.flush_due()
+        self.assertEqual(counters.post_views.pending(self.post.pk), 1)
+
+        with override_settings(BLOG_COUNTER_FLUSH_INTERVAL=0):
+            counters.flush_due()
+        self.assertEqual(counters.post_views.pending(self.post.pk), 0)
+        self.assertTrue(PostCounterDelta.objects.exists())
+
+        with override_settings(BLOG_COUNTER_APPLY_INTERVAL=0):
+            counters.flush_due()
+        self.assertFalse(PostCounterDelta.objects.exists())
+        self.assertEqual(Post.objects.get(pk=self.post.pk).views, 1)
+
+    @override_settings(
+        BLOG_COUNTER_MAX_PENDING=1, BLOG_COUNTER_APPLY_INTERVAL=0
+    )
+    def test_incr_only_spills(self):
+        counters.post_views.incr(self.post.pk)
+        self.assertEqual(counters.post_views.pending(self.post.pk), 0)
+        # Applied by the flusher thread (or command) only
+        self.assertTrue(PostCounterDelta.objects.exists())
+        self.assertEqual(Post.objects.get(pk=self.post.pk).views, 0)
+
+    def test_displayed_count(self):
+        url = self.post.get_absolute_url()
+        views = Post.objects.get(pk=self.post.pk).views
+        response = self.client.get(url)
+        self.assertEqual(response.context['post_views_count'], views + 1)
+
+        # Spilled, then spilled by another process
+        counters.post_views.flush()
+        PostCounterDelta.objects.create(
+            post=self.post, field='views', delta=5
+        )
+        response = self.client.get(url)
+        self.assertEqual(response.context['post_views_count'], views + 7)
+
+        counters.post_views.flush(force_apply=True)
+        response = self.client.get(url)
+        self.assertEqual(response.context['post_views_count'], views + 8)
+
+
+class TrendingTests(QueryBudgetTestCase):
+    def add_views(self, post, hours_ago, views):
+        PostViewBucket.objects.create(
+            post=post,
+            hour=self.now - datetime.timedelta(hours=hours_ago),
+            views=views
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        self.old, self.recent, self.hourly = [
+            create_post(self.author, self.category) for _ in range(3)
+        ]
+        # Halved every 24 hours: 100 -> 25, 40 -> 40, 30 -> ~29
+        self.add_views(self.old, 48, 100)
+        self.add_views(self.recent, 0, 40)
+        self.add_views(self.hourly, 1, 30)
+        # Out of the window
+        self.add_views(self.post, 24 * 7 + 1, 10000)
+
+    def test_compute_trending(self):
+        ranking = trending.compute_trending(self.now)
+        self.assertEqual(
+            [post_id for post_id, score in ranking],
+            [self.recent.pk, self.hourly.pk, self.old.pk]
+        )
+        self.assertAlmostEqual(ranking[2][1], 25)
+
+        self.recent.status = Post.POST_STATUS_DRAFT
+        self.recent.save()
+        self.assertNotIn(
+            self.recent.pk,
+            [post_id for post_id, score in trending.compute_trending(self.now)]
+        )
+
+    def test_refresh(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            data = trending.refresh()
+        self.assertEqual(
+            trending.get_ids(data),
+            [self.recent.pk, self.hourly.pk, self.old.pk]
+        )
+        # Buckets out of the window are dropped
+        self.assertFalse(
+            PostViewBucket.objects.filter(post=self.post).exists()
+        )
+        self.assertEqual(
+            trending.get_trending_post_ids(), trending.get_ids(data)
+        )
+
+    def test_refresh_lock(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            trending.refresh()
+        self.add_views(self.post, 0, 1000)
+        with override_settings(BLOG_TRENDING_REFRESH_INTERVAL=0):
+            # Another process is refreshing: the stored ranking is read
+            cache.add(trending.REFRESH_LOCK_KEY, True)
+            self.assertNotIn(self.post.pk, trending.get_trending_post_ids())
+            cache.delete(trending.REFRESH_LOCK_KEY)
+            with self.captureOnCommitCallbacks(execute=True):
+                post_ids = trending.get_trending_post_ids()
+        self.assertEqual(post_ids[0], self.post.pk)
+
+    def test_spill_hour(self):
+        # Views spilled 3 hours ago are counted in that hour's bucket
+        PostCounterDelta.objects.create(
+            post=self.post,
+            field='views',
+            delta=5,
+            spilled_at=self.now - datetime.timedelta(hours=3, minutes=-5)
+        )
+        counters.post_views.apply()
+        self.assertEqual(
+            PostViewBucket.objects.get(
+                post=self.post, hour=self.now - datetime.timedelta(hours=3)
+            ).views,
+            5
+        )
+
+
+class CommentTreeTests(QueryBudgetTestCase):
+    def test_version_bumped_on_commit(self):
+        self.assertEqual(comments.get_comment_tree(self.post)['count'], 2)
+        version = comments.get_version(self.post.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_comment(self.post, self.reader)
+            # A concurrent render would still see the previous comments
+            self.assertEqual(comments.get_version(self.post.pk), version)
+        self.assertGreater(comments.get_version(self.post.pk), version)
+        self.assertEqual(comments.get_comment_tree(self.post)['count'], 3)
+
+
+def make_doc(post_id, title='', content='', category_id=1, tag_ids=()):
+    frequencies, length = analyze({'title': title, 'content': content})
+    return post_id, frequencies, length, category_id, list(tag_ids)
+
+
+class SearchIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.index = SearchIndex(self.path, refresh_interval=0)
+
+    def search(self, query, **filters):
+        hits, categories, tags = self.index.search(query, **filters)
+        return [post_id for post_id, score in hits]
+
+    def test_tokenize(self):
+        self.assertEqual(
+            tokenize('The Django, and PYTHON tips!'),
+            ['django', 'python', 'tips']
+        )
+        self.assertEqual(
+            analyze({'title': 'Django', 'content': 'Django tips'}),
+            ({'django': 4, 'tips': 1}, 5)
+        )
+
+    def test_segment(self):
+        path = f'{self.path}/test.seg'
+        write_segment(
+            path,
+            [
+                make_doc(7, 'Python', 'tips', tag_ids=[3, 2]),
+                make_doc(5, 'Django', 'python', category_id=2)
+            ],
+            superseded=[9]
+        )
+        segment = Segment(path)
+        self.assertEqual(list(segment.post_ids), [5, 7])
+        self.assertEqual(list(segment.superseded), [5, 7, 9])
+        self.assertEqual(list(segment.category_ids), [2, 1])
+        self.assertEqual(list(segment.get_tag_ids(1)), [2, 3])
+        self.assertEqual(segment.find_doc(7), 1)
+        self.assertEqual(segment.find_doc(6), -1)
+        self.assertEqual(segment.find_term('missing'), -1)
+        # (doc index, frequency) pairs
+        postings = segment.get_postings(segment.find_term('python'))
+        self.assertEqual(list(postings), [0, 1, 1, 3])
+        self.assertEqual(segment.find_prefix('py'), ['python'])
+
+    def test_ranking(self):
+        self.index.write([
+            make_doc(1, content='django ' + 'filler ' * 20),
+            make_doc(2, title='Django'),
+            make_doc(3, title='Django', content='python'),
+            make_doc(4, title='Python')
+        ])
+        # Title matches first, shorter documents first
+        self.assertEqual(self.search('django'), [2, 3, 1])
+        # Documents matching every word first
+        self.assertEqual(self.search('django python')[0], 3)
+        # Phrases are matched by their words (segments have no positions)
+        self.assertEqual(
+            self.search('"python django"'), self.search('django python')
+        )
+
+    def test_prefix(self):
+        self.index.write([
+            make_doc(1, title='Django'),
+            make_doc(2, title='Djangonaut'),
+            make_doc(3, title='Python')
+        ])
+        self.assertEqual(sorted(self.search('djan')), [1, 2])
+        self.assertEqual(sorted(self.search('python djangon')), [2, 3])
+        # A completed word isn't expanded
+        self.assertEqual(self.search('djan '), [])
+
+    def test_deleted(self):
+        self.index.write([
+            make_doc(1, title='Django'),
+            make_doc(2, title='Django'),
+            make_doc(3, title='Django')
+        ])
+        # Post 1 updated, post 2 not public anymore
+        self.index.write([make_doc(1, title='Python')], superseded=[2])
+        self.assertEqual(self.search('django'), [3])
+        self.assertEqual(self.search('python'), [1])
+
+        self.index.merge_factor = 2
+        self.assertEqual(self.index.compact(), 1)
+        self.assertEqual(len(self.index.list_segment_names()), 1)
+        self.assertEqual(self.search('django'), [3])
+
+    def test_compact(self):
+        self.index.merge_factor = 2
+        self.index.write([make_doc(1, title='Django')], base=True)
+        for post_id in range(2, 6):
+            self.index.write([make_doc(post_id, title='Django')])
+        # Two level 0 pairs merged, then the level 1 pair
+        self.assertEqual(self.index.compact(), 3)
+        names = self.index.list_segment_names()
+        self.assertEqual(
+            [index.get_level(name) for name in names], [None, 2]
+        )
+
+        # A merged segment isn't merged again with the next updates
+        self.index.write([make_doc(3, title='Python')])
+        self.assertEqual(self.index.compact(), 0)
+        self.assertEqual(sorted(self.search('django')), [1, 2, 4, 5])
+        self.assertEqual(self.search('python'), [3])
+
+        self.index.write([make_doc(6, title='Django')])
+        self.index.compact()
+        self.assertEqual(
+            [
+                index.get_level(name)
+                for name in self.index.list_segment_names()
+            ],
+            [None, 2, 1]
+        )
+        self.assertEqual(self.search('python'), [3])
+
+    def test_compact_locked(self):
+        self.index.merge_factor = 2
+        self.index.write([make_doc(1, title='Django')])
+        self.index.write([make_doc(2, title='Django')])
+        other = SearchIndex(self.path, merge_factor=2)
+        with other.lock():
+            self.assertIsNone(self.index.compact())
+        self.assertEqual(self.index.compact(), 1)
+
+    def test_facets(self):
+        self.index.write([
+            make_doc(1, title='Django', category_id=1, tag_ids=[1]),
+            make_doc(2, title='Django', category_id=2, tag_ids=[1, 2]),
+            make_doc(3, title='Python', category_id=2)
+        ])
+        hits, categories, tags = self.index.search('django', category_id=2)
+        self.assertEqual([post_id for post_id, score in hits], [2])
+        # Categories count results of every category
+        self.assertEqual(categories, {1: 1, 2: 1})
+        self.assertEqual(tags, {1: 1, 2: 1})
+
+    def test_stop_words(self):
+        self.index.write([make_doc(1, title='The Django')])
+        self.assertEqual(self.search('the'), [])
+
+
+class SearchViewTests(QueryBudgetTestCase):
+    def test_search(self):
+        response = self.client.get(
+            reverse('blog:search-post-list'), {'q': self.post.title}
+        )
+        self.assertEqual(response.context['posts'][0], self.post)
+
+    def test_stop_words(self):
+        response = self.client.get(
+            reverse('blog:search-post-list'), {'q': 'the and'}
+        )
+        self.assertTrue(response.context['too_generic'])
+        self.assertContains(response, 'is too generic to search')
+        # The latest posts instead
+        self.assertEqual(response.context['posts_count'], 2)
+
+
+class KeysetPaginatorTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        for _ in range(5):
+            create_post(self.author, self.category)
+        # Ties on the first ordering field
+        Post.objects.update(created_at=timezone.now())
+        self.posts = list(Post.objects.order_by('-created_at', '-id'))
+        self.paginator = KeysetPaginator(
+            Post.objects.all(), 3, ['-created_at', '-id']
+        )
+
+    def test_pages(self):
+        first = self.paginator.page()
+        self.assertEqual(list(first), self.posts[:3])
+        self.assertEqual(first.number, 1)
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+
+        second = self.paginator.page(
+            after=self.paginator.get_cursor(first.object_list[-1]), number=2
+        )
+        self.assertEqual(list(second), self.posts[3:6])
+        last = self.paginator.page(
+            after=self.paginator.get_cursor(second.object_list[-1]), number=3
+        )
+        self.assertEqual(list(last), self.posts[6:])
+        self.assertFalse(last.has_next())
+
+        previous = self.paginator.page(
+            before=self.paginator.get_cursor(last.object_list[0]), number=2
+        )
+        self.assertEqual(list(previous), self.posts[3:6])
+        self.assertEqual(previous.number, 2)
+        self.assertTrue(previous.has_previous())
+        # Short of a full page before: the first page
+        start = self.paginator.page(
+            before=self.paginator.get_cursor(self.posts[1]), number=1
+        )
+        self.assertEqual(list(start), self.posts[:3])
+        self.assertFalse(start.has_previous())
+
+    def test_invalid_cursor(self):
+        created_at = self.posts[0].created_at.isoformat()
+        for cursor in [
+            'not a cursor!',
+            encode_cursor({'id': 1}),
+            encode_cursor([created_at]),
+            encode_cursor(['yesterday', 1]),
+            encode_cursor([created_at, '1 OR 1=1'])
+        ]:
+            with self.assertRaises(InvalidCursor):
+                self.paginator.page(after=cursor)
+
+        self.client.force_login(self.reader)
+        response = self.client.get(
+            reverse('blog:bookmarks'), {'after': 'not a cursor!'}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_bookmarks_count(self):
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('blog:bookmarks'))
+        self.assertEqual(response.context['posts_count'], 1)
+        self.assertContains(response, '1 Post')
+
+
+class CategoriesTests(QueryBudgetTestCase):
+    def get_titles(self):
+        return [category['title'] for category in categories.get_categories()]
+
+    def test_version(self):
+        self.assertEqual(self.get_titles(), ['News'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(title='Sports', slug='sports')
+        self.assertEqual(self.get_titles(), ['News', 'Sports'])
+
+    def test_max_age(self):
+        self.assertEqual(self.get_titles(), ['News'])
+        # Without signals
+        Category.objects.bulk_create([Category(title='Sports', slug='sports')])
+        self.assertEqual(self.get_titles(), ['News'])
+        with mock.patch('blog.categories.MAX_AGE', 0):
+            self.assertEqual(self.get_titles(), ['News', 'Sports'])
+
+    def test_version_check_interval(self):
+        self.assertEqual(self.get_titles(), ['News'])
+        # Changed by another process
+        Category.objects.bulk_create([Category(title='Sports', slug='sports')])
+        cache.incr(categories.VERSION_KEY)
+        with mock.patch(
+            'blog.categories.get_version', wraps=categories.get_version
+        ) as get_version:
+            self.assertEqual(self.get_titles(), ['News'])
+            get_version.assert_not_called()
+        with mock.patch('blog.categories.VERSION_CHECK_INTERVAL', 0):
+            self.assertEqual(self.get_titles(), ['News', 'Sports'])
+
+
+class SamplingTests(QueryBudgetTestCase):
+    def test_tags(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(4):
+                create_tag()
+        sample = sampling.tags.sample(3, exclude={self.tag.pk}, seed=1)
+        self.assertEqual(len({tag.pk for tag in sample}), 3)
+        self.assertNotIn(self.tag, sample)
+        self.assertEqual(
+            sampling.tags.sample(3, exclude={self.tag.pk}, seed=1), sample
+        )
+        # Every tag but the excluded one
+        self.assertEqual(
+            len(sampling.tags.sample(10, exclude={self.tag.pk})), 5
+        )
+
+    def test_tags_invalidated(self):
+        count = len(sampling.tags.sample(10))
+        # Without signals, ids are kept until the version is bumped
+        Tag.objects.bulk_create([Tag(name='New', slug='new')])
+        self.assertEqual(len(sampling.tags.sample(10)), count)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_tag()
+        self.assertEqual(len(sampling.tags.sample(10)), count + 2)
+
+    def test_posts(self):
+        draft = create_post(
+            self.author, self.category, status=Post.POST_STATUS_DRAFT
+        )
+        for _ in range(4):
+            create_post(self.author, self.category)
+        sample = sampling.public_posts.sample(
+            3, exclude={self.post.pk}, seed=1
+        )
+        self.assertEqual(len({post.pk for post in sample}), 3)
+        self.assertNotIn(self.post, sample)
+        self.assertEqual(
+            sampling.public_posts.sample(3, exclude={self.post.pk}, seed=1),
+            sample
+        )
+        # Draws landing on a draft take the next public post
+        sample = sampling.public_posts.sample(10)
+        self.assertNotIn(draft, sample)
+        self.assertTrue(all(post.is_public for post in sample))
+
+    def test_empty(self):
+        Post.objects.update(status=Post.POST_STATUS_DRAFT)
+        self.assertEqual(sampling.public_posts.sample(3), [])
+        Tag.objects.all().delete()
+        sampling.tags.bump_version()
+        self.assertEqual(sampling.tags.sample(3), [])
+
+
+class UserSavedTests(QueryBudgetTestCase):
+    def test_names_changed(self):
+        user = get_user_model().objects.get(pk=self.author.pk)
+        with mock.patch('blog.search.schedule_update') as schedule_update:
+            user.set_password('changed')
+            user.save()
+            user.last_login = timezone.now()
+            user.save()
+            schedule_update.assert_not_called()
+
+            user.first_name = 'Renamed'
+            user.save()
+            schedule_update.assert_called_once()
+            self.assertEqual(
+                sorted(schedule_update.call_args.args[0]),
+                sorted(user.posts.values_list('id', flat=True))
+            )
+
+            # Saved already
+            user.save()
+            schedule_update.assert_called_once()
+
+
+class StatsTests(QueryBudgetTestCase):
+    def get_counts(self):
+        return (
+            CategoryStat.objects.get(category=self.category).posts_count,
+            TagStat.objects.get(tag=self.tag).posts_count
+        )
+
+    def test_publish(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = create_post(
+                self.author, self.category, [self.tag],
+                status=Post.POST_STATUS_DRAFT
+            )
+        self.assertEqual(self.get_counts(), (2, 2))
+
+        post.status = Post.POST_STATUS_PUBLISHED
+        post.save()
+        self.assertEqual(self.get_counts(), (3, 3))
+        post.tags.remove(self.tag)
+        self.assertEqual(self.get_counts(), (3, 2))
+        # Deactivated
+        post.delete()
+        self.assertEqual(self.get_counts(), (2, 2))
+
+    def test_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = create_post(self.author, self.category, [self.tag])
+        self.assertEqual(self.get_counts(), (3, 3))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            # As the admin's bulk delete action does
+            Post.objects.filter(pk=post.pk).delete()
+        self.assertEqual(self.get_counts(), (2, 2))
+        top_tags = widgets.get_widgets(widgets.TOP_TAGS)[widgets.TOP_TAGS]
+        self.assertIn(
+            {'name': self.tag.name, 'posts_count': 2},
+            [
+                {'name': tag['name'], 'posts_count': tag['posts_count']}
+                for tag in top_tags
+            ]
+        )
+        self.assertNotIn(post.pk, search.search(post.title).post_ids)
+
+    def test_author_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = create_post(self.author, self.category, views=5)
+        Post.objects.filter(pk=self.post.pk).update(views=2)
+        stats.repair_authors()
+        stat = AuthorStat.objects.get(user=self.author)
+        self.assertEqual((stat.posts_count, stat.views_count), (3, 7))
+        self.assertEqual(stat.last_published_at, post.created_at)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.filter(pk=post.pk).delete()
+        stat.refresh_from_db()
+        self.assertEqual((stat.posts_count, stat.views_count), (2, 2))
+        self.assertLess(stat.last_published_at, post.created_at)
+        top_authors = widgets.get_widgets(
+            widgets.TOP_AUTHORS
+        )[widgets.TOP_AUTHORS]
+        self.assertEqual(top_authors[0]['posts_count'], 2)
@@ -0,0 +1,109 @@
+'''
+Trending posts.
+
+Applied post views are added to hourly `PostViewBucket` rows (see
+`blog.counters`). A post's trending score is the sum of its buckets over
+the last `BLOG_TRENDING_WINDOW` hours, each weighted by
+`2 ** -(age / BLOG_TRENDING_HALF_LIFE)`. The top `BLOG_TRENDING_SIZE`
+posts are stored as a `SidebarWidget` and recomputed at most every
+`BLOG_TRENDING_REFRESH_INTERVAL` seconds, so pages read a precomputed
+ranking.
+'''
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from blog.models import Post, PostViewBucket, SidebarWidget
+from core import page_cache
+
+TRENDING_POSTS = 'trending-posts'
+REFRESH_LOCK_KEY = 'blog:trending-refresh-lock'
+
+
+def get_setting(name, default):
+    return getattr(settings, f'BLOG_TRENDING_{name}', default)
+
+
+def compute_trending(now=None):
+    '''
+    Return `(post_id, score)` of the top public posts, best first.
+    '''
+    now = now or timezone.now()
+    window_start = now - datetime.timedelta(hours=get_setting('WINDOW', 168))
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            SELECT bucket.post_id, SUM(
+                bucket.views * POWER(
+                    2, -EXTRACT(EPOCH FROM %s - bucket.hour) / 3600 / %s
+                )
+            ) AS score
+            FROM {PostViewBucket._meta.db_table} AS bucket
+            JOIN {Post._meta.db_table} AS post ON post.id = bucket.post_id
+            WHERE bucket.hour >= %s
+                AND post.status = %s AND post.is_active
+            GROUP BY bucket.post_id
+            ORDER BY score DESC, bucket.post_id DESC
+            LIMIT %s
+        ''', [
+            now,
+            get_setting('HALF_LIFE', 24),
+            window_start,
+            Post.POST_STATUS_PUBLISHED,
+            get_setting('SIZE', 20)
+        ])
+        return [(post_id, float(score)) for post_id, score in cursor]
+
+
+def get_ids(data):
+    return [item['id'] for item in data]
+
+
+def refresh():
+    '''
+    Store the current ranking and drop buckets out of the window.
+    '''
+    now = timezone.now()
+    previous_data = SidebarWidget.objects \
+        .filter(key=TRENDING_POSTS) \
+        .values_list('data', flat=True) \
+        .first()
+    data = [
+        {'id': post_id, 'score': score}
+        for post_id, score in compute_trending(now)
+    ]
+    SidebarWidget.objects.update_or_create(
+        key=TRENDING_POSTS, defaults={'data': data}
+    )
+    # Cached home pages only show the order of posts
+    if previous_data is None or get_ids(previous_data) != get_ids(data):
+        page_cache.purge(f'widget:{TRENDING_POSTS}')
+    PostViewBucket.objects.filter(
+        hour__lt=now - datetime.timedelta(hours=get_setting('WINDOW', 168))
+    ).delete()
+    return data
+
+
+def get_trending_post_ids():
+    '''
+    Ids of trending posts, refreshing the stored ranking when stale (by
+    one process at a time, others keep reading the previous one).
+    '''
+    widget = SidebarWidget.objects.filter(key=TRENDING_POSTS).first()
+    stale = widget is None or (
+        timezone.now() - widget.updated_at
+    ).total_seconds() >= get_setting('REFRESH_INTERVAL', 300)
+    if stale and cache.add(REFRESH_LOCK_KEY, True, timeout=60):
+        try:
+            return get_ids(refresh())
+        finally:
+            cache.delete(REFRESH_LOCK_KEY)
+    return get_ids(widget.data) if widget else []
+
+
+def get_trending_posts(count):
+    post_ids = get_trending_post_ids()[:count]
+    posts = Post.published.in_bulk(post_ids)
+    return [posts[post_id] for post_id in post_ids if post_id in posts]
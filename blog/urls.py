@@ -10,6 +10,11 @@ urlpatterns = [
         views.BookmarksView.as_view(),
         name='bookmarks'
     ),
+    path(
+        'liked-posts/',
+        views.LikedPostsView.as_view(),
+        name='liked-posts'
+    ),
     path(
         'my-posts/',
         views.MyPostListView.as_view(),
@@ -36,6 +41,11 @@ urlpatterns = [
         views.BookmarkPostView.as_view(),
         name='bookmark-post'
     ),
+    path(
+        'posts/like/',
+        views.LikePostView.as_view(),
+        name='like-post'
+    ),
     path(
         'posts/<slug:slug>/comments/new/',
         views.CommentCreateView.as_view(),
@@ -0,0 +1,37 @@
+from django.db import transaction
+
+
+class CommitBatch:
+    '''
+    Collect items during a transaction and hand them, once, to a callback
+    when it commits (immediately in autocommit mode).
+    '''
+    def __init__(self, callback):
+        self.callback = callback
+        self.items = set()
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        self.callback(self.items)
+
+
+def on_commit_batch(callback, items):
+    '''
+    Add items to the batch of `callback` for the current transaction.
+    '''
+    connection = transaction.get_connection()
+    batches = connection.__dict__.setdefault('blog_commit_batches', {})
+    batch = batches.get(callback)
+
+    # A batch which ran (e.g. by `captureOnCommitCallbacks()` in tests),
+    # or whose transaction was rolled back, is not scheduled anymore
+    scheduled = batch is not None and not batch.done and any(
+        entry[1] is batch for entry in connection.run_on_commit
+    )
+    if not scheduled:
+        batch = batches[callback] = CommitBatch(callback)
+        batch.items.update(items)
+        transaction.on_commit(batch)
+    else:
+        batch.items.update(items)
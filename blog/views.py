@@ -2,29 +2,57 @@ from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages.views import SuccessMessageMixin
-from django.db.models import Count, F, Q
+from django.db import transaction
+from django.db.models import F
 from django.forms.forms import BaseForm
 from django.http import Http404, JsonResponse
-from django.shortcuts import get_object_or_404, redirect
+from django.shortcuts import get_object_or_404
 from django.urls import reverse_lazy
+from django.utils.http import urlencode
 from django.utils.translation import gettext_lazy as _
 from django.views import View
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.views.generic.list import ListView
 
-from guardian.shortcuts import (
-    assign_perm,
-    get_objects_for_user,
-    get_user_perms
-)
+from guardian.shortcuts import get_objects_for_user, get_user_perms
 
 from accounts.mixins import UserAccessMixin
+from blog import sampling, widgets
+from blog.comments import (
+    get_comment_tree,
+    get_version as get_comments_version
+)
+from blog.counters import post_likes, post_views
 from blog.forms import CommentForm, PostForm
-from blog.models import Category, Comment, Post, Tag
+from blog.mixins import (
+    BookmarkedPostsMixin,
+    ConditionalGetMixin,
+    KeysetPaginationMixin,
+    NumberedPaginationMixin,
+    PostChangePermissionMixin,
+    PostListConditionalGetMixin
+)
+from blog.models import (
+    Bookmark,
+    Category,
+    Comment,
+    Like,
+    Post,
+    PostUserObjectPermission,
+    Tag
+)
+from blog.sampling import get_request_seed
+from blog.search import SearchResults, is_searchable, search
+from core import page_cache
 
 
-class CategoryPostListView(ListView):
+class CategoryPostListView(
+    BookmarkedPostsMixin,
+    PostListConditionalGetMixin,
+    KeysetPaginationMixin,
+    ListView
+):
     category = None
     model = Post
     context_object_name = 'posts'
@@ -35,32 +63,72 @@ class CategoryPostListView(ListView):
         self.category = get_object_or_404(Category, slug=self.kwargs['slug'])
         return Post.published.filter(category=self.category)
 
+    def get_validators(self):
+        parts, _ = super().get_validators()
+        return [parts, self.category.updated_at.timestamp()], None
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['category'] = self.category
+
+        page_cache.add_tags(
+            self.request,
+            f'category:{self.category.id}',
+            f'category-posts:{self.category.id}'
+        )
+        page_cache.add_post_tags(self.request, context['object_list'])
+
         return context
 
 
-class TagPostListView(ListView):
+class TagPostListView(
+    BookmarkedPostsMixin,
+    PostListConditionalGetMixin,
+    KeysetPaginationMixin,
+    ListView
+):
     tag = None
     model = Post
     context_object_name = 'tag_posts'
     template_name = 'blog/tag_post_list.html'
     paginate_by = 6
+    validator_tags = ['categories', f'widget:{widgets.TOP_TAGS}']
 
     def get_queryset(self):
         # Save tag to use in other queries
-        self.tag = get_object_or_404(Tag, slug=self.kwargs['tag_slug'])
+        self.tag = get_object_or_404(
+            Tag.with_stats(), slug=self.kwargs['tag_slug']
+        )
 
         return Post.published.filter(tags=self.tag)
 
+    def get_validators(self):
+        parts, _ = super().get_validators()
+        return (
+            [parts, self.tag.updated_at.timestamp(), self.tag.posts_count],
+            None
+        )
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        tag_posts_count = self.object_list.count()
+        tag_posts_count = self.tag.posts_count or 0
 
-        top_tags = Tag.get_top_tags(self)
-        other_tags = Tag.objects.exclude(id=self.tag.id).order_by('?')[:8]
+        top_tags = widgets.get_widgets(widgets.TOP_TAGS)[widgets.TOP_TAGS]
+        other_tags = sampling.tags.sample(
+            8,
+            exclude={self.tag.id},
+            seed=get_request_seed(self.request)
+        )
+
+        page_cache.add_tags(
+            self.request,
+            f'tag:{self.tag.id}',
+            f'tag-posts:{self.tag.id}',
+            f'widget:{widgets.TOP_TAGS}',
+            *[f'tag:{tag.id}' for tag in other_tags]
+        )
+        page_cache.add_post_tags(self.request, context['object_list'])
 
         context.update({
             'tag': self.tag,
@@ -72,41 +140,55 @@ class TagPostListView(ListView):
         return context
 
 
-class UserPostListView(ListView):
+class UserPostListView(
+    BookmarkedPostsMixin,
+    PostListConditionalGetMixin,
+    KeysetPaginationMixin,
+    ListView
+):
     user = None
     model = Post
     context_object_name = 'user_posts'
     template_name = 'blog/user_post_list.html'
     # template_name = 'blog/test.html'
     paginate_by = 6
+    validator_tags = ['categories', f'widget:{widgets.TOP_AUTHORS}']
 
     def get_queryset(self):
         # Save user to use in other queries
         self.user = get_object_or_404(
-            get_user_model(),
+            get_user_model().objects.annotate(
+                published_posts_count=F('author_stat__posts_count')
+            ),
             username=self.kwargs['username']
         )
 
         return Post.published.filter(user=self.user)
 
+    def get_validators(self):
+        parts, _ = super().get_validators()
+        return (
+            [
+                parts,
+                self.user.username,
+                self.user.get_full_name(),
+                self.user.published_posts_count
+            ],
+            None
+        )
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        user_posts_count = self.object_list.count()
+        user_posts_count = self.user.published_posts_count or 0
 
         # Top users based on the number of published posts
-        published_posts_count = Count(
-            'posts',
-            filter=Q(posts__status=Post.POST_STATUS_PUBLISHED)
-        )
-        top_users = get_user_model().objects \
-            .annotate(posts_count=published_posts_count) \
-            .filter(posts_count__gt=0).order_by('-posts_count')[:3]
-
-        other_users = get_user_model().objects. \
-            annotate(posts_count=Count('posts')). \
-            filter(posts_count__gt=0). \
-            exclude(username=self.user.username)[:3]
+        authors = widgets.get_widgets(widgets.TOP_AUTHORS)[widgets.TOP_AUTHORS]
+        top_users = authors[:3]
+        other_users = [
+            author for author in authors[3:]
+            if author['username'] != self.user.username
+        ][:3]
 
         context.update({
             'user': self.user,
@@ -118,39 +200,124 @@ class UserPostListView(ListView):
         return context
 
 
-class SearchPostListView(ListView):
+class SearchPostListView(
+    BookmarkedPostsMixin, NumberedPaginationMixin, ListView
+):
     query = None
+    category = None
+    tag = None
+    # The query only has stop words: the latest posts are listed instead
+    too_generic = False
     model = Post
     context_object_name = 'posts'
     template_name = 'blog/search_post_list.html'
     paginate_by = 9
+    facets_size = 10
 
     def get_queryset(self):
         self.query = self.request.GET.get('q', '')
-        if self.query:
-            return Post.published.filter(
-                Q(category__title__icontains=self.query) |
-                Q(title__icontains=self.query) |
-                Q(user__first_name__icontains=self.query) |
-                Q(user__last_name__icontains=self.query) |
-                Q(tags__name__icontains=self.query),
-                is_active=True,
-                status=Post.POST_STATUS_PUBLISHED
-            ).distinct()
-        else:
-            return Post.published.all()
+        if self.request.GET.get('category'):
+            self.category = get_object_or_404(
+                Category.objects.annotate(posts_count=F('stat__posts_count')),
+                slug=self.request.GET['category']
+            )
+        if self.request.GET.get('tag'):
+            self.tag = get_object_or_404(
+                Tag.with_stats(), slug=self.request.GET['tag']
+            )
+
+        if self.query and is_searchable(self.query):
+            return search(
+                self.query,
+                category_id=self.category and self.category.id,
+                tag_id=self.tag and self.tag.id
+            )
+        self.too_generic = bool(self.query)
+        posts = Post.published.all()
+        if self.category:
+            posts = posts.filter(category=self.category)
+        if self.tag:
+            posts = posts.filter(tags=self.tag)
+        return posts
+
+    def get_paginator(self, *args, **kwargs):
+        # Posts of a single category or tag are counted by their stats
+        searched = self.query and not self.too_generic
+        if not searched and bool(self.category) != bool(self.tag):
+            kwargs['count'] = (self.category or self.tag).posts_count or 0
+        return super().get_paginator(*args, **kwargs)
+
+    def get_search_params(self, **params):
+        '''
+        Query string of the current search with some params replaced.
+        '''
+        current = {
+            'q': self.query,
+            'category': self.category and self.category.slug,
+            'tag': self.tag and self.tag.slug
+        }
+        current.update(params)
+        return urlencode({
+            key: value for key, value in current.items() if value
+        })
+
+    def get_facets(self):
+        '''
+        Category and tag facets of the search results, most results first.
+        '''
+        if not isinstance(self.object_list, SearchResults):
+            return [], []
+
+        category_counts = self.object_list.category_counts.most_common()
+        tag_counts = self.object_list.tag_counts.most_common(self.facets_size)
+        categories = Category.objects.in_bulk(
+            [category_id for category_id, count in category_counts]
+        )
+        tags = Tag.objects.in_bulk([tag_id for tag_id, count in tag_counts])
+
+        category_facets = [
+            {
+                'name': categories[category_id].title,
+                'count': count,
+                'active': categories[category_id] == self.category,
+                'params': self.get_search_params(
+                    category=categories[category_id].slug
+                )
+            }
+            for category_id, count in category_counts
+            if category_id in categories
+        ]
+        tag_facets = [
+            {
+                'name': tags[tag_id].name,
+                'count': count,
+                'active': tags[tag_id] == self.tag,
+                'params': self.get_search_params(tag=tags[tag_id].slug)
+            }
+            for tag_id, count in tag_counts
+            if tag_id in tags
+        ]
+        return category_facets, tag_facets
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        posts_count = self.object_list.count()
+        posts_count = context['paginator'].count
+        category_facets, tag_facets = self.get_facets()
         context.update({
             'query': self.query,
-            'posts_count': posts_count
+            'too_generic': self.too_generic,
+            'posts_count': posts_count,
+            'category': self.category,
+            'tag': self.tag,
+            'category_facets': category_facets,
+            'tag_facets': tag_facets,
+            'clear_category_params': self.get_search_params(category=None),
+            'clear_tag_params': self.get_search_params(tag=None)
         })
         return context
 
 
-class MyPostListView(UserAccessMixin, ListView):
+class MyPostListView(UserAccessMixin, KeysetPaginationMixin, ListView):
     model = Post
     context_object_name = 'posts'
     template_name = 'blog/my_post_list.html'
@@ -174,12 +341,23 @@ class MyPostListView(UserAccessMixin, ListView):
         return context
 
 
-class PostDetailView(DetailView):
+class PostDetailView(ConditionalGetMixin, DetailView):
     model = Post
     context_object_name = 'post'
     template_name = 'blog/post_detail.html'
 
+    def get_queryset(self):
+        queryset = Post.objects.select_related('user')
+        # Counts spilled by every process, not applied yet
+        for counter in [post_views, post_likes]:
+            queryset = counter.annotate_unapplied(queryset)
+        return queryset
+
     def get_object(self, queryset=None):
+        # Resolved (and its view counted) once, for validators and page
+        if hasattr(self, '_post'):
+            return self._post
+
         post = super().get_object(queryset)
 
         if not post.is_active:
@@ -189,13 +367,53 @@ class PostDetailView(DetailView):
         if (post.status == Post.POST_STATUS_DRAFT) and (post.user != self.request.user):
             raise Http404()
 
-        # Increment post's view
-        post.views = F('views') + 1
-        post.save()
-        post.refresh_from_db()
+        # Buffer post's view, it is flushed to the database in batches
+        post_views.incr(post.pk)
+        page_cache.add_post_view(self.request, post.pk)
 
+        self._post = post
         return post
 
+    def is_bookmarked(self):
+        if not hasattr(self, '_is_bookmarked'):
+            self._is_bookmarked = Bookmark.objects.has_post(
+                self.request.user, self.get_object()
+            )
+        return self._is_bookmarked
+
+    def is_liked(self):
+        if not hasattr(self, '_is_liked'):
+            self._is_liked = Like.objects.has_post(
+                self.request.user, self.get_object()
+            )
+        return self._is_liked
+
+    def get_validators(self):
+        '''
+        The post, its counters, its comment tree version and the versions
+        of the navigation and sidebar widgets, so a 304 costs the post
+        lookup only (a 304 is still a view). Counters are applied without
+        touching `updated_at`, hence no Last-Modified.
+        '''
+        post = self.get_object()
+        widget_tags = [
+            'categories',
+            f'widget:{widgets.author_posts_key(post.user_id)}',
+            f'widget:{widgets.TOP_AUTHORS}',
+            f'widget:{widgets.TOP_TAGS}'
+        ]
+        parts = [
+            post.pk,
+            post.updated_at.timestamp(),
+            post.views + post.unapplied_views,
+            post.likes_count + post.unapplied_likes_count,
+            get_comments_version(post.pk),
+            sorted(page_cache.get_tag_versions(widget_tags).items()),
+            self.is_bookmarked(),
+            self.is_liked()
+        ]
+        return parts, None
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
@@ -203,10 +421,7 @@ class PostDetailView(DetailView):
         post_tags = post.tags.all()
         post_perms = get_user_perms(user=self.request.user, obj=post)
 
-        post_comments = post.comments.filter(
-            status=Comment.COMMENT_STATUS_APPROVED
-        )
-        post_comments_count = post_comments.count()
+        comment_tree = get_comment_tree(post)
 
         # Check post is bookmarkable
         is_bookmarkable = True
@@ -214,29 +429,40 @@ class PostDetailView(DetailView):
             is_bookmarkable = False
 
         # Check current user has bookmarked post
-        is_bookmarked = False
-        if self.request.user in post.bookmarks.all():
-            is_bookmarked = True
+        is_bookmarked = self.is_bookmarked()
 
         form = CommentForm()
 
-        related_posts = Post.published.filter(user=post.user) \
-            .exclude(pk=post.pk)[:3]
-
-        top_users = get_user_model().objects. \
-            annotate(posts_count=Count('posts')). \
-            filter(posts_count__gt=0) .\
-            order_by('-posts_count')[:3]
-
-        top_tags = Tag.get_top_tags(self)
+        author_posts_key = widgets.author_posts_key(post.user_id)
+        sidebar = widgets.get_widgets(
+            author_posts_key, widgets.TOP_AUTHORS, widgets.TOP_TAGS
+        )
+        related_posts = [
+            related_post for related_post in sidebar[author_posts_key]
+            if related_post['id'] != post.pk
+        ][:3]
+        top_users = sidebar[widgets.TOP_AUTHORS][:3]
+        top_tags = sidebar[widgets.TOP_TAGS]
+
+        page_cache.add_tags(
+            self.request,
+            f'post:{post.pk}',
+            f'author:{post.user_id}',
+            f'widget:{author_posts_key}',
+            f'widget:{widgets.TOP_AUTHORS}',
+            f'widget:{widgets.TOP_TAGS}',
+            *[f'tag:{tag.id}' for tag in post_tags]
+        )
 
         context.update({
+            'post_views_count': post_views.get_count(post),
+            'post_likes_count': post_likes.get_count(post),
+            'is_liked': self.is_liked(),
             'post_tags': post_tags,
             'post_perms': post_perms,
             'is_bookmarkable': is_bookmarkable,
             'is_bookmarked': is_bookmarked,
-            'post_comments': post_comments,
-            'post_comments_count': post_comments_count,
+            'comment_tree': comment_tree,
             'form': form,
             'related_posts': related_posts,
             'top_users': top_users,
@@ -254,47 +480,34 @@ class PostCreateView(UserAccessMixin, SuccessMessageMixin, CreateView):
     permission_required = 'blog.add_post'
 
     def form_valid(self, form):
-        post = form.save(commit=False)
-        post.user = self.request.user
-        post.save()
-
-        # Save m2m relationship (tags)
-        form.save_m2m()
-
-        # Assign OLP permission to user
-        assign_perm(
-            perm='olp_blog_change_post',
-            user_or_group=self.request.user,
-            obj=post
-        )
+        form.instance.user = self.request.user
 
-        return super().form_valid(form)
+        with transaction.atomic():
+            # Save post and its m2m relationship (tags)
+            response = super().form_valid(form)
 
+            # Assign OLP permission to user
+            PostUserObjectPermission.objects.assign(
+                user=self.request.user,
+                post=self.object,
+                codename='olp_blog_change_post'
+            )
 
-class PostUpdateView(UserAccessMixin, SuccessMessageMixin, UpdateView):
+        return response
+
+
+class PostUpdateView(
+    PostChangePermissionMixin,
+    UserAccessMixin,
+    SuccessMessageMixin,
+    UpdateView
+):
     model = Post
     form_class = PostForm
     template_name = 'blog/post_create_update.html'
     permission_required = 'blog.change_post'
     success_message = _('Your post has been successfully edited.')
 
-    def dispatch(self, request, *args, **kwargs):
-        '''
-        Check user has object-level permission (change) on post.
-        '''
-        post = self.get_object()
-        if not self.request.user.has_perm(
-            perm='olp_blog_change_post', obj=post
-        ):
-            return redirect('accounts:dashboard')
-        return super().dispatch(request, *args, **kwargs)
-
-    def get_object(self, queryset=None):
-        post = super().get_object(queryset)
-        if not post.is_active:
-            raise Http404()
-        return post
-
     def get_success_url(self):
         return reverse_lazy(
             viewname='blog:post-detail',
@@ -302,29 +515,17 @@ class PostUpdateView(UserAccessMixin, SuccessMessageMixin, UpdateView):
         )
 
 
-class PostDeleteView(UserAccessMixin, SuccessMessageMixin, DeleteView):
+class PostDeleteView(
+    PostChangePermissionMixin,
+    UserAccessMixin,
+    SuccessMessageMixin,
+    DeleteView
+):
     model = Post
     success_url = reverse_lazy('blog:my-post-list')
     permission_required = 'blog.delete_post'
     success_message = _('Your post has been successfully deleted.')
 
-    def dispatch(self, request, *args, **kwargs):
-        '''
-        Check user has object-level permission (change) on post.
-        '''
-        post = self.get_object()
-        if not self.request.user.has_perm(
-            perm='olp_blog_change_post', obj=post
-        ):
-            return redirect('accounts:dashboard')
-        return super().dispatch(request, *args, **kwargs)
-
-    def get_object(self, queryset=None):
-        post = super().get_object(queryset)
-        if not post.is_active:
-            raise Http404()
-        return post
-
 
 class CommentCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
     model = Comment
@@ -350,21 +551,17 @@ class BookmarkPostView(LoginRequiredMixin, View):
     def post(self, request):
         if request.headers.get("X-Requested-With") == "XMLHttpRequest":
             post_pk = int(request.POST.get('postPk'))
-            post = get_object_or_404(
-                Post,
-                pk=post_pk,
-                is_active=True,
-                status=Post.POST_STATUS_PUBLISHED
-            )
 
-            if post.bookmarks.filter(id=request.user.id).exists():
-                post.bookmarks.remove(request.user)
+            is_bookmarked = Bookmark.objects.toggle(request.user, post_pk)
+            if is_bookmarked is None:
+                raise Http404()
+
+            if is_bookmarked:
                 status = 'success'
-                message = 'bookmark removed'
+                message = 'bookmarked'
             else:
-                post.bookmarks.add(request.user)
                 status = 'success'
-                message = 'bookmarked'
+                message = 'bookmark removed'
 
             return JsonResponse({
                 'status': status,
@@ -372,38 +569,69 @@ class BookmarkPostView(LoginRequiredMixin, View):
             })
 
 
-class BookmarksView(LoginRequiredMixin, ListView):
+class LikePostView(LoginRequiredMixin, View):
+    def post(self, request):
+        if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+            post_pk = int(request.POST.get('postPk'))
+            # The wanted state rather than a toggle: a retried or repeated
+            # request leaves it (and the count) unchanged
+            liked = request.POST.get('liked') == 'true'
+
+            changed = Like.objects.set(request.user, post_pk, liked)
+            if changed is None:
+                raise Http404()
+
+            # Buffered, applied to `Post.likes_count` in batches
+            if changed:
+                post_likes.incr(post_pk, 1 if liked else -1)
+
+            return JsonResponse({
+                'status': 'success',
+                'message': 'liked' if liked else 'like removed',
+                'changed': changed
+            })
+
+
+class BookmarksView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Post
     context_object_name = 'posts'
     template_name = 'blog/bookmarks.html'
     paginate_by = 9
+    # Most recently bookmarked first
+    keyset_ordering = ['-bookmarked_at', '-bookmark_pk']
 
     def get_queryset(self):
-        return Post.published.filter(
-            bookmarks=self.request.user
-        )
-
+        # Annotations reuse the join of the filter (a separate filter on
+        # `bookmark__...` would join bookmarks again)
+        return Post.published.filter(bookmark__user=self.request.user) \
+            .annotate(
+                bookmarked_at=F('bookmark__created_at'),
+                bookmark_pk=F('bookmark__id')
+            )
 
-# @login_required(login_url="login")
-# def like_post(request, slug):
-#     if request.method == "POST":
-#         post = get_object_or_404(Post, slug=slug, is_active=True)
-#         if post.likes.filter(id=request.user.id).exists():
-#             post.likes.remove(request.user)
-#         else:
-#             post.likes.add(request.user)
-#     return redirect("post-detail", slug)
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Keyset pages don't count their rows
+        context['posts_count'] = self.object_list.count()
+        return context
 
 
-# @login_required(login_url="login")
-# def liked_posts(request):
-#     posts = request.user.likes.all(). \
-#         filter(is_active=True). \
-#         select_related("user"). \
-#         prefetch_related("tags"). \
-#         order_by("-created_at")
+class LikedPostsView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    model = Post
+    context_object_name = 'posts'
+    template_name = 'blog/liked_posts.html'
+    paginate_by = 9
+    # Most recently liked first
+    keyset_ordering = ['-liked_at', '-like_pk']
 
-#     paginated_posts = paginate(request, queryset=posts)
+    def get_queryset(self):
+        return Post.published.filter(like__user=self.request.user) \
+            .annotate(
+                liked_at=F('like__created_at'),
+                like_pk=F('like__id')
+            )
 
-#     context = {"posts": paginated_posts}
-#     return render(request, "blog/liked_posts.html", context)
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['posts_count'] = self.object_list.count()
+        return context
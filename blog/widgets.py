@@ -0,0 +1,98 @@
+from blog.models import AuthorStat, Post, SidebarWidget, Tag
+from core import page_cache
+
+TOP_AUTHORS = 'top-authors'
+TOP_TAGS = 'top-tags'
+
+TOP_AUTHORS_SIZE = 10
+AUTHOR_POSTS_SIZE = 4
+
+
+def author_posts_key(user_id):
+    return f'author-posts:{user_id}'
+
+
+def build_top_authors():
+    '''
+    Authors ordered by the number of their public posts (a leaderboard
+    index scan).
+    '''
+    leaders = AuthorStat.objects \
+        .filter(posts_count__gt=0) \
+        .select_related('user') \
+        .order_by('-posts_count', 'user')[:TOP_AUTHORS_SIZE]
+    return [
+        {
+            'username': leader.user.username,
+            'full_name': leader.user.get_full_name(),
+            'posts_count': leader.posts_count,
+            'views_count': leader.views_count
+        }
+        for leader in leaders
+    ]
+
+
+def build_top_tags():
+    return [
+        {
+            'name': tag.name,
+            'slug': tag.slug,
+            'posts_count': tag.posts_count,
+            'weight': tag.weight
+        }
+        for tag in Tag.get_top_tags()
+    ]
+
+
+def build_author_posts(user_id):
+    '''
+    The most recent public posts of an author.
+    '''
+    posts = Post.objects \
+        .filter(
+            user_id=user_id,
+            status=Post.POST_STATUS_PUBLISHED,
+            is_active=True
+        ) \
+        .only('id', 'title', 'slug')[:AUTHOR_POSTS_SIZE]
+    return [
+        {'id': post.id, 'title': post.title, 'url': post.get_absolute_url()}
+        for post in posts
+    ]
+
+
+def build(key):
+    if key == TOP_AUTHORS:
+        return build_top_authors()
+    if key == TOP_TAGS:
+        return build_top_tags()
+    if key.startswith('author-posts:'):
+        return build_author_posts(int(key.split(':')[1]))
+    raise KeyError(key)
+
+
+def refresh(key):
+    data = build(key)
+    SidebarWidget.objects.update_or_create(key=key, defaults={'data': data})
+    return data
+
+
+def refresh_many(keys):
+    for key in keys:
+        refresh(key)
+    page_cache.bump_tag_versions(f'widget:{key}' for key in keys)
+
+
+def get_widgets(*keys):
+    '''
+    Read materialized widgets with a single indexed lookup.
+
+    Widgets which were never materialized are built and stored.
+    '''
+    widgets = dict(
+        SidebarWidget.objects.filter(key__in=keys).values_list('key', 'data')
+    )
+    for key in keys:
+        if key not in widgets:
+            widgets[key] = refresh(key)
+    return widgets
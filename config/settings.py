@@ -58,6 +58,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.StaticFilesMiddleware',
+    'core.middleware.RequestMetricsMiddleware',
+    'core.middleware.QueryTrackingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -66,6 +69,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'core.middleware.PageCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -105,6 +109,18 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Required, a Redis (e.g. redis://127.0.0.1:6379/0) or Memcached cache:
+# comment trees, the navigation, cached pages and samplers are invalidated
+# through version keys read on every request, so the cache must be shared
+# by every process and cheaper than a query (see core.checks).
+CACHES = {
+    'default': env.cache('CACHE_URL')
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -143,10 +159,23 @@ STATIC_URL = 'static/'
 
 STATICFILES_DIRS = [BASE_DIR / 'static']
 
+STATIC_ROOT = BASE_DIR / 'var' / 'static'
+
 MEDIA_ROOT = BASE_DIR / 'media'
 
 MEDIA_URL = 'media/'
 
+# Uploads are stored once, under the hash of their content
+STORAGES = {
+    'default': {
+        'BACKEND': 'core.storage.ContentAddressedStorage'
+    },
+    # Minified, fingerprinted and precompressed by `collectstatic`
+    'staticfiles': {
+        'BACKEND': 'core.staticfiles.StaticFilesStorage'
+    }
+}
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -181,9 +210,87 @@ EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL')
 
 
+# Email queue (emails per batch, attempts, seconds, days kept once sent)
+
+EMAIL_QUEUE_BATCH_SIZE = 100
+EMAIL_QUEUE_MAX_ATTEMPTS = 6
+EMAIL_QUEUE_RETRY_DELAY = 60
+EMAIL_QUEUE_LEASE = 5 * 60
+EMAIL_QUEUE_DEDUPE_WINDOW = 5 * 60
+EMAIL_QUEUE_RETENTION = 30
+
+
 # Django Messages Framework
 
 MESSAGE_TAGS = {messages.ERROR: 'danger'}
 
 
 GUARDIAN_MONKEY_PATCH = False
+
+
+# Blog counters (seconds / hits buffered in memory before hitting the DB)
+
+BLOG_COUNTER_FLUSH_INTERVAL = 10
+BLOG_COUNTER_APPLY_INTERVAL = 60
+BLOG_COUNTER_MAX_PENDING = 1000
+# Spill idle counts, apply deltas and compact the search index from a
+# thread of each process (else run flush_post_counters and
+# compact_search_index periodically)
+BLOG_COUNTER_FLUSH_THREAD = True
+
+
+# Blog search index (memory-mapped segments, one directory per site,
+# adjacent segments of a level merged together)
+
+BLOG_SEARCH_INDEX_DIR = BASE_DIR / 'var' / 'search'
+BLOG_SEARCH_MERGE_FACTOR = 8
+
+
+# Post images (pixels of an upload, processes rendering variants)
+
+BLOG_IMAGE_MAX_PIXELS = 40_000_000
+BLOG_IMAGE_WORKERS = 2
+
+
+# Trending posts (hours, posts, seconds)
+
+BLOG_TRENDING_WINDOW = 7 * 24
+BLOG_TRENDING_HALF_LIFE = 24
+BLOG_TRENDING_SIZE = 20
+BLOG_TRENDING_REFRESH_INTERVAL = 5 * 60
+
+
+# Anonymous page cache (cached views, seconds)
+
+PAGE_CACHE_VIEWS = [
+    'core:index',
+    'blog:post-detail',
+    'blog:category-post-list',
+    'blog:tag-post-list',
+]
+PAGE_CACHE_TIMEOUT = 5 * 60
+
+
+# Request metrics (Server-Timing header, Prometheus endpoint per process)
+
+REQUEST_METRICS_SERVER_TIMING = True
+REQUEST_METRICS_IGNORED_VIEWS = ['core:metrics', 'djdt']
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
+
+# SQL tracking (share of requests, milliseconds, runs of a statement)
+
+SQL_TRACKING_SAMPLE_RATE = 0.01
+SQL_SLOW_QUERY_THRESHOLD = 100
+SQL_REPEATED_QUERY_THRESHOLD = 10
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'}
+    },
+    'loggers': {
+        'core.sql': {'handlers': ['console'], 'level': 'WARNING'}
+    }
+}
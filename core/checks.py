@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+SHARED_CACHES = [
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+]
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    '''
+    Invalidations (comment trees, navigation, page cache, samplers) only
+    reach the processes sharing the default cache, and its version keys
+    are read on every request: a database or file cache would add a
+    query or a file read to each of them.
+    '''
+    backend = settings.CACHES['default']['BACKEND']
+    if backend in SHARED_CACHES:
+        return []
+    return [Error(
+        f'The default cache ({backend}) is not a Redis or Memcached cache.',
+        hint='Set CACHE_URL to a Redis or Memcached cache.',
+        id='core.E001'
+    )]
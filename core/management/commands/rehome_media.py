@@ -0,0 +1,102 @@
+import posixpath
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+
+from blog import images
+from blog.models import Post
+from core import storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Move uploaded files to their content-addressed names, in batches '
+        'of distinct names, and point their rows to them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--delete', action='store_true',
+            help='Delete the files once no row points to them.'
+        )
+
+    def get_file_fields(self):
+        for model in apps.get_models():
+            for field in model._meta.concrete_fields:
+                if isinstance(field, models.FileField) and isinstance(
+                    field.storage, storage.ContentAddressedStorage
+                ):
+                    yield model, field
+
+    def handle(self, *args, **options):
+        for model, field in self.get_file_fields():
+            moved = self.rehome(
+                model, field, options['batch_size'], options['delete']
+            )
+            self.stdout.write(
+                f'{model._meta.label}.{field.name}: {moved} file(s) moved.'
+            )
+
+    def rehome(self, model, field, batch_size, delete):
+        # Files moved by the current batch (with post image variants)
+        moved_files = []
+
+        def move(name, new_name=None):
+            if storage.is_hashed(name):
+                return name
+            if new_name is None:
+                # Out of legacy directories (e.g. `blog/posts/None/`)
+                new_name = field.generate_filename(
+                    None, posixpath.basename(name)
+                )
+            with field.storage.open(name, 'rb') as file:
+                new_name = field.storage.save(new_name, file)
+            moved_files.append(name)
+            return new_name
+
+        names = model._default_manager \
+            .exclude(**{field.name: ''}) \
+            .exclude(**{f'{field.name}__isnull': True}) \
+            .exclude(**{f'{field.name}__regex': storage.HASHED_NAME_PATTERN})
+        if isinstance(field.default, str):
+            # Files of the repository, which new rows keep pointing to
+            names = names.exclude(**{field.name: field.default})
+        names = names \
+            .order_by(field.name) \
+            .values_list(field.name, flat=True) \
+            .distinct()
+
+        moved = 0
+        last = None
+        while True:
+            # Keyset pagination: names are streamed, never all loaded
+            batch = names if last is None else names.filter(
+                **{f'{field.name}__gt': last}
+            )
+            batch = list(batch[:batch_size])
+            if not batch:
+                return moved
+            last = batch[-1]
+
+            new_names = {}
+            for name in batch:
+                if not field.storage.exists(name):
+                    self.stderr.write(f'{name} is missing, skipped.')
+                    continue
+                new_names[name] = move(name)
+
+            with transaction.atomic():
+                for name, new_name in new_names.items():
+                    if model is Post and field.name == 'image':
+                        images.move_image(name, new_name, move)
+                    else:
+                        model._default_manager \
+                            .filter(**{field.name: name}) \
+                            .update(**{field.name: new_name})
+            if delete:
+                for name in moved_files:
+                    field.storage.delete(name)
+            moved_files.clear()
+            moved += len(new_names)
@@ -0,0 +1,345 @@
+'''
+Per-request instrumentation.
+
+`RequestMetricsMiddleware` measures the total time of every request,
+the time and number of its queries, its template rendering time and
+its cache hits and misses. They are sent back in a `Server-Timing`
+header and added to per-view histograms of the process, which the
+`core:metrics` view exposes in the Prometheus text format.
+
+Recording costs a few `perf_counter()` calls per query, template and
+cache lookup, and one bucket increment per histogram per request.
+Histograms live in the memory of each process: scrape every worker (or
+sum them in Prometheus) rather than expecting one process to see all
+requests.
+'''
+import bisect
+import contextlib
+import contextvars
+import functools
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.template.base import Template
+
+SECONDS_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERIES_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# (attribute of `RequestMetrics`, metric name, help, buckets)
+HISTOGRAMS = [
+    (
+        'duration', 'blog_request_duration_seconds',
+        'Time to handle a request.', SECONDS_BUCKETS
+    ),
+    (
+        'db_time', 'blog_request_db_seconds',
+        'Time spent in database queries per request.', SECONDS_BUCKETS
+    ),
+    (
+        'queries', 'blog_request_queries',
+        'Database queries per request.', QUERIES_BUCKETS
+    ),
+    (
+        'template_time', 'blog_request_template_seconds',
+        'Time spent rendering templates per request.', SECONDS_BUCKETS
+    ),
+    (
+        'cache_time', 'blog_request_cache_seconds',
+        'Time spent in cache lookups per request.', SECONDS_BUCKETS
+    ),
+]
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+_missing = object()
+
+
+class RequestMetrics:
+    '''
+    Measurements of the current request.
+    '''
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.duration = 0.0
+        self.db_time = 0.0
+        self.queries = 0
+        self.template_time = 0.0
+        self.cache_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Nested renders and lookups (includes, `get_many()` calling
+        # `get()`) are measured by the outermost one
+        self.template_depth = 0
+        self.cache_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+    def get_server_timing(self):
+        return ', '.join([
+            f'total;dur={self.duration * 1000:.1f}',
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'cache;dur={self.cache_time * 1000:.1f};'
+            f'desc="{self.cache_hits} hits, {self.cache_misses} misses"'
+        ])
+
+
+@contextlib.contextmanager
+def measure():
+    '''
+    Measure what runs in the block into a new `RequestMetrics`.
+    '''
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            yield metrics
+    finally:
+        metrics.duration = time.perf_counter() - metrics.started_at
+        _current.reset(token)
+
+
+def instrument_templates():
+    render = Template.render
+    if getattr(render, 'instrumented', False):
+        return
+
+    @functools.wraps(render)
+    def timed_render(self, context):
+        metrics = _current.get()
+        if metrics is None or metrics.template_depth:
+            return render(self, context)
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            metrics.template_time += time.perf_counter() - started
+            metrics.template_depth -= 1
+
+    timed_render.instrumented = True
+    Template.render = timed_render
+
+
+def instrument_cache_class(cache_class):
+    get = cache_class.get
+    get_many = cache_class.get_many
+    if getattr(get, 'instrumented', False):
+        return
+
+    @functools.wraps(get)
+    def timed_get(self, key, default=None, version=None):
+        metrics = _current.get()
+        if metrics is None or metrics.cache_depth:
+            return get(self, key, default, version)
+        metrics.cache_depth += 1
+        started = time.perf_counter()
+        try:
+            value = get(self, key, _missing, version)
+        finally:
+            metrics.cache_time += time.perf_counter() - started
+            metrics.cache_depth -= 1
+        if value is _missing:
+            metrics.cache_misses += 1
+            return default
+        metrics.cache_hits += 1
+        return value
+
+    @functools.wraps(get_many)
+    def timed_get_many(self, keys, version=None):
+        metrics = _current.get()
+        if metrics is None or metrics.cache_depth:
+            return get_many(self, keys, version)
+        keys = list(keys)
+        metrics.cache_depth += 1
+        started = time.perf_counter()
+        try:
+            values = get_many(self, keys, version)
+        finally:
+            metrics.cache_time += time.perf_counter() - started
+            metrics.cache_depth -= 1
+        metrics.cache_hits += len(values)
+        metrics.cache_misses += len(keys) - len(values)
+        return values
+
+    timed_get.instrumented = True
+    cache_class.get = timed_get
+    cache_class.get_many = timed_get_many
+
+
+def instrument():
+    '''
+    Wrap template rendering and the lookups of the configured caches.
+    Outside of `measure()` the wrappers only check a context variable.
+    '''
+    instrument_templates()
+    for alias in settings.CACHES:
+        instrument_cache_class(type(caches[alias]))
+
+
+class Histogram:
+    '''
+    Cumulative histogram with fixed buckets (`le` upper bounds).
+    '''
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Last one is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def get_quantile(self, quantile):
+        '''
+        Estimate a quantile by linear interpolation within its bucket,
+        as Prometheus' `histogram_quantile()` does.
+        '''
+        if not self.count:
+            return math.nan
+        rank = quantile * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.histograms = {
+            attribute: Histogram(buckets)
+            for attribute, _, _, buckets in HISTOGRAMS
+        }
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.responses = {}
+
+
+class Registry:
+    '''
+    Metrics of the requests handled by this process, per view name.
+    '''
+    def __init__(self):
+        self.views = {}
+        self.lock = threading.Lock()
+
+    def record(self, view_name, metrics, status_code):
+        status = f'{status_code // 100}xx'
+        with self.lock:
+            view = self.views.get(view_name)
+            if view is None:
+                view = self.views[view_name] = ViewMetrics()
+            for attribute, histogram in view.histograms.items():
+                histogram.observe(getattr(metrics, attribute))
+            view.cache_hits += metrics.cache_hits
+            view.cache_misses += metrics.cache_misses
+            view.responses[status] = view.responses.get(status, 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+    def render(self):
+        '''
+        The metrics in the Prometheus text exposition format.
+        '''
+        with self.lock:
+            views = sorted(self.views.items())
+            lines = []
+            for attribute, name, help_text, buckets in HISTOGRAMS:
+                lines += [
+                    f'# HELP {name} {help_text}',
+                    f'# TYPE {name} histogram'
+                ]
+                for view_name, view in views:
+                    histogram = view.histograms[attribute]
+                    label = format_label(view_name)
+                    cumulative = 0
+                    for bound, count in zip(
+                        [*buckets, '+Inf'], histogram.counts
+                    ):
+                        cumulative += count
+                        lines.append(
+                            f'{name}_bucket{{view={label},le="{bound}"}} '
+                            f'{cumulative}'
+                        )
+                    lines += [
+                        f'{name}_sum{{view={label}}} '
+                        f'{format_value(histogram.sum)}',
+                        f'{name}_count{{view={label}}} {histogram.count}'
+                    ]
+                lines += [
+                    f'# HELP {name}_quantile Estimated quantiles of '
+                    f'{name}.',
+                    f'# TYPE {name}_quantile gauge'
+                ]
+                for view_name, view in views:
+                    histogram = view.histograms[attribute]
+                    label = format_label(view_name)
+                    lines += [
+                        f'{name}_quantile{{view={label},'
+                        f'quantile="{quantile}"}} '
+                        f'{format_value(histogram.get_quantile(quantile))}'
+                        for quantile in QUANTILES
+                    ]
+
+            lines += [
+                '# HELP blog_cache_lookups_total Cache lookups of requests.',
+                '# TYPE blog_cache_lookups_total counter'
+            ]
+            for view_name, view in views:
+                label = format_label(view_name)
+                lines += [
+                    f'blog_cache_lookups_total{{view={label},result="hit"}} '
+                    f'{view.cache_hits}',
+                    f'blog_cache_lookups_total{{view={label},result="miss"}} '
+                    f'{view.cache_misses}'
+                ]
+
+            lines += [
+                '# HELP blog_responses_total Responses per status class.',
+                '# TYPE blog_responses_total counter'
+            ]
+            for view_name, view in views:
+                label = format_label(view_name)
+                lines += [
+                    f'blog_responses_total{{view={label},status="{status}"}} '
+                    f'{count}'
+                    for status, count in sorted(view.responses.items())
+                ]
+        return '\n'.join(lines) + '\n'
+
+
+def format_value(value):
+    return 'NaN' if math.isnan(value) else repr(value)
+
+
+def format_label(value):
+    value = value.replace('\\', r'\\').replace('"', r'\"')
+    return '"' + value.replace('\n', r'\n') + '"'
+
+
+registry = Registry()
@@ -0,0 +1,112 @@
+import random
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+from blog.counters import post_views
+from core import metrics, page_cache, staticfiles
+from core.sql import QueryTracker
+
+
+def is_measured(view_name):
+    ignored = settings.REQUEST_METRICS_IGNORED_VIEWS
+    return view_name not in ignored and view_name.split(':')[0] not in ignored
+
+
+class StaticFilesMiddleware:
+    '''
+    Serve collected static files (`core.staticfiles`) in their best
+    precompressed encoding.
+
+    Placed first: assets skip the other middlewares and the metrics of
+    views. In development, `runserver` serves them before middlewares.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = urlsplit(settings.STATIC_URL).path
+
+    def __call__(self, request):
+        if request.method in ['GET', 'HEAD'] and request.path_info.startswith(
+            self.prefix
+        ):
+            response = staticfiles.get_response(
+                request, request.path_info[len(self.prefix):]
+            )
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+
+class RequestMetricsMiddleware:
+    '''
+    Measure requests with `core.metrics`: send a `Server-Timing` header
+    and record them per view name.
+
+    Placed before the other middlewares (but static files), so measures
+    cover them and the page cache doesn't store the header.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+        metrics.instrument()
+
+    def __call__(self, request):
+        with metrics.measure() as measured:
+            response = self.get_response(request)
+        if settings.REQUEST_METRICS_SERVER_TIMING:
+            response['Server-Timing'] = measured.get_server_timing()
+
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        if is_measured(view_name):
+            metrics.registry.record(
+                view_name, measured, response.status_code
+            )
+        return response
+
+
+class QueryTrackingMiddleware:
+    '''
+    Log the slow and repeated statements of a sample of requests
+    (`core.sql.QueryTracker`).
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.SQL_TRACKING_SAMPLE_RATE:
+            return self.get_response(request)
+        tracker = QueryTracker(
+            slow_threshold=settings.SQL_SLOW_QUERY_THRESHOLD / 1000,
+            repeat_threshold=settings.SQL_REPEATED_QUERY_THRESHOLD
+        )
+        with tracker:
+            response = self.get_response(request)
+        match = request.resolver_match
+        tracker.report(match.view_name if match else 'unresolved')
+        return response
+
+
+class PageCacheMiddleware:
+    '''
+    Serve anonymous requests of cached views from `core.page_cache`.
+
+    Placed after the authentication and messages middlewares, which the
+    cache checks to bypass logged-in visitors and pages with messages.
+    '''
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        page_cache.set_page(request, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not page_cache.is_cacheable(request):
+            return None
+        page = page_cache.get_page(request)
+        if page is None:
+            return None
+        for post_pk in page['post_views']:
+            post_views.incr(post_pk)
+        return page_cache.build_response(request, page)
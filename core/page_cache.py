@@ -0,0 +1,175 @@
+'''
+Full-page cache of anonymous responses.
+
+`PageCacheMiddleware` stores the rendered responses of the views in
+`PAGE_CACHE_VIEWS` for anonymous requests, keyed by their URL. Views tag
+pages with what they render (`add_tags()`, e.g. `post:1`, `tag:2`,
+`widget:top-tags`). Every tag has a version in the shared cache, the time
+it was last purged: a page is served only while the versions of its tags
+are the ones it was stored with, so `purge()` of a tag (see
+`blog.signals`) drops exactly the pages rendering it.
+'''
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe, urlencode
+
+from blog.utilities import on_commit_batch
+
+TAG_VERSION_PREFIX = 'page-cache:tag:'
+
+
+class PageState:
+    '''
+    What the current request rendered, stored along with its page.
+    '''
+    def __init__(self, key):
+        self.key = key
+        self.started_at = time.time_ns()
+        self.tags = set()
+        self.post_views = []
+
+
+def get_state(request):
+    return getattr(request, '_page_cache', None)
+
+
+def add_tags(request, *tags):
+    '''
+    Tag the page of a request (no-op when it is not cached).
+    '''
+    state = get_state(request)
+    if state is not None:
+        state.tags.update(tags)
+
+
+def add_post_tags(request, posts):
+    '''
+    Tag a page with the posts it lists, their authors and tags.
+    '''
+    state = get_state(request)
+    if state is not None:
+        for post in posts:
+            state.tags.update([f'post:{post.pk}', f'author:{post.user_id}'])
+            state.tags.update(f'tag:{tag.pk}' for tag in post.tags.all())
+
+
+def add_post_view(request, post_pk):
+    '''
+    Count a view of a post whenever the page is served from the cache.
+    '''
+    state = get_state(request)
+    if state is not None:
+        state.post_views.append(post_pk)
+
+
+def get_tag_versions(tags):
+    keys = {f'{TAG_VERSION_PREFIX}{tag}': tag for tag in tags}
+    versions = cache.get_many(keys)
+    missing = keys.keys() - versions.keys()
+    if missing:
+        for key in missing:
+            cache.add(key, time.time_ns(), timeout=None)
+        versions.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def bump_tag_versions(tags):
+    cache.set_many(
+        {f'{TAG_VERSION_PREFIX}{tag}': time.time_ns() for tag in tags},
+        timeout=None
+    )
+
+
+def purge(*tags):
+    '''
+    Drop the pages tagged with any of `tags` once the current transaction
+    commits.
+    '''
+    on_commit_batch(bump_tag_versions, tags)
+
+
+def is_cacheable(request):
+    return (
+        request.method in ['GET', 'HEAD']
+        and request.resolver_match.view_name in settings.PAGE_CACHE_VIEWS
+        and not request.user.is_authenticated
+        and not len(get_messages(request))
+    )
+
+
+def get_cache_key(request):
+    # Query params in any order address the same page
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    url = f'{request.scheme}://{request.get_host()}{request.path}?{query}'
+    return f'page-cache:page:{hashlib.md5(url.encode()).hexdigest()}'
+
+
+def get_page(request):
+    '''
+    Return the cached response of a request, if its tags weren't purged
+    since it was stored, and start tracking the request otherwise.
+    '''
+    key = get_cache_key(request)
+    page = cache.get(key)
+    if page is not None and get_tag_versions(page['tags']) == page['tags']:
+        return page
+    request._page_cache = PageState(key)
+    return None
+
+
+def build_response(request, page):
+    '''
+    Response of a cached page, a 304 when the validators the view sent
+    with it match the request.
+    '''
+    response = HttpResponse(page['content'], headers=page['headers'])
+    return get_conditional_response(
+        request,
+        etag=response.get('ETag'),
+        last_modified=parse_http_date_safe(response.get('Last-Modified')),
+        response=response
+    )
+
+
+def set_page(request, response):
+    '''
+    Store the response of a tracked request, unless it is specific to
+    the visitor (cookies, messages, CSRF token) or something it renders
+    was purged while it was being rendered.
+    '''
+    state = get_state(request)
+    session = getattr(request, 'session', None)
+    cache_control = response.get('Cache-Control', '')
+    if (
+        state is None
+        or request.method != 'GET'
+        or response.status_code != 200
+        or response.streaming
+        or response.cookies
+        or 'private' in cache_control
+        or 'no-store' in cache_control
+        or (session is not None and session.modified)
+        or request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+        or len(get_messages(request))
+    ):
+        return
+    versions = get_tag_versions(state.tags)
+    # Includes tags first seen now: the next render of the page is stored
+    if any(version > state.started_at for version in versions.values()):
+        return
+    cache.set(
+        state.key,
+        {
+            'content': response.content,
+            'headers': dict(response.items()),
+            'tags': versions,
+            'post_views': state.post_views
+        },
+        timeout=settings.PAGE_CACHE_TIMEOUT
+    )
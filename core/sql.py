@@ -0,0 +1,215 @@
+'''
+SQL statement fingerprints, query logs and tracking.
+
+A fingerprint is a statement with its literal values and parameters
+masked, so the queries of a request which only differ by the row they
+look up (e.g. one per listed post) share a fingerprint.
+
+`QueryTracker` aggregates the statements of a request per fingerprint
+and logs slow ones and N+1 patterns (one fingerprint run many times) to
+the `core.sql` logger, with the view and the template line or code
+which ran them (see `core.middleware.QueryTrackingMiddleware`).
+'''
+import contextlib
+import functools
+import logging
+import re
+import sys
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, connections
+from django.template.base import Node
+
+logger = logging.getLogger(__name__)
+
+# Frames of template nodes being rendered
+RENDER_NODE_CODE = Node.render_annotated.__code__
+# Execute wrappers, not origins of statements
+WRAPPER_FILES = [__file__, str(settings.BASE_DIR / 'core' / 'metrics.py')]
+
+FINGERPRINT_PATTERNS = [
+    # String literals, numbers and parameters
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    # Lists of values (IN, VALUES, arrays) of any length
+    (re.compile(r'\?(?:\s*,\s*\?)+'), '?, ...'),
+    (re.compile(r'\s+'), ' ')
+]
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint(sql):
+    for pattern, replacement in FINGERPRINT_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+class QueryLog:
+    '''
+    Record the statements run on a connection while in use as a context
+    manager.
+
+    Statements are captured with `execute_wrapper()`, so it works without
+    DEBUG and across requests (which reset `connection.queries`).
+    '''
+    def __init__(self, using=None):
+        self.connection = using or connection
+        self.queries = []
+        self._wrapper = None
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def get_fingerprints(self):
+        return Counter(fingerprint(sql) for sql in self.queries)
+
+    def get_duplicates(self):
+        '''
+        `(fingerprint, count)` of the statements run more than once, most
+        repeated first.
+        '''
+        return [
+            (sql, count)
+            for sql, count in self.get_fingerprints().most_common()
+            if count > 1
+        ]
+
+    def describe(self):
+        lines = [f'{len(self)} queries']
+        duplicates = self.get_duplicates()
+        if duplicates:
+            lines.append('Duplicated fingerprints:')
+            lines += [f'  {count} x {sql}' for sql, count in duplicates]
+        return '\n'.join(lines)
+
+
+def get_origin():
+    '''
+    Where the running statement comes from: the innermost template line
+    being rendered and project code frame, e.g.
+    `blog/post_detail.html:42, blog/views.py:120 in get_context_data`.
+    '''
+    template = code = None
+    project_dir = str(settings.BASE_DIR)
+    frame = sys._getframe(1)
+    while frame is not None and not (template and code):
+        if template is None and frame.f_code is RENDER_NODE_CODE:
+            node = frame.f_locals.get('self')
+            origin = getattr(node, 'origin', None)
+            token = getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                name = origin.template_name or origin.name
+                template = f'{name}:{token.lineno}'
+        filename = frame.f_code.co_filename
+        if (
+            code is None
+            and filename.startswith(project_dir)
+            and 'site-packages' not in filename
+            and filename not in WRAPPER_FILES
+        ):
+            code = (
+                f'{filename[len(project_dir) + 1:]}:{frame.f_lineno} '
+                f'in {frame.f_code.co_name}'
+            )
+        frame = frame.f_back
+    return ', '.join(filter(None, [template, code])) or 'unknown'
+
+
+class QueryTracker:
+    '''
+    Executions and total duration of the statements run on every
+    connection while in use as a context manager, per fingerprint.
+
+    The origin of a statement is looked up (a stack walk) only when it
+    is slow or when its fingerprint reaches `repeat_threshold`.
+    '''
+    def __init__(self, slow_threshold, repeat_threshold):
+        # Seconds, executions
+        self.slow_threshold = slow_threshold
+        self.repeat_threshold = repeat_threshold
+        # fingerprint -> [executions, duration, origin]
+        self.fingerprints = {}
+        # (fingerprint, duration, origin)
+        self.slow = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = contextlib.ExitStack()
+        for db_connection in connections.all():
+            self._stack.enter_context(db_connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            key = fingerprint(sql)
+            stats = self.fingerprints.get(key)
+            if stats is None:
+                stats = self.fingerprints[key] = [0, 0.0, None]
+            stats[0] += 1
+            stats[1] += duration
+            if stats[0] == self.repeat_threshold:
+                stats[2] = get_origin()
+            if duration >= self.slow_threshold:
+                self.slow.append((key, duration, get_origin()))
+
+    def get_repeated(self):
+        '''
+        `(fingerprint, executions, duration, origin)` of the statements
+        run at least `repeat_threshold` times, most run first.
+        '''
+        return sorted(
+            (
+                (key, count, duration, origin)
+                for key, (count, duration, origin)
+                in self.fingerprints.items()
+                if count >= self.repeat_threshold
+            ),
+            key=lambda repeated: -repeated[1]
+        )
+
+    def report(self, view_name):
+        for key, duration, origin in self.slow:
+            logger.warning(
+                'Slow query (%.1fms) in %s from %s: %s',
+                duration * 1000, view_name, origin, key,
+                extra={
+                    'view': view_name,
+                    'fingerprint': key,
+                    'duration': duration,
+                    'origin': origin
+                }
+            )
+        for key, count, duration, origin in self.get_repeated():
+            logger.warning(
+                'Query run %d times (%.1fms) in %s from %s: %s',
+                count, duration * 1000, view_name, origin, key,
+                extra={
+                    'view': view_name,
+                    'fingerprint': key,
+                    'count': count,
+                    'duration': duration,
+                    'origin': origin
+                }
+            )
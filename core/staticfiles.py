@@ -0,0 +1,317 @@
+'''
+Static files built by `collectstatic` and served by the application.
+
+`StaticFilesStorage` minifies the project's stylesheets and scripts
+(`STATICFILES_DIRS`, not the already built files of apps), names every
+file after the hash of its content in a manifest, and writes gzip (and,
+with the `brotli` package installed, brotli) siblings of text files.
+
+`get_response()` (see `core.middleware.StaticFilesMiddleware`) serves
+those siblings to clients accepting their encoding, without compressing
+anything per request, and lets browsers cache hashed names forever.
+'''
+import functools
+import gzip
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage,
+    staticfiles_storage
+)
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from core.storage import IMMUTABLE_MAX_AGE
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSED_EXTENSIONS = {'.css', '.js', '.map', '.svg', '.json', '.txt'}
+# Smaller files don't fill a packet anyway
+COMPRESS_MIN_SIZE = 256
+# (Content-Encoding, file extension), preferred first
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+# Strings and comments (kept and dropped), then runs of whitespace
+_css_tokens = re.compile(
+    r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*.*?\*/)|(\s+)''',
+    re.DOTALL
+)
+_js_regex_prefix = re.compile(
+    r'(^|[(,=:\[!&|?{};+\-*%<>~^]|\b(?:return|typeof|case|do|else|in|of|'
+    r'new|delete|void|throw|instanceof|yield|await))\s*$'
+)
+
+
+def minify_css(text):
+    '''
+    Drop comments, and whitespace that doesn't separate two tokens.
+    '''
+    def replace(match):
+        string, comment, whitespace = match.groups()
+        if string:
+            return string
+        if comment:
+            return ''
+        text = match.string
+        before = text[match.start() - 1] if match.start() else ''
+        after = text[match.end()] if match.end() < len(text) else ''
+        # Not before ':' (`a :hover`) or around '+' (`calc(1px + 2px)`)
+        if not before or not after or before in '{};,>:' or after in '{};,>':
+            return ''
+        return ' '
+
+    text = _css_tokens.sub(
+        lambda match: match.group(2) and ' ' or match.group(0), text
+    )
+    text = _css_tokens.sub(replace, text)
+    return re.sub(
+        r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|;(?=})''',
+        lambda match: match.group(1) or '',
+        text
+    )
+
+
+def minify_js(text):
+    '''
+    Drop comments, indentation and whitespace around punctuation.
+    Line breaks are kept where automatic semicolon insertion may need
+    them, so the result is the same program.
+    '''
+    output = []
+    position = 0
+    length = len(text)
+
+    def skip_string(start):
+        quote = text[start]
+        index = start + 1
+        depth = 0
+        while index < length:
+            char = text[index]
+            if char == '\\':
+                index += 2
+                continue
+            if quote == '`' and text.startswith('${', index):
+                depth += 1
+                index += 2
+                continue
+            if depth and char == '}':
+                depth -= 1
+            elif not depth and char == quote:
+                return index + 1
+            index += 1
+        return length
+
+    while position < length:
+        char = text[position]
+        if char in '\'"`':
+            end = skip_string(position)
+            output.append(text[position:end])
+            position = end
+        elif text.startswith('//', position):
+            end = text.find('\n', position)
+            position = length if end == -1 else end
+        elif text.startswith('/*', position):
+            end = text.find('*/', position + 2)
+            end = length if end == -1 else end + 2
+            # A comment spanning lines may end a statement
+            output.append('\n' if '\n' in text[position:end] else ' ')
+            position = end
+        elif char == '/' and _js_regex_prefix.search(''.join(output[-12:])):
+            index = position + 1
+            in_class = False
+            while index < length and text[index] != '\n':
+                if text[index] == '\\':
+                    index += 1
+                elif text[index] == '[':
+                    in_class = True
+                elif text[index] == ']':
+                    in_class = False
+                elif text[index] == '/' and not in_class:
+                    break
+                index += 1
+            index += 1
+            while index < length and text[index].isalnum():
+                index += 1
+            output.append(text[position:index])
+            position = index
+        elif char.isspace():
+            end = position
+            while end < length and text[end].isspace():
+                end += 1
+            output.append('\n' if '\n' in text[position:end] else ' ')
+            position = end
+        else:
+            output.append(char)
+            position += 1
+
+    # Whitespace tokens are single characters: decide with their
+    # neighbours (comments were replaced by whitespace too)
+    minified = []
+    for index, token in enumerate(output):
+        if token not in (' ', '\n'):
+            minified.append(token)
+            continue
+        before = minified[-1][-1] if minified and minified[-1] else ''
+        after = ''
+        for following in output[index + 1:]:
+            if following not in (' ', '\n'):
+                after = following[0]
+                break
+        if before in ('', ' ', '\n') or not after:
+            continue
+        if token == ' ':
+            if before in '{}()[];,:=<>&|?!' or after in '{}()[];,:=<>&|?':
+                continue
+        elif before in '{([,;=:?&|' or after in '})],;:?.':
+            continue
+        minified.append(token)
+    return ''.join(minified)
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def compress(path):
+    '''
+    Write the gzip and brotli siblings of a file (unless they don't
+    save much).
+    '''
+    with open(path, 'rb') as file:
+        content = file.read()
+    if len(content) < COMPRESS_MIN_SIZE:
+        return
+    compressed = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressed['.br'] = brotli.compress(content, quality=11)
+    for extension, data in compressed.items():
+        if len(data) < len(content) * 0.95:
+            with open(path + extension, 'wb') as file:
+                file.write(data)
+
+
+class StaticFilesStorage(ManifestStaticFilesStorage):
+    # Files missing from the manifest keep their name rather than
+    # failing the page (e.g. before `collectstatic`)
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            paths = self.minify(paths)
+        yield from super().post_process(paths, dry_run, **options)
+        if not dry_run:
+            names = set(paths) | set(self.hashed_files.values())
+            for name in sorted(names):
+                extension = os.path.splitext(name)[1]
+                if extension in COMPRESSED_EXTENSIONS:
+                    compress(self.path(name))
+
+    def minify(self, paths):
+        '''
+        Minify the collected copies of project files; returns `paths`
+        with these files hashed from their copy rather than their source.
+        '''
+        paths = dict(paths)
+        project_dirs = {
+            str(directory) for directory in settings.STATICFILES_DIRS
+        }
+        for name, (storage, _) in paths.items():
+            minifier = MINIFIERS.get(os.path.splitext(name)[1])
+            if (
+                minifier is None
+                or '.min.' in name
+                or str(getattr(storage, 'location', '')) not in project_dirs
+            ):
+                continue
+            with self.open(name) as file:
+                content = file.read().decode()
+            with open(self.path(name), 'w', encoding='utf-8') as file:
+                file.write(minifier(content))
+            paths[name] = (self, name)
+        return paths
+
+
+def get_accepted_encodings(request):
+    accepted = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        encoding, _, params = item.strip().partition(';')
+        quality = params.strip().removeprefix('q=')
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(encoding.strip().lower())
+    return accepted
+
+
+@functools.cache
+def get_hashed_names():
+    # The manifest is loaded once per process, as the storage does
+    return frozenset(
+        getattr(staticfiles_storage, 'hashed_files', {}).values()
+    )
+
+
+def get_response(request, name):
+    '''
+    Response serving a collected file, None if there is none.
+    '''
+    try:
+        path = safe_join(settings.STATIC_ROOT, name)
+    except SuspiciousFileOperation:
+        return None
+    if not os.path.isfile(path):
+        return None
+
+    stat = os.stat(path)
+    hashed = name in get_hashed_names()
+    if not hashed and not was_modified_since(
+        request.headers.get('If-Modified-Since'), stat.st_mtime
+    ):
+        return HttpResponseNotModified()
+
+    content_type, _ = mimetypes.guess_type(path)
+    served, content_encoding = path, None
+    accepted = get_accepted_encodings(request)
+    siblings = [
+        (encoding, path + extension)
+        for encoding, extension in ENCODINGS
+        if os.path.isfile(path + extension)
+    ]
+    for encoding, sibling in siblings:
+        if encoding in accepted:
+            served, content_encoding = sibling, encoding
+            break
+
+    response = FileResponse(
+        open(served, 'rb'),
+        content_type=content_type or 'application/octet-stream'
+    )
+    if content_encoding:
+        response['Content-Encoding'] = content_encoding
+    if siblings:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if hashed:
+        patch_cache_control(
+            response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True
+        )
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
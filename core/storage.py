@@ -0,0 +1,85 @@
+'''
+Content-addressed storage of uploaded files.
+
+`ContentAddressedStorage` stores a file under the SHA-256 of its bytes,
+in the directory chosen by the field's `upload_to`, fanned out in two
+levels of subdirectories: `blog/posts/photo.jpg` is saved as
+`blog/posts/3f/a2/3fa2...e1.jpg`. Identical uploads are stored once and
+share a name, and a name always designates the same bytes, so its URL
+can be cached forever (see `core.views.serve_media`).
+
+Files may be shared by several rows: never delete one because a row
+stopped using it.
+'''
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+HASHED_NAME_PATTERN = (
+    r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9]+)?$'
+)
+# Cache lifetime of content-addressed files (seconds)
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+_hashed_name = re.compile(HASHED_NAME_PATTERN)
+
+
+def is_hashed(name):
+    return _hashed_name.search(name) is not None
+
+
+def get_hashed_name(name, digest):
+    directory, filename = posixpath.split(name)
+    extension = posixpath.splitext(filename)[1].lower()
+    return posixpath.join(
+        directory, digest[:2], digest[2:4], digest + extension
+    )
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    '''
+    File system storage naming files after the hash of their content.
+    '''
+    def _save(self, name, content):
+        # Hash while streaming to a temporary file, then move it to its
+        # name: one pass over the content, and a file is never visible
+        # half written under its final name
+        os.makedirs(self.location, exist_ok=True)
+        fd, temporary_path = tempfile.mkstemp(
+            prefix='.upload-', dir=self.location
+        )
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    file.write(chunk)
+
+            name = get_hashed_name(name, digest.hexdigest())
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                # Deduplicated
+                os.unlink(temporary_path)
+                return name
+
+            os.makedirs(
+                os.path.dirname(full_path),
+                mode=self.directory_permissions_mode or 0o777,
+                exist_ok=True
+            )
+            os.chmod(temporary_path, self.file_permissions_mode or 0o644)
+            os.replace(temporary_path, full_path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.unlink(temporary_path)
+            raise
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # The name is derived from the content by `_save()`: an existing
+        # file under the upload's name is not a conflict
+        return name
@@ -0,0 +1,225 @@
+'''
+Query budgets of views, shared by the test suites of the apps.
+
+`QueryBudgetTestCase.assertQueryBudget()` renders a URL against a seeded
+blog, adds posts, comments, tags and bookmarks to everything the page
+can list, and renders it again: both renders must run the same number
+of queries, within the budget. Failures list the duplicated SQL
+fingerprints of the request, which point at the N+1 pattern.
+'''
+import itertools
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from blog import categories, counters
+from blog.dataset import POST_MANAGERS_GROUP, POST_MANAGERS_PERMISSIONS
+from blog.models import (
+    Bookmark,
+    Category,
+    Comment,
+    Like,
+    Post,
+    PostUserObjectPermission,
+    Tag
+)
+from core.sql import QueryLog
+
+_sequence = itertools.count()
+
+
+def create_user(**fields):
+    number = next(_sequence)
+    fields = {
+        'email': f'user{number}@example.com',
+        'username': f'user{number}',
+        'first_name': 'User',
+        'last_name': str(number),
+        'password': 'password',
+        **fields
+    }
+    return get_user_model().objects.create_user(**fields)
+
+
+def create_post(user, category, tags=(), **fields):
+    number = next(_sequence)
+    fields.setdefault('status', Post.POST_STATUS_PUBLISHED)
+    post = Post.objects.create(
+        user=user,
+        category=category,
+        title=f'Post number {number}',
+        content=f'Content of post {number}',
+        **fields
+    )
+    post.tags.set(tags)
+    PostUserObjectPermission.objects.assign(
+        user=user, post=post, codename='olp_blog_change_post'
+    )
+    return post
+
+
+def create_tag():
+    number = next(_sequence)
+    return Tag.objects.create(name=f'Tag {number}', slug=f'tag-{number}')
+
+
+def create_comment(post, user, parent=None):
+    return Comment.objects.create(
+        post=post,
+        user=user,
+        parent=parent,
+        content='A comment',
+        status=Comment.COMMENT_STATUS_APPROVED
+    )
+
+
+class QueryBudgetTestCase(TestCase):
+    '''
+    A blog with an author (a post manager), a reader and a post with
+    comments, tags and bookmarks.
+    '''
+    @classmethod
+    def setUpClass(cls):
+        # Search index updates and image variants go to throwaway
+        # directories (variants rendered in process), the cache is kept
+        # in process (tests run in one process, without a Redis server),
+        # anonymous pages are rendered instead of served by the page
+        # cache, counts are only spilled by the tests, statements are not
+        # logged and users are created without slow password hashing
+        search_dir = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, search_dir)
+        media_dir = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_dir)
+        default_image = Post._meta.get_field('image').default
+        (Path(media_dir) / default_image).parent.mkdir(parents=True)
+        shutil.copy(
+            settings.MEDIA_ROOT / default_image,
+            Path(media_dir) / default_image
+        )
+        overridden = override_settings(
+            BLOG_SEARCH_INDEX_DIR=search_dir,
+            MEDIA_ROOT=media_dir,
+            BLOG_IMAGE_WORKERS=0,
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+            }},
+            PAGE_CACHE_VIEWS=[],
+            BLOG_COUNTER_FLUSH_THREAD=False,
+            SQL_TRACKING_SAMPLE_RATE=0,
+            PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']
+        )
+        overridden.enable()
+        cls.addClassCleanup(overridden.disable)
+        patcher = mock.patch('blog.search._index', None)
+        patcher.start()
+        cls.addClassCleanup(patcher.stop)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        # Runs the search index updates of the seeded posts (batches of
+        # the class transaction would otherwise absorb later updates)
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.seed()
+
+    @classmethod
+    def seed(cls):
+        group = Group.objects.create(name=POST_MANAGERS_GROUP)
+        group.permissions.set(Permission.objects.filter(
+            content_type__app_label='blog',
+            codename__in=POST_MANAGERS_PERMISSIONS
+        ))
+
+        cls.author = create_user()
+        cls.author.groups.add(group)
+        cls.reader = create_user()
+
+        cls.category = Category.objects.create(title='News', slug='news')
+        cls.tag = create_tag()
+        cls.post = create_post(
+            cls.author, cls.category, [cls.tag, create_tag()]
+        )
+        create_post(cls.author, cls.category, [cls.tag])
+
+        comment = create_comment(cls.post, cls.reader)
+        create_comment(cls.post, cls.author, parent=comment)
+        Bookmark.objects.create(user=cls.reader, post=cls.post)
+        Bookmark.objects.create(user=cls.author, post=cls.post)
+        Like.objects.create(user=cls.reader, post=cls.post)
+
+    def setUp(self):
+        cache.clear()
+        categories.reset()
+        for counter in counters.COUNTERS:
+            counter.reset()
+
+    def grow(self):
+        '''
+        Add enough rows to fill any page: posts of the author in the
+        category with several tags, bookmarked by both users and liked by
+        the reader, and a comment thread by other users on the post.
+        '''
+        for _ in range(12):
+            post = create_post(
+                self.author,
+                self.category,
+                [self.tag, create_tag(), create_tag()]
+            )
+            Bookmark.objects.create(user=self.reader, post=post)
+            Bookmark.objects.create(user=self.author, post=post)
+            Like.objects.create(user=self.reader, post=post)
+        self.post.tags.add(create_tag(), create_tag())
+
+        parent = None
+        for _ in range(8):
+            parent = create_comment(self.post, create_user(), parent)
+            create_comment(self.post, create_user())
+
+    def assertQueryBudget(
+        self,
+        url,
+        budget,
+        user=None,
+        method='get',
+        data=None,
+        status=200,
+        **extra
+    ):
+        '''
+        Assert `url` runs at most `budget` queries, however many rows its
+        page shows. Requests are measured once caches are warm.
+        '''
+        def send():
+            if user is not None:
+                self.client.force_login(user)
+            with QueryLog() as log:
+                response = getattr(self.client, method)(url, data, **extra)
+            return response, log
+
+        logs = []
+        for grow in [False, True]:
+            if grow:
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.grow()
+            with self.captureOnCommitCallbacks(execute=True):
+                send()
+            with self.captureOnCommitCallbacks(execute=True):
+                response, log = send()
+            self.assertEqual(response.status_code, status, url)
+            logs.append(log)
+
+        before, after = logs
+        if len(after) > budget or len(after) != len(before):
+            self.fail(
+                f'{method.upper()} {url} ran {len(before)} queries, then '
+                f'{len(after)} with more posts, comments and tags '
+                f'(budget {budget}).\n{after.describe()}'
+            )
+        return response
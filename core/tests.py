@@ -0,0 +1,300 @@
+import gzip
+import math
+import os
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.template import engines
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+
+from blog import counters
+from blog.models import Category, Post
+from core.checks import check_shared_cache
+from core.metrics import Histogram, Registry, RequestMetrics
+from core.sql import QueryTracker, fingerprint
+from core.staticfiles import compress, get_response, minify_css, minify_js
+from core.storage import ContentAddressedStorage, is_hashed
+from core.testing import QueryBudgetTestCase, create_post, create_tag
+from core.views import serve_media
+
+
+class IndexQueryBudgetTests(QueryBudgetTestCase):
+    def test_index(self):
+        response = self.assertQueryBudget(reverse('core:index'), 3)
+        self.assertEqual(len(response.context['recent_posts']), 3)
+        self.assertQueryBudget(reverse('core:index'), 7, user=self.reader)
+
+
+class RequestMetricsTests(QueryBudgetTestCase):
+    def test_server_timing(self):
+        response = self.client.get(self.post.get_absolute_url())
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", '
+            r'tpl;dur=[\d.]+, cache;dur=[\d.]+;desc="\d+ hits, \d+ misses"$'
+        )
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint(self):
+        self.client.get(self.post.get_absolute_url())
+        url = reverse('core:metrics')
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertContains(
+            response, 'blog_request_duration_seconds_count'
+            '{view="blog:post-detail"}'
+        )
+        self.assertNotContains(response, 'view="core:metrics"')
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    def check(self, backend):
+        with override_settings(CACHES={'default': {'BACKEND': backend}}):
+            return [error.id for error in check_shared_cache(None)]
+
+    def test_check(self):
+        self.assertEqual(
+            self.check('django.core.cache.backends.redis.RedisCache'), []
+        )
+        for backend in ['db.DatabaseCache', 'locmem.LocMemCache']:
+            self.assertEqual(
+                self.check(f'django.core.cache.backends.{backend}'),
+                ['core.E001']
+            )
+
+
+class HistogramTests(SimpleTestCase):
+    def test_quantiles(self):
+        histogram = Histogram((1, 2, 4))
+        self.assertTrue(math.isnan(histogram.get_quantile(0.5)))
+        for value in [0.5] * 50 + [1.5] * 40 + [3] * 9 + [100]:
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [50, 40, 9, 1])
+        self.assertEqual(histogram.get_quantile(0.5), 1)
+        self.assertAlmostEqual(histogram.get_quantile(0.95), 2 + 2 * 5 / 9)
+        self.assertEqual(histogram.get_quantile(0.999), 4)
+
+    def test_render(self):
+        registry = Registry()
+        registry.record('blog:post-detail', RequestMetrics(), 200)
+        text = registry.render()
+        self.assertIn('# TYPE blog_request_queries histogram', text)
+        self.assertIn(
+            'blog_request_queries_bucket{view="blog:post-detail",le="0"} 1',
+            text
+        )
+        self.assertIn(
+            'blog_responses_total{view="blog:post-detail",status="2xx"} 1',
+            text
+        )
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location)
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def test_save(self):
+        name = self.storage.save('blog/posts/a.JPG', ContentFile(b'image'))
+        self.assertTrue(name.startswith('blog/posts/'))
+        self.assertTrue(name.endswith('.jpg'))
+        self.assertTrue(is_hashed(name))
+        self.assertFalse(is_hashed('blog/posts/12/a.jpg'))
+        # Same bytes, same file
+        self.assertEqual(
+            self.storage.save('blog/posts/b.jpg', ContentFile(b'image')),
+            name
+        )
+        self.assertNotEqual(
+            self.storage.save('blog/posts/a.JPG', ContentFile(b'other')),
+            name
+        )
+        self.assertEqual(
+            sum(len(files) for _, _, files in os.walk(self.location)), 2
+        )
+
+    def test_serve(self):
+        name = self.storage.save('a.txt', ContentFile(b'text'))
+        with open(os.path.join(self.location, 'b.txt'), 'w') as file:
+            file.write('text')
+        factory = RequestFactory()
+        for path, cache_control in [
+            (name, 'public, max-age=31536000, immutable'),
+            ('b.txt', None)
+        ]:
+            response = serve_media(
+                factory.get('/'), path, document_root=self.location
+            )
+            self.assertEqual(response.get('Cache-Control'), cache_control)
+            response.close()
+
+
+class StaticFilesTests(SimpleTestCase):
+    def test_minify_css(self):
+        self.assertEqual(
+            minify_css(
+                '/* Links */\na :hover,\nb > i {\n    content: "a  b";\n'
+                '    width: calc(1px + 2px);\n}\n'
+            ),
+            'a :hover,b>i{content:"a  b";width:calc(1px + 2px)}'
+        )
+
+    def test_minify_js(self):
+        self.assertEqual(
+            minify_js(
+                '// Comment\nconst a = {b: "x  y"} // c\n'
+                'const r = /\\/ x/g;\nfoo()\n    .bar(a / 2)\n'
+            ),
+            'const a={b:"x  y"}\nconst r=/\\/ x/g;foo().bar(a / 2)'
+        )
+
+    def test_serve(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        content = b'a{color:red}' * 100
+        with open(os.path.join(root, 'a.css'), 'wb') as file:
+            file.write(content)
+        compress(os.path.join(root, 'a.css'))
+
+        factory = RequestFactory()
+        with override_settings(STATIC_ROOT=root):
+            response = get_response(
+                factory.get('/', HTTP_ACCEPT_ENCODING='gzip, deflate'),
+                'a.css'
+            )
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertEqual(
+                gzip.decompress(b''.join(response.streaming_content)),
+                content
+            )
+            response.close()
+            response = get_response(factory.get('/'), 'a.css')
+            self.assertFalse(response.has_header('Content-Encoding'))
+            response.close()
+            self.assertIsNone(get_response(factory.get('/'), 'b.css'))
+
+
+class QueryTrackerTests(QueryBudgetTestCase):
+    def test_repeated_query(self):
+        template = engines['django'].from_string(
+            '{% for post in posts %}\n{{ post.category.title }}\n{% endfor %}'
+        )
+        with QueryTracker(slow_threshold=1, repeat_threshold=2) as tracker:
+            template.render({'posts': Post.objects.all()})
+        with self.assertLogs('core.sql', 'WARNING') as logs:
+            tracker.report('blog:post-list')
+
+        [(key, count, duration, origin)] = tracker.get_repeated()
+        self.assertEqual(count, 2)
+        self.assertIn('WHERE "blog_category"."id" = ? LIMIT ?', key)
+        self.assertIn(':2, core/tests.py:', origin)
+        self.assertIn('Query run 2 times', logs.output[0])
+        self.assertIn('in blog:post-list from', logs.output[0])
+
+    @override_settings(SQL_TRACKING_SAMPLE_RATE=1)
+    def test_sampled_request(self):
+        with self.assertNoLogs('core.sql', 'WARNING'):
+            self.client.get(self.post.get_absolute_url())
+        with self.settings(SQL_SLOW_QUERY_THRESHOLD=0):
+            with self.assertLogs('core.sql', 'WARNING') as logs:
+                self.client.get(self.post.get_absolute_url())
+        self.assertIn('Slow query', logs.output[0])
+        self.assertIn('in blog:post-detail from', logs.output[0])
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint(
+                "SELECT * FROM t WHERE a = 'x' AND b IN (1, 2, 3) "
+                "AND c = %s"
+            ),
+            'SELECT * FROM t WHERE a = ? AND b IN (?, ...) AND c = ?'
+        )
+
+
+@override_settings(PAGE_CACHE_VIEWS=[
+    'core:index',
+    'blog:post-detail',
+    'blog:category-post-list',
+    'blog:tag-post-list'
+])
+class PageCacheTests(QueryBudgetTestCase):
+    def get(self, url):
+        # Requests run in autocommit mode: what they schedule for the
+        # commit (e.g. a trending widget refresh) runs right away
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(url).content.decode()
+
+    def warm(self, url):
+        # Tags seen for the first time are only versioned by the first
+        # render: the second one is stored
+        self.get(url)
+        self.get(url)
+
+    def write(self, callback, *args):
+        # Runs the purges scheduled for the commit
+        with self.captureOnCommitCallbacks(execute=True):
+            callback(*args)
+
+    def test_hit(self):
+        url = self.post.get_absolute_url()
+        self.warm(url)
+        with self.assertNumQueries(0):
+            content = self.get(url)
+        self.assertIn(self.post.title, content)
+        # Views are still counted
+        self.assertEqual(counters.post_views.pending(self.post.pk), 3)
+
+    def test_authenticated(self):
+        url = self.post.get_absolute_url()
+        self.warm(url)
+        self.client.force_login(self.reader)
+        self.assertIn(reverse('accounts:logout'), self.get(url))
+
+    def test_post_saved(self):
+        url = self.category.get_absolute_url()
+        self.warm(url)
+        self.post.title = 'Updated title'
+        self.write(self.post.save)
+        self.assertIn('Updated title', self.get(url))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post = create_post(self.author, self.category)
+        self.write(Post.objects.filter(pk=post.pk).delete)
+        self.assertNotIn(post.title, self.get(url))
+
+    def test_post_created(self):
+        url = reverse('blog:tag-post-list', args=[self.tag.slug])
+        self.warm(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            post = create_post(self.author, self.category, [self.tag])
+        self.assertIn(post.title, self.get(url))
+
+    def test_tag_changed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = create_tag()
+            self.post.tags.add(tag)
+        url = self.post.get_absolute_url()
+        self.warm(url)
+        tag.name = 'Renamed tag'
+        self.write(tag.save)
+        self.assertIn('Renamed tag', self.get(url))
+
+        self.write(tag.delete)
+        self.assertNotIn('Renamed tag', self.get(url))
+
+    def test_category_changed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(title='Sports', slug='sports')
+        url = reverse('core:index')
+        self.warm(url)
+        category.title = 'Football'
+        self.write(category.save)
+        self.assertIn('Football', self.get(url))
+
+        self.write(category.delete)
+        self.assertNotIn('Football', self.get(url))
@@ -1,9 +1,10 @@
 from django.urls import path
 
-from core.views import IndexView
+from core.views import IndexView, MetricsView
 
 app_name = 'core'
 
 urlpatterns = [
-    path('', view=IndexView.as_view(), name='index')
+    path('', view=IndexView.as_view(), name='index'),
+    path('metrics/', view=MetricsView.as_view(), name='metrics')
 ]
@@ -1,6 +1,14 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.views import View
 from django.views.generic.list import ListView
+from django.views.static import serve
 
 from blog.models import Post
+from blog.trending import TRENDING_POSTS, get_trending_posts
+from core import metrics, page_cache, storage
 
 
 class IndexView(ListView):
@@ -9,12 +17,55 @@ class IndexView(ListView):
     template_name = 'core/index.html'
 
     def get_queryset(self):
-        return Post.published.order_by('-views')[:3]
+        return get_trending_posts(3)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        recent_posts = Post.published.order_by('-created_at')[:3]
+        recent_posts = list(Post.published.order_by('-created_at')[:3])
+
+        # Any post published or unpublished may change the recent posts
+        page_cache.add_tags(self.request, 'posts', f'widget:{TRENDING_POSTS}')
+        page_cache.add_post_tags(self.request, context['top_posts'])
+        page_cache.add_post_tags(self.request, recent_posts)
 
         context['recent_posts'] = recent_posts
         return context
+
+
+class MetricsView(View):
+    '''
+    Request metrics of this process in the Prometheus text format, for
+    scrapers sending `METRICS_TOKEN` as a bearer token (or from
+    `INTERNAL_IPS` when no token is set).
+    '''
+    def get(self, request):
+        if settings.METRICS_TOKEN:
+            allowed = constant_time_compare(
+                request.headers.get('Authorization', ''),
+                f'Bearer {settings.METRICS_TOKEN}'
+            )
+        else:
+            allowed = request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
+        if not allowed:
+            raise Http404
+        return HttpResponse(
+            metrics.registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
+
+
+def serve_media(request, path, document_root=None):
+    '''
+    Serve media files in development, content-addressed ones with
+    far-future cache headers (set the same on the production server).
+    '''
+    response = serve(request, path, document_root=document_root)
+    if storage.is_hashed(path):
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=storage.IMMUTABLE_MAX_AGE,
+            immutable=True
+        )
+    return response
@@ -2,6 +2,7 @@ $(function () {
     // Bookmark Functionality
     $(".btn-bookmark").on("click", function (e) {
         e.preventDefault();
+        const button = $(this);
         const url = $(this).attr("data-url");
 
         $.ajax({
@@ -13,10 +14,36 @@ $(function () {
             },
             success: function (response) {
                 if (response.message == "bookmarked") {
-                    $(".bi").removeClass("bi-bookmark").addClass("bi-bookmark-check-fill");
+                    button.find(".bi").removeClass("bi-bookmark").addClass("bi-bookmark-check-fill");
                 }
                 else if (response.message == "bookmark removed") {
-                    $(".bi").removeClass("bi-bookmark-check-fill").addClass("bi-bookmark");
+                    button.find(".bi").removeClass("bi-bookmark-check-fill").addClass("bi-bookmark");
+                }
+            }
+        })
+    })
+
+    // Like Functionality
+    $(".btn-like").on("click", function (e) {
+        e.preventDefault();
+        const button = $(this);
+        // The wanted state: sending it twice doesn't unlike
+        const liked = button.attr("data-liked") !== "true";
+
+        $.ajax({
+            method: "POST",
+            url: button.attr("data-url"),
+            data: {
+                postPk: button.attr("data-pk"),
+                liked: liked,
+                csrfmiddlewaretoken: $("input[name=csrfmiddlewaretoken]").val()
+            },
+            success: function (response) {
+                button.attr("data-liked", liked ? "true" : "false");
+                button.find(".bi").toggleClass("bi-heart", !liked).toggleClass("bi-heart-fill", liked);
+                if (response.changed) {
+                    const count = $(".likes-count");
+                    count.text(parseInt(count.text(), 10) + (liked ? 1 : -1));
                 }
             }
         })